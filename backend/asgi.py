@@ -2,8 +2,12 @@
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+os.environ.setdefault("SERVER_MODE", "asgi")
+django.setup(set_prefix=False)
 
-application = get_asgi_application()
+from core.asgi import BoundedASGIHandler  # noqa: E402
+
+application = BoundedASGIHandler()
@@ -0,0 +1,13 @@
+"""URL configuration for ``SERVER_MODE=asgi``: ``backend.urls`` with the async API views."""
+
+from django.urls import include, path
+
+from core import async_api
+
+from . import urls
+
+urlpatterns = [
+    path("healthz/", async_api.health),
+    path("api/", include("core.async_urls")),
+    *(pattern for pattern in urls.urlpatterns if str(pattern.pattern) not in {"healthz/", "api/"}),
+]
@@ -4,6 +4,8 @@ from pathlib import Path
 from datetime import timedelta
 import os
 
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -33,18 +35,46 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.ServerTimingMiddleware",
+    "core.middleware.QueryBudgetMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
-    "django.middleware.common.CommonMiddleware",
-    "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
-    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.AdaptiveConcurrencyMiddleware",
+    "core.middleware.ReplicaRoutingMiddleware",
+    "core.middleware.ShardRoutingMiddleware",
+    "core.middleware.PathMiddlewareDispatcher",
 ]
 
-ROOT_URLCONF = "backend.urls"
+# The rest of the stack, by path prefix (first match wins). The API authenticates
+# with JWTs only, so it has no use for sessions, CSRF, messages or X-Frame-Options,
+# and never serves static files.
+MIDDLEWARE_BY_PATH = {
+    "/api/": [
+        "django.middleware.common.CommonMiddleware",
+    ],
+    # Public letter checks (core/verification.py) have no use for them either.
+    "/verify/": [
+        "django.middleware.common.CommonMiddleware",
+    ],
+    "": [
+        "whitenoise.middleware.WhiteNoiseMiddleware",
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.middleware.common.CommonMiddleware",
+        "django.middleware.csrf.CsrfViewMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+        "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    ],
+}
+
+# The admin's middleware checks only look at MIDDLEWARE; core.checks applies them to MIDDLEWARE_BY_PATH.
+SILENCED_SYSTEM_CHECKS = ["admin.E408", "admin.E409", "admin.E410"]
+
+# Set by the entry point (backend/wsgi.py, backend/asgi.py). Under ASGI the hot
+# read endpoints are served by the async views in core/async_api.py.
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+ROOT_URLCONF = "backend.asgi_urls" if SERVER_MODE == "asgi" else "backend.urls"
 
 TEMPLATES = [
     {
@@ -63,20 +93,92 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "backend.wsgi.application"
+# Requests an ASGI worker runs at once; the rest wait on the event loop. Each
+# running request can hold a thread and a database connection, so keep this
+# at or below DB_POOL_SIZE.
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "10"))
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.mysql",
-        "NAME": os.getenv("DB_NAME", ""),
-        "USER": os.getenv("DB_USER", ""),
-        "PASSWORD": os.getenv("DB_PASSWORD", ""),
-        "HOST": os.getenv("DB_HOST", "127.0.0.1"),
-        "PORT": os.getenv("DB_PORT", "3307"),
-        "OPTIONS": {
-            "charset": "utf8mb4",
-        },
+DB_ENGINE = os.getenv("DB_ENGINE", "mysql")
+
+if DB_ENGINE == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / os.getenv("DB_NAME", "db.sqlite3"),
+        }
     }
-}
+else:
+    DATABASES = {
+        "default": {
+            # Pooled PyMySQL connections (core/dbpool.py); DB_POOL=0 opens one per request instead.
+            "ENGINE": "core.backends.mysql" if os.getenv("DB_POOL", "1") == "1" else "django.db.backends.mysql",
+            "NAME": os.getenv("DB_NAME", ""),
+            "USER": os.getenv("DB_USER", ""),
+            "PASSWORD": os.getenv("DB_PASSWORD", ""),
+            "HOST": os.getenv("DB_HOST", "127.0.0.1"),
+            "PORT": os.getenv("DB_PORT", "3307"),
+            "OPTIONS": {
+                "charset": "utf8mb4",
+            },
+            # Must stay 0 with the pool: closing at the end of a request returns the connection.
+            "CONN_MAX_AGE": 0,
+            "POOL": {
+                "SIZE": int(os.getenv("DB_POOL_SIZE", "10")),
+                "MAX_LIFETIME": float(os.getenv("DB_POOL_MAX_LIFETIME", "600")),
+                "TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                "VALIDATE_AFTER": float(os.getenv("DB_POOL_VALIDATE_AFTER", "1")),
+            },
+        }
+    }
+
+# Read replicas (core/routers.py): "host[:port]" entries for MySQL, file names for SQLite.
+DATABASE_REPLICAS = []
+for _index, _replica in enumerate(_csv(os.getenv("DB_REPLICA_HOSTS", "")), start=1):
+    _alias = f"replica{_index}"
+    DATABASES[_alias] = dict(DATABASES["default"])
+    if DB_ENGINE == "sqlite":
+        DATABASES[_alias]["NAME"] = BASE_DIR / _replica
+    else:
+        _host, _, _port = _replica.partition(":")
+        DATABASES[_alias].update(
+            HOST=_host,
+            PORT=_port or DATABASES["default"]["PORT"],
+            OPTIONS={**DATABASES["default"]["OPTIONS"], "connect_timeout": 2},
+        )
+    DATABASE_REPLICAS.append(_alias)
+
+# Region shards for verification requests (core/sharding.py): "region=number:host[:port]" entries
+# for MySQL, "region=number:file" for SQLite. The number fixes the shard's request id range, so it must
+# never change or be reused once the shard holds data. Regions not listed stay on the default database.
+DATABASE_SHARDS = []
+REQUEST_SHARDS = {}
+SHARD_NUMBERS = {}
+for _entry in _csv(os.getenv("DB_SHARDS", "")):
+    _region, _, _location = _entry.partition("=")
+    _number, _, _location = _location.partition(":")
+    _region = _region.strip().lower().replace(" ", "-")
+    _alias = "shard_" + _region.replace("-", "_")
+    if not _number.strip().isdigit() or int(_number) < 1 or not _location.strip():
+        raise ImproperlyConfigured(f"DB_SHARDS entry {_entry!r} must look like 'region=number:location'.")
+    if int(_number) in SHARD_NUMBERS.values():
+        raise ImproperlyConfigured(f"DB_SHARDS gives shard number {int(_number)} to more than one region.")
+    DATABASES[_alias] = dict(DATABASES["default"])
+    if DB_ENGINE == "sqlite":
+        DATABASES[_alias]["NAME"] = BASE_DIR / _location.strip()
+    else:
+        _host, _, _port = _location.strip().partition(":")
+        DATABASES[_alias].update(HOST=_host, PORT=_port or DATABASES["default"]["PORT"])
+    DATABASE_SHARDS.append(_alias)
+    REQUEST_SHARDS[_region] = _alias
+    SHARD_NUMBERS[_alias] = int(_number)
+
+DATABASE_ROUTERS = []
+if DATABASE_SHARDS:
+    DATABASE_ROUTERS.append("core.sharding.ShardRouter")
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS.append("core.routers.PrimaryReplicaRouter")
+REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+REPLICA_HEALTH_INTERVAL = 5
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -108,6 +210,7 @@ MEDIA_ROOT = BASE_DIR / "media"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CORS_ALLOWED_ORIGINS = _csv(os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:5173"))
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key", "x-request-timeout-ms")
 CSRF_TRUSTED_ORIGINS = _csv(os.getenv("CSRF_TRUSTED_ORIGINS", "http://localhost:5173"))
 
 if not DEBUG:
@@ -125,9 +228,203 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    "DEFAULT_THROTTLE_CLASSES": (
+        "core.throttling.UserTokenBucketThrottle",
+        "core.throttling.IPTokenBucketThrottle",
+    ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
+    # Render's proxy appends the caller's address to X-Forwarded-For; earlier entries come from the client.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "1")),
+}
+
+# Token-bucket limits per route name from core/urls.py ("<requests>/<period>").
+# "user" buckets apply to authenticated callers, "ip" buckets to every caller.
+RATE_LIMITS = {
+    "default": {"user": "120/min", "ip": "600/min"},
+    "requests": {"user": "30/min"},
+    "register": {"ip": "10/min"},
+    "token_obtain_pair": {"ip": "20/min"},
+    "officer_token_obtain_pair": {"ip": "20/min"},
+}
+# Adaptive concurrency limits per route class; see core/concurrency.py.
+LOAD_SHEDDING = {
+    "enabled": os.getenv("LOAD_SHEDDING_ENABLED", "1") == "1",
+    "exempt_routes": ["health", "api-root", "metrics"],
+    # Requests that waited longer than this in front of the workers (per the proxy's
+    # request-start header, when it sends one) are shed with a 503; 0 turns it off.
+    "max_queue_ms": int(os.getenv("LOAD_SHEDDING_MAX_QUEUE_MS", "2000")),
+    "request_start_meta": "HTTP_" + os.getenv("REQUEST_START_HEADER", "X-Request-Start").upper().replace("-", "_"),
+    "classes": {
+        "auth": {
+            "routes": ["register", "token_obtain_pair", "officer_token_obtain_pair", "token_refresh"],
+            "initial": 4,
+            "min": 1,
+            "max": 16,
+            "target_ms": 1500,
+        },
+        "list": {
+            "routes": ["requests", "pending-requests", "approved-requests", "citizens", "sync"],
+            "initial": 8,
+            "min": 2,
+            "max": 32,
+            "target_ms": 500,
+        },
+        "pdf": {
+            "routes": ["request-download"],
+            "initial": 2,
+            "min": 1,
+            "max": 8,
+            "target_ms": 2000,
+        },
+        "default": {"initial": 16, "min": 4, "max": 64, "target_ms": 500},
+    },
+}
+
+RATE_LIMIT_SLOTS = int(os.getenv("RATE_LIMIT_SLOTS", "65536"))
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", "")
+
+# Stored responses for Idempotency-Key retries; see core/idempotency.py.
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=60)
+IDEMPOTENCY_WAIT_SECONDS = 5
+
+# Delta sync (core/sync.py): look-back overlap per sync and how long removals are kept.
+SYNC_CLOCK_SKEW = timedelta(seconds=5)
+SYNC_TOMBSTONE_RETENTION = timedelta(days=30)
+# Changed rows per sync response (?limit=, capped at SYNC_MAX_PAGE_SIZE).
+SYNC_PAGE_SIZE = 100
+SYNC_MAX_PAGE_SIZE = 500
+
+# GET /api/events/ (core/events.py). Each worker reads the RequestEvent feed every poll_seconds
+# while it has open streams; streams end after max_seconds and the client reconnects. A stream
+# holds a sync worker for its whole life, so under WSGI it must end within gunicorn's 30s timeout.
+EVENTS = {
+    "poll_seconds": float(os.getenv("EVENTS_POLL_SECONDS", "1")),
+    "ping_seconds": 15,
+    "max_seconds": int(os.getenv("EVENTS_MAX_SECONDS", "300" if SERVER_MODE == "asgi" else "25")),
+    # Streams one WSGI worker may hold open; more get a 503. Each holds a worker thread, so keep the default 0
+    # with sync workers and only raise it, well below --threads, with gthread workers. ASGI has no cap.
+    "wsgi_streams": int(os.getenv("EVENTS_WSGI_STREAMS", "0")),
+    "retry_ms": 3000,
+    "queue_size": 100,
+    "replay_limit": 500,
+    "retention": timedelta(days=7),
+}
+
+# Citizen notifications (core/notifications.py): written to an outbox with each status change and sent by
+# `python manage.py dispatch_notifications`. Rates are token buckets per channel ("<count>/<period>").
+NOTIFICATIONS = {
+    "channels": [channel for channel in os.getenv("NOTIFICATION_CHANNELS", "email,sms").split(",") if channel],
+    "batch_size": 100,
+    "lease_seconds": 300,
+    "max_attempts": 8,
+    "backoff_seconds": 30,
+    "max_backoff_seconds": 3600,
+    "rates": {"email": os.getenv("EMAIL_RATE", "10/s"), "sms": os.getenv("SMS_RATE", "5/s")},
+    "retention": timedelta(days=30),
+}
+EMAIL_HOST = os.getenv("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "25"))
+EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "0") == "1"
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "MTAA Connect <no-reply@mtaa-connect.app>")
+# Without a gateway URL, SMS messages are only logged (core/sms.py).
+SMS_GATEWAY_URL = os.getenv("SMS_GATEWAY_URL", "")
+SMS_GATEWAY_TOKEN = os.getenv("SMS_GATEWAY_TOKEN", "")
+SMS_GATEWAY_TIMEOUT = 10
+SMS_SENDER_ID = os.getenv("SMS_SENDER_ID", "MTAA")
+SMS_BACKEND = os.getenv("SMS_BACKEND", "core.sms.HttpBackend" if SMS_GATEWAY_URL else "core.sms.ConsoleBackend")
+
+# Background jobs (core/jobs.py) in the Job table, run by `python manage.py run_workers`. A job whose worker
+# has not finished it within visibility_timeout seconds is run again; after max_attempts it is left as "dead".
+JOBS = {
+    "poll_seconds": float(os.getenv("JOBS_POLL_SECONDS", "1")),
+    "visibility_timeout": 300,
+    "retry_seconds": 10,
+    "max_retry_seconds": 3600,
+    "retention": timedelta(days=7),
+    "housekeeping_seconds": 60,
+    "recurring_priority": -10,
+    "recurring": {
+        "cleanup.idempotency_keys": timedelta(hours=1),
+        "cleanup.request_events": timedelta(hours=1),
+        "cleanup.sync_tombstones": timedelta(days=1),
+        "cleanup.notifications": timedelta(days=1),
+        "cleanup.letters": timedelta(days=1),
+        "cleanup.jobs": timedelta(days=1),
+        "cleanup.attachments": timedelta(days=1),
+    },
+}
+# Letters pre-rendered after approval (core/letters.py).
+LETTER_CACHE_DIR = os.getenv("LETTER_CACHE_DIR", str(BASE_DIR / ".letters"))
+LETTER_CACHE_RETENTION = timedelta(days=30)
+# Letters carry a token signed with LETTER_SIGNING_KEY, checked at LETTER_VERIFY_URL/verify/<token>
+# (core/verification.py). Keep retired keys in LETTER_SIGNING_FALLBACK_KEYS: printed letters outlive a rotation.
+LETTER_SIGNING_KEY = os.getenv("LETTER_SIGNING_KEY", SECRET_KEY)
+LETTER_SIGNING_FALLBACK_KEYS = _csv(os.getenv("LETTER_SIGNING_FALLBACK_KEYS", ""))
+LETTER_VERIFY_URL = os.getenv("LETTER_VERIFY_URL", "http://localhost:8000").rstrip("/")
+LETTER_VERIFICATION = {
+    "refresh_seconds": float(os.getenv("LETTER_REVOCATION_REFRESH_SECONDS", "5")),
+    "bloom_capacity": 100_000,
+    "bloom_error_rate": 0.001,
+}
+# Supporting documents on requests (core/attachments.py), stored once per content hash. Files no request
+# refers to any more are removed by the cleanup.attachments job once they are older than orphan_grace.
+ATTACHMENTS = {
+    "root": os.getenv("ATTACHMENT_ROOT", str(MEDIA_ROOT / "attachments")),
+    "max_bytes": int(os.getenv("ATTACHMENT_MAX_BYTES", str(10 * 1024 * 1024))),
+    "max_per_request": 10,
+    "thumbnails": os.getenv("ATTACHMENT_THUMBNAILS", "1") == "1",
+    "thumbnail_size": (320, 320),
+    "orphan_grace": timedelta(days=1),
+}
+
+# POST /api/batch/ (core/batch.py).
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+# Server-Timing headers and timing log lines for a sample of requests (core/middleware.py).
+# SERVER_TIMING_DEBUG_SQL=1 also returns the slowest SQL statements, only when DJANGO_DEBUG=1.
+SERVER_TIMING = {
+    "sample_rate": float(os.getenv("SERVER_TIMING_SAMPLE_RATE", "0.01")),
+    "debug_sql": os.getenv("SERVER_TIMING_DEBUG_SQL", "0") == "1",
+}
+
+# Per-view SQL query budgets and N+1 detection (core/querybudget.py): "warn", "raise" or "off".
+QUERY_BUDGET = {
+    "mode": os.getenv("QUERY_BUDGET_MODE", "warn"),
+    "repeat_threshold": 5,
+}
+
+# Prometheus metrics at /metrics (core/metrics.py). Each worker writes its own file under
+# METRICS_DIR (default: <shared state dir>/metrics). Scrapes need METRICS_TOKEN as a bearer token;
+# without one /metrics is only served with DEBUG on. METRICS_PORT makes the notifier and job runner
+# serve /metrics themselves, for when they run on another host than the web service.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FILE_BYTES = 1024 * 1024
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "core.timing": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "core.sms": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
+# /readyz/ dependency probes (core/readiness.py), in seconds.
+READINESS = {
+    "ttl": float(os.getenv("READINESS_TTL", "10")),
+    "max_age": float(os.getenv("READINESS_MAX_AGE", "60")),
+    "min_free_disk_mb": int(os.getenv("READINESS_MIN_FREE_DISK_MB", "100")),
 }
 
 SIMPLE_JWT = {
@@ -142,3 +439,8 @@ SPECTACULAR_SETTINGS = {
     "DESCRIPTION": "API documentation for MTAA Connect backend.",
     "VERSION": "0.1.0",
 }
+# /api/schema/ serves a schema generated once per code version (core/schema.py), cached in this directory by
+# `manage.py cache_schema` at build time. With DEBUG on it is generated live on every request unless
+# OPENAPI_SCHEMA_LIVE=0.
+OPENAPI_SCHEMA_DIR = os.getenv("OPENAPI_SCHEMA_DIR", str(BASE_DIR / ".openapi"))
+OPENAPI_SCHEMA_LIVE = DEBUG and os.getenv("OPENAPI_SCHEMA_LIVE", "1") == "1"
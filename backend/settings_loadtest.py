@@ -0,0 +1,33 @@
+"""
+Settings for ``python manage.py loadtest``: production settings on a local SQLite file.
+
+Rate limits and load shedding are off so that every virtual user's request
+reaches the views; password hashing, middleware and serializers are the ones
+production runs. The database file is rebuilt from a seeded copy before each
+scenario (see ``core/loadtest``).
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, LOAD_SHEDDING, SERVER_TIMING
+
+DATABASES = {
+    "default": {
+        # Adds LOADTEST_DB_LATENCY_MS to every query, standing in for the network round trip to MySQL.
+        "ENGINE": "core.backends.sqlite_latency",
+        "LATENCY_MS": float(os.getenv("LOADTEST_DB_LATENCY_MS", "0")),
+        "NAME": os.getenv("LOADTEST_DB", str(BASE_DIR / "loadtest.sqlite3")),
+        # Concurrent writers wait for the lock instead of failing straight away.
+        "OPTIONS": {"timeout": 30},
+    },
+}
+DATABASE_REPLICAS = []
+DATABASE_SHARDS = []
+REQUEST_SHARDS = {}
+SHARD_NUMBERS = {}
+DATABASE_ROUTERS = []
+
+RATE_LIMITS = {}
+LOAD_SHEDDING = {**LOAD_SHEDDING, "enabled": False}
+SERVER_TIMING = {**SERVER_TIMING, "sample_rate": 0.0}
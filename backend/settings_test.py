@@ -0,0 +1,51 @@
+"""
+Settings for the test suite: local SQLite databases only.
+
+Run with ``python manage.py test --settings=backend.settings_test``. A second
+SQLite database stands in for a read replica and two more for region shards;
+tests that exercise routing enable the routers with ``override_settings``.
+"""
+
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test-default.sqlite3",
+    },
+    "replica1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test-replica1.sqlite3",
+    },
+    "shard_mara": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test-shard-mara.sqlite3",
+    },
+    "shard_mwanza": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test-shard-mwanza.sqlite3",
+    },
+}
+DATABASE_REPLICAS = ["replica1"]
+DATABASE_SHARDS = ["shard_mara", "shard_mwanza"]
+SHARD_NUMBERS = {"shard_mara": 1, "shard_mwanza": 2}
+REQUEST_SHARDS = {}
+DATABASE_ROUTERS = []
+
+SECURE_SSL_REDIRECT = False
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+SHARED_STATE_DIR = tempfile.mkdtemp(prefix="mtaa-connect-test-")
+RATE_LIMITS = {}
+SERVER_TIMING = {"sample_rate": 0.0, "debug_sql": False}
+QUERY_BUDGET = {"mode": "raise", "repeat_threshold": 5}
+# Tests call Broadcaster.poll() themselves rather than starting the feed thread.
+EVENTS = {**EVENTS, "poll_seconds": 0}  # noqa: F405
+SMS_BACKEND = "core.sms.LocmemBackend"
+# Tests call revocations.refresh() themselves rather than starting the refresh thread.
+LETTER_VERIFICATION = {**LETTER_VERIFICATION, "refresh_seconds": 0}  # noqa: F405
+OPENAPI_SCHEMA_DIR = tempfile.mkdtemp(prefix="mtaa-connect-schema-")
+LETTER_CACHE_DIR = tempfile.mkdtemp(prefix="mtaa-connect-letters-")
+ATTACHMENTS = {**ATTACHMENTS, "root": tempfile.mkdtemp(prefix="mtaa-connect-attachments-")}  # noqa: F405
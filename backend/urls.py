@@ -4,19 +4,19 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularRedocView,
-    SpectacularSwaggerView,
-)
+from drf_spectacular.views import SpectacularRedocView, SpectacularSwaggerView
+from core import api as core_api
 from core import views as core_views
 
 urlpatterns = [
     path("", core_views.home),
     path("healthz/", core_views.health),
+    path("readyz/", core_views.readyz),
+    path("metrics", core_views.metrics, name="metrics"),
     path("docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
     path("redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/schema/", core_views.OpenApiSchemaView.as_view(), name="schema"),
+    path("verify/<str:token>", core_api.VerifyLetterView.as_view(), name="verify-letter"),
     path("admin/", admin.site.urls),
     path("api/", include("core.urls")),
 ]
@@ -2,4 +2,6 @@
 set -o errexit
 
 pip install -r requirements.txt
+python manage.py check
 python manage.py collectstatic --noinput
+python manage.py cache_schema
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 
+from . import sharding
 from .models import CitizenProfile, OfficerProfile, User, VerificationRequest
 
 
@@ -44,8 +45,46 @@ class OfficerProfileAdmin(admin.ModelAdmin):
     search_fields = ("user__email", "user__full_name", "phone")
 
 
+class ShardListFilter(admin.SimpleListFilter):
+    """Pick the shard a request listing comes from; the counts are gathered from every shard."""
+
+    title = "shard"
+    parameter_name = "shard"
+
+    def lookups(self, request, model_admin):
+        return [
+            (alias, f"{alias} ({sharding.count_all(VerificationRequest.objects.using(alias))})")
+            for alias in sharding.all_shards()
+        ]
+
+    def value(self):
+        return super().value() or "default"
+
+    def choices(self, changelist):
+        for lookup, title in self.lookup_choices:
+            yield {
+                "selected": self.value() == lookup,
+                "query_string": changelist.get_query_string({self.parameter_name: lookup}),
+                "display": title,
+            }
+
+    def queryset(self, request, queryset):
+        if self.value() in sharding.all_shards():
+            return queryset.using(self.value())
+        return queryset
+
+
 @admin.register(VerificationRequest)
 class VerificationRequestAdmin(admin.ModelAdmin):
     list_display = ("id", "request_type", "citizen", "status", "created_at", "decided_at")
     list_filter = ("status", "request_type", "urgency")
     search_fields = ("citizen__email", "citizen__full_name", "purpose")
+
+    def get_list_filter(self, request):
+        if sharding.enabled():
+            return (ShardListFilter, *self.list_filter)
+        return self.list_filter
+
+    def get_object(self, request, object_id, from_field=None):
+        with sharding.using_shard(sharding.shard_for_pk(object_id) if str(object_id).isdigit() else None):
+            return super().get_object(request, object_id, from_field)
@@ -1,27 +1,96 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.http import HttpResponse
 from rest_framework import generics, permissions, status, serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .models import User, VerificationRequest
+from . import attachments, events, jobs, metrics, notifications, verification
+from .batch import BatchError, parse_batch, run_batch
+from .idempotency import idempotent
+from .letters import cached_letter, render_letter
+from .models import Attachment, RequestEvent, RequestTombstone, User, VerificationRequest
 from .permissions import IsCitizen, IsOfficer, IsOwnerOrOfficer
 from .serializers import (
+    AttachmentSerializer,
     CitizenProfileSerializer,
     OfficerProfileSerializer,
     PasswordChangeSerializer,
     ProfileUpdateSerializer,
     RegisterSerializer,
     UserSerializer,
+    VerificationRequestProjection,
     VerificationRequestSerializer,
 )
+from .sharding import count_all, scatter, shard_for_region, using_shard
+from .sync import InvalidCursor, changes_since, decode_cursor, record_tombstone
+from .timing import span
+
+
+def _csv_param(value: str | None) -> list[str] | None:
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _new_request_shard(request) -> str:
+    """The shard a new request will be saved on, from its not yet validated metadata."""
+    metadata = request.data.get("metadata") if hasattr(request.data, "get") else None
+    return shard_for_region(metadata.get("region") if isinstance(metadata, dict) else None)
+
+
+class SparseRequestFieldsMixin:
+    """
+    ``?fields=`` / ``?exclude=`` for request endpoints.
+
+    Lists are served from a ``values()`` projection; single requests go through
+    the serializer on a queryset trimmed to the requested columns.
+    """
+
+    def get_requested_fields(self) -> list[str] | None:
+        fields = _csv_param(self.request.query_params.get("fields"))
+        exclude = _csv_param(self.request.query_params.get("exclude"))
+        if fields is None and exclude is None:
+            return None
+        known = VerificationRequestSerializer.Meta.fields
+        unknown = (set(fields or ()) | set(exclude or ())) - set(known)
+        if unknown:
+            raise serializers.ValidationError({"fields": f"Unknown field(s): {', '.join(sorted(unknown))}."})
+        return [name for name in known if (fields is None or name in fields) and name not in (exclude or ())]
+
+    def list(self, request, *args, **kwargs):
+        projection = VerificationRequestProjection(self.get_requested_fields())
+        queryset = scatter(projection.project(self.filter_queryset(self.get_queryset())))
+        page = self.paginate_queryset(queryset)
+        with span("serialize"):
+            data = projection.to_representation(page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        fields = self.get_requested_fields()
+        queryset = VerificationRequestProjection(fields).trim(self.filter_queryset(self.get_queryset()))
+        instance = generics.get_object_or_404(queryset, **{self.lookup_field: self.kwargs[self.lookup_field]})
+        self.check_object_permissions(request, instance)
+        with span("serialize"):
+            data = self.get_serializer(instance, fields=fields).data
+        return Response(data)
 
 
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
+    query_budget = 8
 
+    @idempotent
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -29,18 +98,24 @@ class RegisterView(APIView):
         return Response(UserSerializer(user).data, status=status.HTTP_201_CREATED)
 
 
+def citizen_profile_data(profile) -> dict:
+    return {
+        "phone": profile.phone,
+        "gender": profile.gender,
+        "age": profile.age,
+        "address": profile.address,
+        "nida_number": profile.nida_number,
+    }
+
+
 class MeView(APIView):
+    query_budget = 3
+
     def get(self, request):
         user_data = UserSerializer(request.user).data
         profile_data = None
         if request.user.role == User.Role.CITIZEN and hasattr(request.user, "citizen_profile"):
-            profile_data = {
-                "phone": request.user.citizen_profile.phone,
-                "gender": request.user.citizen_profile.gender,
-                "age": request.user.citizen_profile.age,
-                "address": request.user.citizen_profile.address,
-                "nida_number": request.user.citizen_profile.nida_number,
-            }
+            profile_data = citizen_profile_data(request.user.citizen_profile)
         if request.user.role in {User.Role.OFFICER, User.Role.ADMIN} and hasattr(
             request.user, "officer_profile"
         ):
@@ -49,6 +124,8 @@ class MeView(APIView):
 
 
 class ProfileView(APIView):
+    query_budget = {"GET": 3, "PUT": 5}
+
     def get(self, request):
         return MeView().get(request)
 
@@ -111,6 +188,7 @@ class ProfileView(APIView):
 
 class PasswordChangeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
 
     def post(self, request):
         serializer = PasswordChangeSerializer(data=request.data, context={"request": request})
@@ -123,16 +201,19 @@ class PasswordChangeView(APIView):
 
 class OfficerStatsView(APIView):
     permission_classes = [IsOfficer]
+    query_budget = 5
 
     def get(self, request):
         today = timezone.localdate()
-        pending = VerificationRequest.objects.filter(status=VerificationRequest.Status.PENDING).count()
-        approved_today = VerificationRequest.objects.filter(
-            status=VerificationRequest.Status.APPROVED,
-            decided_at__date=today,
-        ).count()
+        pending = count_all(VerificationRequest.objects.filter(status=VerificationRequest.Status.PENDING))
+        approved_today = count_all(
+            VerificationRequest.objects.filter(
+                status=VerificationRequest.Status.APPROVED,
+                decided_at__date=today,
+            )
+        )
         total_citizens = User.objects.filter(role=User.Role.CITIZEN).count()
-        letters_issued = VerificationRequest.objects.filter(status=VerificationRequest.Status.APPROVED).count()
+        letters_issued = count_all(VerificationRequest.objects.filter(status=VerificationRequest.Status.APPROVED))
         return Response(
             {
                 "pending_requests": pending,
@@ -153,23 +234,33 @@ class OfficerTokenSerializer(TokenObtainPairSerializer):
 
 class OfficerTokenObtainPairView(TokenObtainPairView):
     serializer_class = OfficerTokenSerializer
+    query_budget = 3
 
 
-class CitizenRequestListCreate(generics.ListCreateAPIView):
+class CitizenRequestListCreate(SparseRequestFieldsMixin, generics.ListCreateAPIView):
     serializer_class = VerificationRequestSerializer
     permission_classes = [IsCitizen]
+    query_budget = {"GET": 3, "POST": 6}
 
     def get_queryset(self):
         return VerificationRequest.objects.filter(citizen=self.request.user)
 
+    @idempotent(shard=_new_request_shard)
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        serializer.save(citizen=self.request.user)
+        # Manager.create() routes without the instance, so pick the region's shard here.
+        with using_shard(shard_for_region(serializer.validated_data["metadata"].get("region"))):
+            req = serializer.save(citizen=self.request.user)
+        events.record_event(req, RequestEvent.Kind.CREATED)
 
 
-class RequestDetail(generics.RetrieveUpdateAPIView):
+class RequestDetail(SparseRequestFieldsMixin, generics.RetrieveUpdateAPIView):
     serializer_class = VerificationRequestSerializer
     permission_classes = [IsOwnerOrOfficer]
     queryset = VerificationRequest.objects.all()
+    query_budget = {"GET": 2, "PUT": 5, "PATCH": 5}
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -194,10 +285,12 @@ class RequestDetail(generics.RetrieveUpdateAPIView):
 
 class ResubmitRequest(APIView):
     permission_classes = [IsCitizen]
+    query_budget = 8
 
+    @idempotent
     def post(self, request, pk: int):
         try:
-            req = VerificationRequest.objects.get(pk=pk, citizen=request.user)
+            req = VerificationRequest.objects.select_related("citizen__citizen_profile").get(pk=pk, citizen=request.user)
         except VerificationRequest.DoesNotExist:
             return Response({"detail": "Request not found."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -215,221 +308,201 @@ class ResubmitRequest(APIView):
 
         serializer = VerificationRequestSerializer(req, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save(
-            status=VerificationRequest.Status.PENDING,
-            rejection_reason="",
-            decided_by=None,
-            decided_at=None,
-        )
+        with transaction.atomic(using=req._state.db):
+            serializer.save(
+                status=VerificationRequest.Status.PENDING,
+                rejection_reason="",
+                decided_by=None,
+                decided_at=None,
+            )
+            events.record_event(req, RequestEvent.Kind.STATUS_CHANGED)
+            notifications.enqueue(req)
         return Response(serializer.data)
 
 
 class RequestDownloadView(APIView):
     permission_classes = [IsOwnerOrOfficer]
+    query_budget = 4
 
     def get(self, request, pk: int):
         try:
-            req = VerificationRequest.objects.get(pk=pk)
+            req = VerificationRequest.objects.select_related("citizen__citizen_profile").get(pk=pk)
         except VerificationRequest.DoesNotExist:
             return Response({"detail": "Request not found."}, status=status.HTTP_404_NOT_FOUND)
 
         if req.status != VerificationRequest.Status.APPROVED:
             return Response({"detail": "Request is not approved yet."}, status=status.HTTP_400_BAD_REQUEST)
 
-        from io import BytesIO
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.units import cm
-        from reportlab.lib.utils import simpleSplit
-        from reportlab.pdfgen import canvas
-
-        buffer = BytesIO()
-        pdf = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-        margin_x = 2 * cm
-        margin_right = width - 2 * cm
-        content_width = margin_right - margin_x
-
-        def draw_center(y, text, size=11, bold=False):
-            pdf.setFont("Helvetica-Bold" if bold else "Helvetica", size)
-            pdf.drawCentredString(width / 2, y, text)
-
-        def draw_wrapped(text, x, y, max_width, size=10, leading=14):
-            pdf.setFont("Helvetica", size)
-            lines = simpleSplit(text, "Helvetica", size, max_width)
-            for line_text in lines:
-                pdf.drawString(x, y, line_text)
-                y -= leading
-            return y
-
-        def draw_field(y, label, value):
-            pdf.setFont("Helvetica-Bold", 10)
-            pdf.drawString(margin_x, y, f"{label}:")
-            pdf.setFont("Helvetica", 10)
-            pdf.drawString(margin_x + 4.2 * cm, y, value)
-            pdf.setLineWidth(0.3)
-            pdf.line(margin_x + 4.2 * cm, y - 1.5, margin_right, y - 1.5)
-            return y - 0.6 * cm
-
-        meta = req.metadata or {}
-        citizen = req.citizen
-        profile = getattr(citizen, "citizen_profile", None)
+        content = cached_letter(req)
+        if content is None:
+            started = time.perf_counter()
+            with span("pdf"):
+                content = render_letter(req)
+            metrics.observe("mtaa_pdf_render_seconds", time.perf_counter() - started)
 
-        def safe(value, fallback="........................"):
-            if value is None:
-                return fallback
-            if isinstance(value, str):
-                trimmed = value.strip()
-                return trimmed if trimmed else fallback
-            return str(value)
-
-        def title_case(value):
-            text = safe(value, "")
-            return text.title() if text else "........................"
-
-        subject_map = {
-            "residence": "UTAMBULISHO WA MKAZI",
-            "nida": "UTAMBULISHO WA NIDA",
-            "license": "UTAMBULISHO WA LESENI",
-        }
+        filename = f"mtaa-letter-{req.id}.pdf"
+        response = HttpResponse(content, content_type="application/pdf")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
 
-        header_y = height - 2.2 * cm
-        draw_center(header_y, "JAMHURI YA MUUNGANO WA TANZANIA", 12, True)
-        draw_center(header_y - 0.6 * cm, "OFISI YA RAIS", 11, True)
-        draw_center(header_y - 1.2 * cm, "TAWALA ZA MIKOA NA SERIKALI ZA MITAA", 11, True)
-        draw_center(header_y - 1.8 * cm, "HALMASHAURI YA MANISPAA YA MUSOMA", 11, True)
-        pdf.setLineWidth(0.6)
-        pdf.line(margin_x, header_y - 2.3 * cm, margin_right, header_y - 2.3 * cm)
-
-        # Photo placeholder
-        photo_x = margin_x
-        photo_y = height - 8.2 * cm
-        pdf.rect(photo_x, photo_y, 4 * cm, 5 * cm)
-        pdf.setFont("Helvetica", 8)
-        pdf.drawCentredString(photo_x + 2 * cm, photo_y + 2.8 * cm, "BANDIKA")
-        pdf.drawCentredString(photo_x + 2 * cm, photo_y + 2.4 * cm, "PICHA")
-        pdf.drawCentredString(photo_x + 2 * cm, photo_y + 2.0 * cm, "HAPA")
-
-        # Right address block
-        pdf.setFont("Helvetica", 9)
-        right_x = width - 8.8 * cm
-        pdf.drawString(right_x, height - 6.2 * cm, "OFISI YA SERIKALI ZA MTAA,")
-        pdf.drawString(right_x, height - 6.7 * cm, f"MTAA WA {title_case(meta.get('mtaa'))}")
-        pdf.drawString(right_x, height - 7.2 * cm, f"KATA {title_case(meta.get('ward'))}")
-        pdf.drawString(right_x, height - 7.7 * cm, f"WILAYA {title_case(meta.get('district'))}")
-        pdf.drawString(right_x, height - 8.2 * cm, f"MKOA {title_case(meta.get('region'))}")
-        pdf.drawString(right_x, height - 8.8 * cm, f"TAREHE: {safe(meta.get('letter_date'), '___/___/_____')}")
-
-        pdf.setFont("Helvetica-Bold", 10.5)
-        pdf.drawString(
-            margin_x,
-            height - 9.3 * cm,
-            f"KUMBUKUMBU NA: {safe(meta.get('reference_no'), 'SM/SN/KN/____')}",
-        )
-        pdf.setFont("Helvetica", 10)
-        pdf.drawString(
-            margin_x,
-            height - 10.0 * cm,
-            f"KWA: {safe(meta.get('to'), 'Husika / Yeyote Anayehusika')}",
-        )
 
-        pdf.setFont("Helvetica-Bold", 11)
-        pdf.drawCentredString(
-            width / 2,
-            height - 11.2 * cm,
-            f"YAH: {subject_map.get(req.request_type, 'UTAMBULISHO WA MKAZI')}",
-        )
+def _content_length(request) -> int:
+    try:
+        return int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return 0
 
-        body_y = height - 12.4 * cm
-        body_y = draw_wrapped(
-            "Husika na kichwa cha habari tajwa hapo juu.",
-            margin_x,
-            body_y,
-            content_width,
-        )
-        body_y = draw_wrapped(
-            "Naomba kutambulisha na kumthibitisha ya kwamba ndugu:",
-            margin_x,
-            body_y - 2,
-            content_width,
-        )
 
-        name = citizen.full_name
-        dob = safe(meta.get("birth_date"), "___/___/_____")
-        phone = profile.phone if profile else meta.get("phone", "")
-        address = profile.address if profile else meta.get("address", "")
-        ward = title_case(meta.get("ward"))
-        mtaa = title_case(meta.get("mtaa"))
-        region = title_case(meta.get("region"))
-        district = title_case(meta.get("district"))
-        house_no = safe(meta.get("house_no"), "______")
-        occupation = safe(meta.get("occupation"), "______")
-        stay = safe(meta.get("stay_duration"), "______")
-
-        y = body_y - 12
-        y = draw_field(y, "Jina", safe(name, "........................"))
-        y = draw_field(y, "Amezaliwa", dob)
-        y = draw_field(y, "Namba ya simu", phone or "______")
-        y = draw_field(y, "Kazi", occupation)
-        y = draw_field(y, "Anaishi", address or "______")
-        y = draw_field(y, "Mtaa", mtaa)
-        y = draw_field(y, "Kata", ward)
-        y = draw_field(y, "Wilaya", district)
-        y = draw_field(y, "Mkoa", region)
-        y = draw_field(y, "Nyumba No", house_no)
-        y = draw_field(y, "Muda wa Makazi", stay)
-
-        y = draw_wrapped(
-            f"Sababu ya barua: {safe(req.purpose, '______')}",
-            margin_x,
-            y - 4,
-            content_width,
-        )
-        y = draw_wrapped(
-            "Maelezo hayo hapo juu ni sahihi kwa kadri ya taarifa tulizonazo.",
-            margin_x,
-            y - 2,
-            content_width,
-        )
-        y = draw_wrapped(
-            "Hivyo basi naomba apatiwe huduma anayoiomba.",
-            margin_x,
-            y - 2,
-            content_width,
-        )
+class RequestAttachmentList(APIView):
+    permission_classes = [IsOwnerOrOfficer]
+    parser_classes = [MultiPartParser]
+    query_budget = {"GET": 3, "POST": 8}
 
-        pdf.setFont("Helvetica", 10)
-        pdf.drawString(
-            margin_x,
-            y - 12,
-            "Imesainiwa na: ________________________________   Mhuri: ______________",
+    def get(self, request, pk: int):
+        try:
+            req = VerificationRequest.objects.only("id", "citizen_id").get(pk=pk)
+        except VerificationRequest.DoesNotExist:
+            return Response({"detail": "Request not found."}, status=status.HTTP_404_NOT_FOUND)
+        self.check_object_permissions(request, req)
+        return Response(AttachmentSerializer(req.attachments.all(), many=True).data)
+
+    def refusal(self, req: VerificationRequest) -> Response | None:
+        if req.status == VerificationRequest.Status.APPROVED:
+            return Response(
+                {"detail": "Documents can only be attached to pending or rejected requests."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if req.attachments.count() >= settings.ATTACHMENTS["max_per_request"]:
+            return Response(
+                {"detail": f"A request can have at most {settings.ATTACHMENTS['max_per_request']} attachments."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return None
+
+    def post(self, request, pk: int):
+        # Refuse what is plainly too large before reading any of the body.
+        max_bytes = settings.ATTACHMENTS["max_bytes"]
+        if _content_length(request) > max_bytes + attachments.MULTIPART_OVERHEAD:
+            return Response(
+                {"detail": f"Attachments are limited to {max_bytes} bytes."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        try:
+            req = VerificationRequest.objects.only("id", "citizen_id", "status").get(pk=pk, citizen=request.user)
+        except VerificationRequest.DoesNotExist:
+            return Response({"detail": "Request not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Checked before reading the body, and again under the row lock before storing it.
+        refusal = self.refusal(req)
+        if refusal is not None:
+            return refusal
+
+        handler = attachments.AttachmentUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+        upload = request.FILES.get("file")
+        if handler.error is not None:
+            status_code, detail = handler.error
+            return Response({"detail": detail}, status=status_code)
+        if upload is None:
+            return Response(
+                {"detail": 'Send the document as the multipart field "file".'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with transaction.atomic(using=req._state.db):
+            # Concurrent uploads to one request take turns, so they cannot all pass the limit.
+            req = VerificationRequest.objects.using(req._state.db).select_for_update().only(
+                "id", "citizen_id", "status"
+            ).get(pk=req.pk)
+            refusal = self.refusal(req)
+            if refusal is not None:
+                return refusal
+            attachment, created = attachments.attach(req, upload)
+        return Response(
+            AttachmentSerializer(attachment).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
         )
-        pdf.drawString(
-            margin_x,
-            y - 24,
-            "Jina la Afisa: ________________________________   Saini: ______________",
+
+
+class AttachmentMixin:
+    def get_attachment(self, request, pk: int, attachment_id: int) -> Attachment | None:
+        attachment = Attachment.objects.select_related("request").filter(pk=attachment_id, request_id=pk).first()
+        if attachment is not None:
+            self.check_object_permissions(request, attachment.request)
+        return attachment
+
+
+class RequestAttachmentDetail(AttachmentMixin, APIView):
+    permission_classes = [IsOwnerOrOfficer]
+    query_budget = {"GET": 2, "DELETE": 3}
+
+    def get(self, request, pk: int, attachment_id: int):
+        attachment = self.get_attachment(request, pk, attachment_id)
+        if attachment is None:
+            return Response({"detail": "Attachment not found."}, status=status.HTTP_404_NOT_FOUND)
+        response = attachments.serve(
+            request,
+            attachments.blob_path(attachment.sha256),
+            attachment.content_type,
+            attachment.sha256,
+            attachment.filename,
         )
+        if response is None:
+            return Response({"detail": "Attachment file is missing."}, status=status.HTTP_404_NOT_FOUND)
+        return response
 
-        pdf.showPage()
-        pdf.save()
-        buffer.seek(0)
+    def delete(self, request, pk: int, attachment_id: int):
+        attachment = self.get_attachment(request, pk, attachment_id)
+        if attachment is None:
+            return Response({"detail": "Attachment not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        filename = f"mtaa-letter-{req.id}.pdf"
-        response = HttpResponse(buffer.getvalue(), content_type="application/pdf")
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        if request.user.id != attachment.request.citizen_id:
+            return Response(
+                {"detail": "Only the request owner can remove attachments."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        if attachment.request.status == VerificationRequest.Status.APPROVED:
+            return Response(
+                {"detail": "Attachments of approved requests cannot be removed."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # The stored file may be shared; the cleanup.attachments job removes it once nothing refers to it.
+        attachment.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RequestAttachmentThumbnail(AttachmentMixin, APIView):
+    permission_classes = [IsOwnerOrOfficer]
+    query_budget = 2
+
+    def get(self, request, pk: int, attachment_id: int):
+        attachment = self.get_attachment(request, pk, attachment_id)
+        if attachment is None or not attachment.thumbnail:
+            return Response({"detail": "Thumbnail not found."}, status=status.HTTP_404_NOT_FOUND)
+        response = attachments.serve(
+            request, attachments.thumbnail_path(attachment.sha256), "image/jpeg", f"{attachment.sha256}-thumbnail"
+        )
+        if response is None:
+            return Response({"detail": "Thumbnail not found."}, status=status.HTTP_404_NOT_FOUND)
         return response
 
 
-class PendingRequestList(generics.ListAPIView):
+class PendingRequestList(SparseRequestFieldsMixin, generics.ListAPIView):
     serializer_class = VerificationRequestSerializer
     permission_classes = [IsOfficer]
+    query_budget = 3
 
     def get_queryset(self):
         return VerificationRequest.objects.filter(status=VerificationRequest.Status.PENDING)
 
 
-class ApprovedRequestList(generics.ListAPIView):
+class ApprovedRequestList(SparseRequestFieldsMixin, generics.ListAPIView):
     serializer_class = VerificationRequestSerializer
     permission_classes = [IsOfficer]
+    query_budget = 3
 
     def get_queryset(self):
         return VerificationRequest.objects.filter(status=VerificationRequest.Status.APPROVED)
@@ -437,27 +510,44 @@ class ApprovedRequestList(generics.ListAPIView):
 
 class ApproveRequest(APIView):
     permission_classes = [IsOfficer]
+    query_budget = 10
 
+    @idempotent
     def post(self, request, pk: int):
         try:
-            req = VerificationRequest.objects.get(pk=pk)
+            req = VerificationRequest.objects.select_related("citizen__citizen_profile").get(pk=pk)
         except VerificationRequest.DoesNotExist:
             return Response({"detail": "Request not found."}, status=status.HTTP_404_NOT_FOUND)
 
+        left_queue = req.status == VerificationRequest.Status.PENDING
+        changed = req.status != VerificationRequest.Status.APPROVED
         req.status = VerificationRequest.Status.APPROVED
         req.rejection_reason = ""
         req.decided_by = request.user
         req.decided_at = timezone.now()
-        req.save(update_fields=["status", "rejection_reason", "decided_by", "decided_at", "updated_at"])
+        with transaction.atomic(using=req._state.db):
+            req.save(update_fields=["status", "rejection_reason", "decided_by", "decided_at", "updated_at"])
+            if left_queue:
+                record_tombstone(req, RequestTombstone.Reason.LEFT_QUEUE)
+            if changed:
+                events.record_event(req, RequestEvent.Kind.STATUS_CHANGED)
+                notifications.enqueue(req)
+                # The queue lives on default: on a shard, a job queued now could run before the approval commits.
+                transaction.on_commit(
+                    lambda: jobs.enqueue("letters.prerender", request_id=req.pk), using=req._state.db
+                )
+        metrics.inc("mtaa_decisions_total", (("decision", "approved"), ("request_type", req.request_type)))
         return Response(VerificationRequestSerializer(req).data)
 
 
 class RejectRequest(APIView):
     permission_classes = [IsOfficer]
+    query_budget = 9
 
+    @idempotent
     def post(self, request, pk: int):
         try:
-            req = VerificationRequest.objects.get(pk=pk)
+            req = VerificationRequest.objects.select_related("citizen__citizen_profile").get(pk=pk)
         except VerificationRequest.DoesNotExist:
             return Response({"detail": "Request not found."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -465,37 +555,160 @@ class RejectRequest(APIView):
         if not reason:
             reason = "No reason provided."
 
+        left_queue = req.status == VerificationRequest.Status.PENDING
+        changed = req.status != VerificationRequest.Status.REJECTED
+        issued = verification.decision_time(req) if req.status == VerificationRequest.Status.APPROVED else None
         req.status = VerificationRequest.Status.REJECTED
         req.rejection_reason = reason
         req.decided_by = request.user
         req.decided_at = timezone.now()
-        req.save(update_fields=["status", "rejection_reason", "decided_by", "decided_at", "updated_at"])
+        with transaction.atomic(using=req._state.db):
+            req.save(update_fields=["status", "rejection_reason", "decided_by", "decided_at", "updated_at"])
+            if left_queue:
+                record_tombstone(req, RequestTombstone.Reason.LEFT_QUEUE)
+            if issued is not None:
+                verification.revoke(req.pk, issued, using=req._state.db)
+            if changed:
+                events.record_event(req, RequestEvent.Kind.STATUS_CHANGED)
+                notifications.enqueue(req)
+        metrics.inc("mtaa_decisions_total", (("decision", "rejected"), ("request_type", req.request_type)))
         return Response(VerificationRequestSerializer(req).data)
 
 
 class ReopenRequest(APIView):
     permission_classes = [IsOfficer]
+    query_budget = 6
 
     def post(self, request, pk: int):
         try:
-            req = VerificationRequest.objects.get(pk=pk)
+            req = VerificationRequest.objects.select_related("citizen__citizen_profile").get(pk=pk)
         except VerificationRequest.DoesNotExist:
             return Response({"detail": "Request not found."}, status=status.HTTP_404_NOT_FOUND)
 
         if req.status == VerificationRequest.Status.PENDING:
             return Response({"detail": "Request is already pending."}, status=status.HTTP_400_BAD_REQUEST)
 
+        issued = verification.decision_time(req) if req.status == VerificationRequest.Status.APPROVED else None
         req.status = VerificationRequest.Status.PENDING
         req.rejection_reason = ""
         req.decided_by = None
         req.decided_at = None
-        req.save(update_fields=["status", "rejection_reason", "decided_by", "decided_at", "updated_at"])
+        with transaction.atomic(using=req._state.db):
+            req.save(update_fields=["status", "rejection_reason", "decided_by", "decided_at", "updated_at"])
+            if issued is not None:
+                verification.revoke(req.pk, issued, using=req._state.db)
+            events.record_event(req, RequestEvent.Kind.STATUS_CHANGED)
+            notifications.enqueue(req)
+        metrics.inc("mtaa_decisions_total", (("decision", "reopened"), ("request_type", req.request_type)))
         return Response(VerificationRequestSerializer(req).data)
 
 
+class SyncView(APIView):
+    query_budget = 3
+
+    def sync_params(self, request):
+        """The ``since`` cursor and page ``limit`` from the query string."""
+        since = request.query_params.get("since")
+        try:
+            since = decode_cursor(since) if since else None
+        except InvalidCursor:
+            raise ParseError("Invalid sync cursor.")
+        limit = request.query_params.get("limit")
+        try:
+            limit = int(limit) if limit else settings.SYNC_PAGE_SIZE
+        except ValueError:
+            raise ParseError("limit must be a whole number.")
+        return since, max(1, min(limit, settings.SYNC_MAX_PAGE_SIZE))
+
+    def get(self, request):
+        since, limit = self.sync_params(request)
+        delta = changes_since(request.user, since, limit)
+        with span("serialize"):
+            changed = VerificationRequestSerializer(delta["changed"], many=True).data
+        return Response(
+            {
+                "cursor": delta["cursor"],
+                "full": delta["full"],
+                "has_more": delta["has_more"],
+                "changed": changed,
+                "removed": delta["removed"],
+            }
+        )
+
+
+class StreamContentNegotiation(BaseContentNegotiation):
+    """Pick the view's first renderer whatever the client accepts: errors go out as JSON to ``text/event-stream`` clients."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class EventStreamView(APIView):
+    content_negotiation_class = StreamContentNegotiation
+    # The user lookup; replaying missed events happens while streaming.
+    query_budget = 1
+
+    def get(self, request):
+        last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+        content = events.wsgi_streams.hold(events.stream(request.user, events.parse_event_id(last_event_id)))
+        if content is None:
+            # EventSource gives up on a 503 instead of reconnecting; clients fall back to /api/sync/.
+            return Response(
+                {"detail": "Live updates are not available on this server; use /api/sync/."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return events.event_stream_response(content)
+
+
+class VerifyLetterView(APIView):
+    """Public check of the token printed on a letter; answers from the token alone, without the request tables."""
+
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    # A worker's first check loads the revocation filter; a filter hit is confirmed.
+    query_budget = 2
+
+    def get(self, request, token: str):
+        letter = verification.verify(token)
+        if letter is None:
+            metrics.inc("mtaa_letter_verifications_total", (("result", "invalid"),))
+            return Response(
+                {"valid": False, "detail": "This letter was not issued by MTAA Connect."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        revoked = verification.revocations.is_revoked(letter)
+        data = {
+            "valid": not revoked,
+            "revoked": revoked,
+            "request_id": letter.request_id,
+            "request_type": letter.request_type,
+            "request_type_display": VerificationRequest.RequestType(letter.request_type).label,
+            "decided_on": letter.decided_on,
+        }
+        name = request.query_params.get("name")
+        if name:
+            data["name_matches"] = letter.name_matches(name)
+        metrics.inc("mtaa_letter_verifications_total", (("result", "revoked" if revoked else "valid"),))
+        return Response(data)
+
+
+class BatchView(APIView):
+    def post(self, request):
+        try:
+            items = parse_batch(request.data)
+        except BatchError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(run_batch(request, items))
+
+
 class CitizenList(generics.ListAPIView):
     permission_classes = [IsOfficer]
     serializer_class = UserSerializer
+    query_budget = 3
 
     def get_queryset(self):
         return User.objects.filter(role=User.Role.CITIZEN)
@@ -503,6 +716,7 @@ class CitizenList(generics.ListAPIView):
 
 class CitizenDetailView(APIView):
     permission_classes = [IsOfficer]
+    query_budget = 3
 
     def get(self, request, pk: int):
         try:
@@ -7,5 +7,6 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         from .compat import patch_django_context_copy
+        from . import checks, queryhooks, signals, tasks  # noqa: F401
 
         patch_django_context_copy()
@@ -0,0 +1,25 @@
+import asyncio
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+
+class BoundedASGIHandler(ASGIHandler):
+    """
+    ``ASGIHandler`` that serves at most ``ASGI_THREADS`` requests at once.
+
+    Django gives every request its own thread for the sync code it runs
+    (authentication, writes, sync middleware), so without a bound a burst of
+    connections becomes a burst of threads and database connections. Requests
+    over the limit wait here, on the event loop, which costs a coroutine
+    rather than a thread. Only building the response counts: a streaming body,
+    such as ``/api/events/``, is sent from the loop without holding a slot.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.slots = asyncio.Semaphore(settings.ASGI_THREADS)
+
+    async def get_response_async(self, request):
+        async with self.slots:
+            return await super().get_response_async(request)
@@ -0,0 +1,176 @@
+"""
+Async variants of the hot read endpoints, served when ``SERVER_MODE=asgi``.
+
+Each view subclasses its sync counterpart in ``core/api.py`` (permissions,
+query budgets, querysets and schema stay there) and replaces the read handler
+with one written against the async ORM. Authentication, permissions and
+throttling still run through ``sync_to_async``: the JWT user lookup and the
+throttle buckets are sync code. Handlers that stay sync, such as creating a
+request, run on the request's worker thread the same way.
+"""
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.paginator import InvalidPage, Page
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import api, events, views
+from .models import CitizenProfile, OfficerProfile, User, VerificationRequest
+from .serializers import (
+    OfficerProfileSerializer,
+    UserSerializer,
+    VerificationRequestProjection,
+    VerificationRequestSerializer,
+)
+from .sharding import ScatterGather, acount_all, scatter
+from .sync import achanges_since
+from .timing import span
+
+
+async def _fetch(rows, start: int = 0, stop: int | None = None) -> list:
+    if isinstance(rows, ScatterGather):
+        return await rows.aslice(start, stop)
+    return [row async for row in rows[start:stop]]
+
+
+async def paginate(view, rows) -> list | None:
+    """``GenericAPIView.paginate_queryset`` with the count and the page fetched through the async ORM."""
+    pagination = view.paginator
+    if pagination is None:
+        return None
+    request = view.request
+    page_size = pagination.get_page_size(request)
+    if not page_size:
+        return None
+
+    paginator = pagination.django_paginator_class(rows, page_size)
+    paginator.count = await rows.acount()
+    page_number = pagination.get_page_number(request, paginator)
+    try:
+        number = paginator.validate_number(page_number)
+    except InvalidPage as exc:
+        raise NotFound(pagination.invalid_page_message.format(page_number=page_number, message=str(exc)))
+    bottom = (number - 1) * paginator.per_page
+    top = bottom + paginator.per_page
+    if top + paginator.orphans >= paginator.count:
+        top = paginator.count
+
+    pagination.page = Page(await _fetch(rows, bottom, top), number, paginator)
+    if paginator.num_pages > 1 and pagination.template is not None:
+        pagination.display_page_controls = True
+    pagination.request = request
+    return list(pagination.page)
+
+
+class AsyncAPIView(APIView):
+    """``APIView`` whose ``dispatch`` is a coroutine; mix in ahead of a sync view."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if not iscoroutinefunction(handler):
+                handler = sync_to_async(handler)
+
+            response = await handler(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class RequestListMixin:
+    async def get(self, request, *args, **kwargs):
+        projection = VerificationRequestProjection(self.get_requested_fields())
+        rows = scatter(projection.project(self.filter_queryset(self.get_queryset())))
+        page = await paginate(self, rows)
+        with span("serialize"):
+            data = projection.to_representation(page if page is not None else await _fetch(rows))
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+async def health(request):
+    return views.health(request)
+
+
+class MeView(AsyncAPIView, api.MeView):
+    async def get(self, request):
+        user = request.user
+        profile_data = None
+        if user.role == User.Role.CITIZEN:
+            profile = await CitizenProfile.objects.filter(user=user).afirst()
+            if profile is not None:
+                profile_data = api.citizen_profile_data(profile)
+        elif user.role in {User.Role.OFFICER, User.Role.ADMIN}:
+            profile = await OfficerProfile.objects.filter(user=user).afirst()
+            if profile is not None:
+                profile_data = OfficerProfileSerializer(profile).data
+        return Response({"user": UserSerializer(user).data, "profile": profile_data})
+
+
+class CitizenRequestListCreate(RequestListMixin, AsyncAPIView, api.CitizenRequestListCreate):
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+
+class PendingRequestList(RequestListMixin, AsyncAPIView, api.PendingRequestList):
+    pass
+
+
+class ApprovedRequestList(RequestListMixin, AsyncAPIView, api.ApprovedRequestList):
+    pass
+
+
+class OfficerStatsView(AsyncAPIView, api.OfficerStatsView):
+    async def get(self, request):
+        today = timezone.localdate()
+        requests = VerificationRequest.objects
+        return Response(
+            {
+                "pending_requests": await acount_all(requests.filter(status=VerificationRequest.Status.PENDING)),
+                "approved_today": await acount_all(
+                    requests.filter(status=VerificationRequest.Status.APPROVED, decided_at__date=today)
+                ),
+                "total_citizens": await User.objects.filter(role=User.Role.CITIZEN).acount(),
+                "letters_issued": await acount_all(requests.filter(status=VerificationRequest.Status.APPROVED)),
+            }
+        )
+
+
+class SyncView(AsyncAPIView, api.SyncView):
+    async def get(self, request):
+        since, limit = self.sync_params(request)
+        delta = await achanges_since(request.user, since, limit)
+        with span("serialize"):
+            changed = VerificationRequestSerializer(delta["changed"], many=True).data
+        return Response(
+            {
+                "cursor": delta["cursor"],
+                "full": delta["full"],
+                "has_more": delta["has_more"],
+                "changed": changed,
+                "removed": delta["removed"],
+            }
+        )
+
+
+class EventStreamView(AsyncAPIView, api.EventStreamView):
+    async def get(self, request):
+        last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+        return events.event_stream_response(events.astream(request.user, events.parse_event_id(last_event_id)))
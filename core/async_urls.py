@@ -0,0 +1,21 @@
+"""``core.urls`` with the read endpoints served by the async views in ``core/async_api.py``."""
+
+from django.urls import path
+
+from . import async_api, urls
+
+ASYNC_VIEWS = {
+    "health": async_api.health,
+    "me": async_api.MeView.as_view(),
+    "requests": async_api.CitizenRequestListCreate.as_view(),
+    "pending-requests": async_api.PendingRequestList.as_view(),
+    "approved-requests": async_api.ApprovedRequestList.as_view(),
+    "sync": async_api.SyncView.as_view(),
+    "events": async_api.EventStreamView.as_view(),
+    "officer-stats": async_api.OfficerStatsView.as_view(),
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name) if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in urls.urlpatterns
+]
@@ -0,0 +1,289 @@
+"""
+Supporting documents attached to verification requests.
+
+Uploads are parsed by :class:`AttachmentUploadHandler`, which Django's
+multipart parser feeds one chunk at a time: each chunk is hashed and written
+to a temporary file under ``ATTACHMENTS["root"]``, so no upload is ever held
+in memory. The view refuses a ``Content-Length`` over ``max_bytes`` before
+reading the body, the handler stops as soon as the running size passes it,
+and the type is taken from the file's first bytes, never from the client.
+
+A finished file is stored once per content hash (``blobs/<aa>/<sha256>``):
+the same scan uploaded again, to any request, reuses the stored copy, and
+``Attachment`` rows (on their request's shard) refer to it by hash. Stored
+files no row refers to any more are removed by the ``cleanup.attachments``
+job. Downloads carry the hash as a strong ``ETag`` and honour
+``If-None-Match`` and single-range ``Range`` requests, so an interrupted
+download can be resumed. With ``ATTACHMENTS["thumbnails"]`` on, images get a
+JPEG thumbnail from the ``attachments.thumbnail`` job.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, quote_etag
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import jobs
+from .models import Attachment, VerificationRequest
+from .sharding import all_shards
+
+logger = logging.getLogger(__name__)
+
+# Accepted documents, recognised by their first bytes.
+SIGNATURES = {
+    b"%PDF-": "application/pdf",
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+}
+IMAGE_TYPES = {"image/jpeg", "image/png"}
+# Room for the multipart boundaries and part headers around the file itself.
+MULTIPART_OVERHEAD = 16 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _root() -> Path:
+    return Path(settings.ATTACHMENTS["root"])
+
+
+def blob_path(sha256: str) -> Path:
+    return _root() / "blobs" / sha256[:2] / sha256
+
+
+def thumbnail_path(sha256: str) -> Path:
+    return _root() / "thumbnails" / sha256[:2] / f"{sha256}.jpg"
+
+
+def sniff(head: bytes) -> str | None:
+    for signature, content_type in SIGNATURES.items():
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class HashedUpload(UploadedFile):
+    """An upload spooled to a temporary file next to the stored blobs, hashed as it arrives."""
+
+    def __init__(self, name: str):
+        directory = _root() / "tmp"
+        directory.mkdir(parents=True, exist_ok=True)
+        super().__init__(tempfile.NamedTemporaryFile(dir=directory, prefix=".upload-"), name, None, 0, None)
+        self.hash = hashlib.sha256()
+
+    def temporary_file_path(self) -> str:
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # Moved into the blob store.
+            pass
+
+
+class AttachmentUploadHandler(FileUploadHandler):
+    """
+    Takes the multipart field ``file`` as a :class:`HashedUpload`.
+
+    A file that is too large or of an unaccepted type stops the upload at the
+    chunk that shows it; the view reads the reason from ``error``.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.upload = None
+        self.error = None
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        if field_name != "file" or self.upload is not None:
+            raise SkipFile()
+        self.upload = HashedUpload(file_name[:255])
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload is None:
+            return None
+        if start == 0:
+            self.upload.content_type = sniff(raw_data)
+            if self.upload.content_type is None:
+                self._reject(415, "Attach a PDF, JPEG or PNG file.")
+        self.upload.size += len(raw_data)
+        if self.upload.size > settings.ATTACHMENTS["max_bytes"]:
+            self._reject(413, f"Attachments are limited to {settings.ATTACHMENTS['max_bytes']} bytes.")
+        self.upload.hash.update(raw_data)
+        self.upload.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload is None:
+            return None
+        if self.upload.size == 0:
+            self.upload.close()
+            self.upload = None
+            return None
+        self.upload.flush()
+        self.upload.seek(0)
+        return self.upload
+
+    def _reject(self, status_code: int, detail: str):
+        self.error = (status_code, detail)
+        self.upload.close()
+        self.upload = None
+        raise StopUpload(connection_reset=True)
+
+
+def attach(req: VerificationRequest, upload: HashedUpload) -> tuple[Attachment, bool]:
+    """Store ``upload`` (once per content hash) and attach it to ``req``; returns the row and whether it is new."""
+    sha256 = upload.hash.hexdigest()
+    path = blob_path(sha256)
+    try:
+        # Refresh the stored copy's mtime so the orphan sweep leaves it alone until the row exists.
+        os.utime(path)
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(upload.temporary_file_path(), path)
+    attachment, created = Attachment.objects.using(req._state.db).get_or_create(
+        request=req,
+        sha256=sha256,
+        defaults={
+            "filename": upload.name,
+            "content_type": upload.content_type,
+            "size": upload.size,
+            "thumbnail": thumbnail_path(sha256).exists(),
+        },
+    )
+    if created and not attachment.thumbnail and wants_thumbnail(attachment):
+        # The queue lives on default: on a shard, a job queued now could run before the row commits.
+        transaction.on_commit(lambda: jobs.enqueue("attachments.thumbnail", sha256=sha256), using=req._state.db)
+    return attachment, created
+
+
+def wants_thumbnail(attachment: Attachment) -> bool:
+    return settings.ATTACHMENTS["thumbnails"] and attachment.content_type in IMAGE_TYPES
+
+
+def make_thumbnail(sha256: str) -> None:
+    target = thumbnail_path(sha256)
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Read up front so a missing or unreadable file fails the job (and is retried) like any I/O error;
+        # every error while decoding from memory is then about the image itself.
+        content = blob_path(sha256).read_bytes()
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                # Lets JPEG decode at a fraction of full size.
+                image.draft("RGB", settings.ATTACHMENTS["thumbnail_size"])
+                thumbnail = ImageOps.exif_transpose(image)
+                thumbnail.thumbnail(settings.ATTACHMENTS["thumbnail_size"])
+                thumbnail = thumbnail.convert("RGB")
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as exc:
+            # Unrecognised, truncated or hostile image data will not decode on a retry either.
+            logger.warning("No thumbnail for attachment %s: %s", sha256, exc)
+            return
+        fd, temporary = tempfile.mkstemp(dir=target.parent, prefix=".thumbnail-")
+        with os.fdopen(fd, "wb") as handle:
+            thumbnail.save(handle, "JPEG", quality=80)
+        os.replace(temporary, target)
+    for alias in all_shards():
+        Attachment.objects.using(alias).filter(sha256=sha256).update(thumbnail=True)
+
+
+def purge_orphans() -> int:
+    """Remove stored files and thumbnails no attachment refers to, and abandoned temporary uploads."""
+    cutoff = time.time() - settings.ATTACHMENTS["orphan_grace"].total_seconds()
+    referenced = set()
+    for alias in all_shards():
+        referenced.update(Attachment.objects.using(alias).values_list("sha256", flat=True).distinct())
+    root = _root()
+    candidates = [
+        *((path, path.name) for path in root.glob("blobs/*/*")),
+        *((path, path.stem) for path in root.glob("thumbnails/*/*.jpg")),
+        *((path, None) for path in root.glob("tmp/.upload-*")),
+    ]
+    deleted = 0
+    for path, sha256 in candidates:
+        try:
+            if sha256 not in referenced and path.stat().st_mtime < cutoff:
+                path.unlink()
+                deleted += 1
+        except FileNotFoundError:
+            pass
+    return deleted
+
+
+def _byte_range(header: str | None, size: int):
+    """``(start, end)`` of a single satisfiable range, ``None`` to send the whole file, ``False`` when unsatisfiable."""
+    match = RANGE_RE.match(header.strip()) if header else None
+    # Multiple ranges, other units and malformed headers get the whole file.
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), size - 1 if not last else min(int(last), size - 1)
+        if last and int(last) < start:
+            return None
+    else:
+        start, end = max(size - int(last), 0), size - 1
+        if int(last) == 0:
+            return False
+    return (start, end) if start < size else False
+
+
+def _read(handle, length: int):
+    with handle:
+        while length > 0:
+            chunk = handle.read(min(length, 64 * 1024))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, path: Path, content_type: str, etag: str, filename: str | None = None) -> HttpResponse | None:
+    """Send ``path`` with its ``etag``, answering conditional and range requests; ``None`` if it is missing."""
+    etag = quote_etag(etag)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["ETag"] = etag
+        return not_modified
+    try:
+        handle = path.open("rb")
+    except FileNotFoundError:
+        return None
+    size = os.fstat(handle.fileno()).st_size
+    if_range = request.headers.get("If-Range")
+    byte_range = _byte_range(request.headers.get("Range"), size) if if_range in (None, etag) else None
+
+    if byte_range is False:
+        handle.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif byte_range is None:
+        response = FileResponse(handle, content_type=content_type)
+    else:
+        start, end = byte_range
+        handle.seek(start)
+        response = StreamingHttpResponse(_read(handle, end - start + 1), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    # An attachment's content never changes; only who may see it does.
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    if filename:
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+    return response
@@ -0,0 +1,48 @@
+"""
+MySQL (PyMySQL) backend that reuses connections from a per-process pool.
+
+Use with ``CONN_MAX_AGE = 0``: Django still "closes" its connection at the end
+of every request, which now hands it back to the pool (:mod:`core.dbpool`)
+instead of tearing down the TCP/TLS session. Pool limits come from the
+database's ``POOL`` settings.
+"""
+
+from functools import partial
+
+from django.db.backends.mysql import base as mysql
+
+from core.dbpool import PoolTimeout, get_pool
+
+
+def _ping(connection) -> bool:
+    try:
+        connection.ping(reconnect=False)
+    except mysql.Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(mysql.DatabaseWrapper):
+    def _pool(self, conn_params=None):
+        connect = partial(super().get_new_connection, conn_params)
+        return get_pool(self.alias, self.settings_dict.get("POOL", {}), connect, _ping)
+
+    def get_new_connection(self, conn_params):
+        try:
+            return self._pool(conn_params).acquire()
+        except PoolTimeout as exc:
+            raise mysql.Database.OperationalError(str(exc)) from exc
+
+    def init_connection_state(self):
+        # Session settings survive a trip through the pool; only new connections need them.
+        if getattr(self.connection, "_session_initialised", False):
+            return
+        super().init_connection_state()
+        self.connection._session_initialised = True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Connections left mid-transaction or after an unrecovered error are not reused.
+        discard = self.in_atomic_block or self.errors_occurred or not self.autocommit
+        self._pool().release(self.connection, discard=discard)
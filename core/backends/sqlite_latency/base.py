@@ -0,0 +1,24 @@
+"""
+SQLite backend that waits ``LATENCY_MS`` before every statement.
+
+Load tests run against a local SQLite file, which answers in microseconds;
+production queries cross the network to MySQL. The wait stands in for that
+round trip (it releases the GIL, like waiting on a socket), so servers are
+compared on how they overlap I/O and not only on CPU.
+"""
+
+import time
+
+from django.db.backends.sqlite3 import base as sqlite3
+
+
+class DatabaseWrapper(sqlite3.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = self.settings_dict.get("LATENCY_MS", 0) / 1000
+        if self.latency:
+            self.execute_wrappers.append(self._round_trip)
+
+    def _round_trip(self, execute, sql, params, many, context):
+        time.sleep(self.latency)
+        return execute(sql, params, many, context)
@@ -0,0 +1,68 @@
+"""
+The notifier and job runner as child processes of the gunicorn master.
+
+With ``BACKGROUND_PROCESSES=1`` (``gunicorn.conf.py``) the master starts
+``dispatch_notifications`` and ``run_workers`` once the app is loaded,
+restarts either if it exits and stops both when gunicorn shuts down. One
+service then does everything on one host, so prerendered letters, thumbnails,
+uploads and metrics files are on the filesystem every process reads. The
+commands run as fresh interpreters rather than forks of the master, which may
+have started threads.
+"""
+
+import logging
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANAGE = Path(__file__).resolve().parent.parent / "manage.py"
+COMMANDS = (
+    (sys.executable, str(MANAGE), "dispatch_notifications"),
+    (sys.executable, str(MANAGE), "run_workers"),
+)
+
+
+class Supervisor:
+    def __init__(self, commands=COMMANDS, interval: float = 5.0):
+        self.commands = [tuple(command) for command in commands]
+        self.interval = interval
+        self.processes = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _spawn(self, command) -> None:
+        self.processes[command] = subprocess.Popen(command)
+
+    def start(self) -> None:
+        with self._lock:
+            for command in self.commands:
+                self._spawn(command)
+        threading.Thread(target=self._watch, name="background-supervisor", daemon=True).start()
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(self.interval):
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                for command, process in list(self.processes.items()):
+                    if process.poll() is not None:
+                        logger.warning("%s exited with status %s; restarting it.", command[-1], process.returncode)
+                        self._spawn(command)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """SIGTERM every process (``run_workers`` lets running jobs finish) and kill any still running after ``timeout``."""
+        with self._lock:
+            self._stopping.set()
+            processes = list(self.processes.values())
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
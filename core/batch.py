@@ -0,0 +1,174 @@
+"""
+Run several API calls from one ``POST /api/batch/`` round trip.
+
+Sub-requests are dispatched in-process straight to the resolved views with
+the batch caller's already-authenticated user, so JWT validation and the user
+lookup happen once. Each still takes a load-shedding slot for its own route
+(see :class:`core.middleware.AdaptiveConcurrencyMiddleware`). Runs of
+consecutive read-only (GET/HEAD) sub-requests are executed concurrently on up
+to ``BATCH_MAX_WORKERS`` threads; anything that writes runs alone, in order,
+on the request thread.
+
+Concurrent reads run in a copy of the batch request's context, so the query
+hooks (metrics, query budget, Server-Timing) and the replica and shard state
+follow them into the pool. Django connections belong to one thread, though:
+each pool thread opens its own and closes it when done (with the pooled MySQL
+backend, that takes one from the worker's pool and hands it back).
+"""
+
+import contextvars
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve, reverse
+
+from .concurrency import get_limiter
+from .sharding import shard_for_route, using_shard
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = {"GET", "HEAD"}
+ALLOWED_METHODS = SAFE_METHODS | {"POST", "PUT", "PATCH", "DELETE"}
+# Headers from the batch call that must not leak into every sub-request.
+DROPPED_HEADERS = {"HTTP_AUTHORIZATION", "HTTP_IDEMPOTENCY_KEY", "CONTENT_TYPE", "CONTENT_LENGTH"}
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_batch(payload) -> list[dict]:
+    items = payload.get("requests") if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise BatchError("Expected a non-empty list of requests.")
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        raise BatchError(f"A batch may contain at most {settings.BATCH_MAX_REQUESTS} requests.")
+
+    batch_path = reverse("batch")
+    parsed = []
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            raise BatchError(f"Request {position} must be an object with a 'path'.")
+        method = str(item.get("method", "GET")).upper()
+        path = item["path"]
+        if method not in ALLOWED_METHODS:
+            raise BatchError(f"Request {position} uses unsupported method {method}.")
+        if not path.startswith("/api/") or urlsplit(path).path == batch_path:
+            raise BatchError(f"Request {position} must target an /api/ endpoint other than the batch endpoint.")
+        headers = item.get("headers") or {}
+        if not isinstance(headers, dict):
+            raise BatchError(f"Request {position} has invalid headers.")
+        parsed.append({"method": method, "path": path, "body": item.get("body"), "headers": headers})
+    return parsed
+
+
+def _build_request(parent, item: dict) -> WSGIRequest:
+    url = urlsplit(item["path"])
+    body = b"" if item["body"] is None else json.dumps(item["body"]).encode()
+    environ = {
+        key: value
+        for key, value in parent.META.items()
+        if isinstance(value, str) and key.isupper() and key not in DROPPED_HEADERS
+    }
+    for name, value in item["headers"].items():
+        key = "HTTP_" + str(name).upper().replace("-", "_")
+        if key != "HTTP_AUTHORIZATION":
+            environ[key] = str(value)
+    environ.update(
+        {
+            "REQUEST_METHOD": item["method"],
+            "PATH_INFO": url.path,
+            "SCRIPT_NAME": "",
+            "QUERY_STRING": url.query,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": BytesIO(body),
+            "wsgi.url_scheme": parent.scheme,
+        }
+    )
+    sub_request = WSGIRequest(environ)
+    # DRF uses these instead of running the authentication classes again.
+    sub_request._force_auth_user = parent.user
+    sub_request._force_auth_token = parent.auth
+    return sub_request
+
+
+def _admit(limiter, route: str | None):
+    """The route class slot taken for a sub-request, ``None`` when it is not shed, ``False`` when it is full."""
+    shedding = settings.LOAD_SHEDDING
+    if not shedding.get("enabled", True) or route is None or route in shedding.get("exempt_routes", ()):
+        return None
+    position = limiter.class_for_route(route)
+    return position if limiter.acquire(position) else False
+
+
+def _dispatch(parent, item: dict) -> dict:
+    sub_request = _build_request(parent, item)
+    try:
+        match = resolve(sub_request.path_info)
+    except Resolver404:
+        return {"status": 404, "headers": {}, "body": {"detail": "Not found."}}
+    sub_request.resolver_match = match
+
+    limiter = get_limiter()
+    position = _admit(limiter, match.url_name)
+    if position is False:
+        busy = {"detail": "Server is busy, please retry shortly."}
+        return {"status": 503, "headers": {"Retry-After": "1"}, "body": busy}
+    started = time.monotonic()
+    failed = True
+    try:
+        with using_shard(shard_for_route(match)):
+            response = match.func(sub_request, *match.args, **match.kwargs)
+            if hasattr(response, "render"):
+                response.render()
+        failed = response.status_code >= 500
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed", item["method"], item["path"])
+        return {"status": 500, "headers": {}, "body": {"detail": "Internal server error."}}
+    finally:
+        if position is not None:
+            limiter.release(position, time.monotonic() - started, failed)
+
+    headers = dict(response.items())
+    body = None
+    if headers.get("Content-Type", "").startswith("application/json") and not response.streaming:
+        body = json.loads(response.content or b"null")
+    return {"status": response.status_code, "headers": headers, "body": body}
+
+
+def _dispatch_in_thread(parent, item: dict) -> dict:
+    try:
+        return _dispatch(parent, item)
+    finally:
+        connections.close_all()
+
+
+def run_batch(parent, items: list[dict]) -> list[dict]:
+    results = []
+    position = 0
+    workers = settings.BATCH_MAX_WORKERS
+    while position < len(items):
+        end = position
+        while end < len(items) and items[end]["method"] in SAFE_METHODS:
+            end += 1
+        reads = items[position:end]
+        if len(reads) > 1 and workers > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(reads))) as executor:
+                # One context copy per item: a context can only be entered by one thread at a time.
+                futures = [
+                    executor.submit(contextvars.copy_context().run, _dispatch_in_thread, parent, item) for item in reads
+                ]
+                results.extend(future.result() for future in futures)
+            position = end
+        else:
+            results.append(_dispatch(parent, items[position]))
+            position += 1
+    return results
@@ -0,0 +1,118 @@
+"""
+In-process benchmarks for hot code paths, run with ``python manage.py benchmark``.
+
+Each benchmark module registers functions with :func:`benchmark`; a function
+returns a list of result dicts as produced by :func:`measure`. Benchmarks that
+need rows run against a throwaway test database, never the configured one.
+Results can be saved as a baseline and later runs checked against it with
+:func:`compare`.
+"""
+
+import statistics
+import time
+import tracemalloc
+
+BENCHMARK_MODULES = [
+    "core.benchmarks.dbpool",
+    "core.benchmarks.jobs",
+    "core.benchmarks.letters",
+    "core.benchmarks.metrics",
+    "core.benchmarks.middleware",
+    "core.benchmarks.permissions",
+    "core.benchmarks.serializers",
+    "core.benchmarks.throttling",
+    "core.benchmarks.validation",
+    "core.benchmarks.verification",
+]
+
+REGISTRY = {}
+
+# A median slower than the baseline by less than this many baseline standard deviations is noise.
+NOISE_STDEVS = 3
+# Peak allocation growth below this is ignored, whatever the relative change.
+MIN_ALLOC_REGRESSION_KIB = 16
+
+
+class BenchmarkSkipped(Exception):
+    """Raised by a benchmark that cannot run in this environment."""
+
+
+def benchmark(name: str, needs_db: bool = False):
+    def decorator(func):
+        func.needs_db = needs_db
+        REGISTRY[name] = func
+        return func
+
+    return decorator
+
+
+def peak_allocation(func) -> int:
+    """Peak bytes allocated while ``func()`` runs once, as traced by ``tracemalloc``."""
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        return max(tracemalloc.get_traced_memory()[1] - before, 0)
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+def measure(label: str, func, number: int = 10000, repeat: int = 5, items: int = 1) -> dict:
+    """
+    Time ``func()`` ``number`` times per round and report per-call microseconds.
+
+    ``items`` is the number of rows or objects one call processes; it turns
+    the timing into ``items_per_sec``. Allocations are measured in a separate
+    call because tracing slows down everything it traces.
+    """
+    func()
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - start) / number * 1e6)
+    median = statistics.median(rounds)
+    stdev = statistics.stdev(rounds) if repeat > 1 else 0.0
+    return {
+        "name": label,
+        "best_us": min(rounds),
+        "median_us": median,
+        "stdev_us": stdev,
+        "rsd_pct": stdev / statistics.mean(rounds) * 100,
+        "ops_per_sec": 1e6 / median,
+        "items_per_sec": items * 1e6 / median,
+        "peak_alloc_kib": peak_allocation(func) / 1024,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Regressions of ``results`` against ``baseline``, both ``{benchmark: [result, ...]}``.
+
+    A result regresses when its median is more than ``threshold`` slower than
+    the baseline's and outside the baseline's noise, or when its peak
+    allocation grows by more than ``threshold``. Results missing from the
+    baseline are not compared.
+    """
+    regressions = []
+    for name, name_results in results.items():
+        before_by_label = {result["name"]: result for result in baseline.get(name, [])}
+        for result in name_results:
+            before = before_by_label.get(result["name"])
+            if before is None:
+                continue
+            label = f"{name}: {result['name']}"
+            slower = result["median_us"] - before["median_us"]
+            if slower > before["median_us"] * threshold and slower > before["stdev_us"] * NOISE_STDEVS:
+                regressions.append(f"{label} {before['median_us']:.2f} -> {result['median_us']:.2f} us/op")
+            grown = result["peak_alloc_kib"] - before["peak_alloc_kib"]
+            if grown > before["peak_alloc_kib"] * threshold and grown > MIN_ALLOC_REGRESSION_KIB:
+                regressions.append(
+                    f"{label} peak allocation {before['peak_alloc_kib']:.1f} -> {result['peak_alloc_kib']:.1f} KiB"
+                )
+    return regressions
@@ -0,0 +1,41 @@
+from django.db import connections
+from django.db.utils import load_backend
+
+from core.dbpool import ConnectionPool
+
+from . import BenchmarkSkipped, benchmark, measure
+
+
+class _FakeConnection:
+    def close(self):
+        pass
+
+
+@benchmark("db_pool_overhead")
+def pool_overhead():
+    pool = ConnectionPool(_FakeConnection, lambda connection: True, size=10)
+
+    def checkout():
+        pool.release(pool.acquire())
+
+    return [measure("ConnectionPool.acquire+release", checkout)]
+
+
+@benchmark("db_pool")
+def pooled_vs_direct():
+    """Per-request connection cost against the configured MySQL server: connect, SELECT 1, close."""
+    settings_dict = connections["default"].settings_dict
+    if connections["default"].vendor != "mysql":
+        raise BenchmarkSkipped("needs DB_ENGINE=mysql and a reachable server")
+
+    results = []
+    for label, engine in (("direct connection", "django.db.backends.mysql"), ("pooled connection", "core.backends.mysql")):
+        wrapper = load_backend(engine).DatabaseWrapper({**settings_dict, "ENGINE": engine}, alias=f"bench-{engine}")
+
+        def one_request():
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            wrapper.close()
+
+        results.append(measure(f"request with {label}", one_request, number=200))
+    return results
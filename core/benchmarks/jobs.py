@@ -0,0 +1,81 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.test import override_settings
+
+from core import jobs
+from core.models import Job
+
+from . import BenchmarkSkipped, benchmark, measure
+
+WORKER_JOBS = 2000
+WORKER_PROCESSES = (1, 2, 4)
+NO_RECURRING = {**settings.JOBS, "recurring": {}}
+
+
+@jobs.task("benchmark.noop")
+def noop() -> None:
+    pass
+
+
+def _drain(index: int, results) -> None:
+    with override_settings(JOBS=NO_RECURRING):
+        results.put(jobs.Worker(f"benchmark-{index}").work(burst=True))
+    connections.close_all()
+
+
+@benchmark("jobs", needs_db=True)
+def enqueue_and_claim():
+    """What a request pays to queue a job, and what one worker pays per job on top of the task itself."""
+    Job.objects.all().delete()
+
+    def claim_and_run():
+        jobs.run(jobs.claim("benchmark"))
+
+    with override_settings(JOBS=NO_RECURRING):
+        # The 10k jobs queued here are more than the claims below take.
+        results = [measure("enqueue()", lambda: jobs.enqueue("benchmark.noop"), number=2000)]
+        results.append(measure("claim() + run(), no-op task", claim_and_run, number=500))
+    return results
+
+
+@benchmark("job_workers", needs_db=True)
+def worker_throughput():
+    """No-op jobs per second drained by 1, 2 and 4 ``run_workers`` processes from one backlog."""
+    settings_dict = connections["default"].settings_dict
+    if connections["default"].vendor == "sqlite" and "memory" in str(settings_dict["NAME"]):
+        raise BenchmarkSkipped("worker processes cannot share an in-memory SQLite database; set its TEST NAME")
+
+    results = []
+    context = multiprocessing.get_context("fork")
+    for processes in WORKER_PROCESSES:
+        Job.objects.all().delete()
+        Job.objects.bulk_create([Job(name="benchmark.noop") for _ in range(WORKER_JOBS)])
+        connections.close_all()
+        ran = context.Queue()
+        workers = [context.Process(target=_drain, args=(index, ran)) for index in range(processes)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        total = sum(ran.get() for _ in workers)
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+        if total != WORKER_JOBS or Job.objects.exclude(state=Job.State.DONE, attempts=1).exists():
+            raise RuntimeError(f"{processes} worker(s) ran {total} of {WORKER_JOBS} jobs, or some of them twice")
+        per_job_us = elapsed / WORKER_JOBS * 1e6
+        results.append(
+            {
+                "name": f"{processes} worker process(es), {WORKER_JOBS} jobs",
+                "best_us": per_job_us,
+                "median_us": per_job_us,
+                "stdev_us": 0.0,
+                "rsd_pct": 0.0,
+                "ops_per_sec": 1e6 / per_job_us,
+                "items_per_sec": 1e6 / per_job_us,
+                "peak_alloc_kib": 0.0,
+            }
+        )
+    return results
@@ -0,0 +1,17 @@
+from django.utils import timezone
+
+from core.letters import render_letter
+from core.models import VerificationRequest
+
+from . import benchmark, measure
+from .serializers import create_requests
+
+
+@benchmark("letter", needs_db=True)
+def letter_rendering():
+    create_requests()
+    req = VerificationRequest.objects.select_related("citizen__citizen_profile").first()
+    req.status = VerificationRequest.Status.APPROVED
+    req.decided_at = timezone.now()
+
+    return [measure("render_letter", lambda: render_letter(req), number=20)]
@@ -0,0 +1,15 @@
+from core import metrics
+
+from . import benchmark, measure
+
+ROUTE = (("route", "pending-requests"),)
+STATUS = (("route", "pending-requests"), ("method", "GET"), ("status", "200"))
+
+
+@benchmark("metrics")
+def observation_cost():
+    return [
+        measure("metrics.inc", lambda: metrics.inc("mtaa_http_requests_total", STATUS)),
+        measure("metrics.observe", lambda: metrics.observe("mtaa_http_request_duration_seconds", 0.042, ROUTE)),
+        measure("metrics.render", metrics.render, number=100),
+    ]
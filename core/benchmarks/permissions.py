@@ -0,0 +1,35 @@
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from core.models import User, VerificationRequest
+from core.permissions import IsCitizen, IsOfficer, IsOwnerOrOfficer
+
+from . import benchmark, measure
+
+
+def _request(user: User) -> Request:
+    request = Request(RequestFactory().get("/api/requests/"))
+    request.user = user
+    return request
+
+
+@benchmark("permissions")
+def permission_checks():
+    citizen = User(id=1, email="citizen@example.com", role=User.Role.CITIZEN)
+    officer = User(id=2, email="officer@example.com", role=User.Role.OFFICER)
+    as_citizen, as_officer = _request(citizen), _request(officer)
+    own_request = VerificationRequest(id=1, citizen_id=citizen.id)
+    is_citizen, is_officer, owner_or_officer = IsCitizen(), IsOfficer(), IsOwnerOrOfficer()
+
+    return [
+        measure("IsCitizen.has_permission", lambda: is_citizen.has_permission(as_citizen, None)),
+        measure("IsOfficer.has_permission", lambda: is_officer.has_permission(as_officer, None)),
+        measure(
+            "IsOwnerOrOfficer.has_object_permission, owner",
+            lambda: owner_or_officer.has_object_permission(as_citizen, None, own_request),
+        ),
+        measure(
+            "IsOwnerOrOfficer.has_object_permission, officer",
+            lambda: owner_or_officer.has_object_permission(as_officer, None, own_request),
+        ),
+    ]
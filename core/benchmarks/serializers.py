@@ -0,0 +1,82 @@
+from django.contrib.auth.hashers import make_password
+
+from core.models import CitizenProfile, User, VerificationRequest
+from core.serializers import VerificationRequestProjection, VerificationRequestSerializer
+
+from . import benchmark, measure
+
+ROWS = 1000
+QUEUE_FIELDS = ["id", "request_type", "citizen_name", "urgency", "created_at"]
+METADATA = {
+    "reference_no": "SM/SN/KN/0001",
+    "to": "Yeyote Anayehusika",
+    "ward": "Mwigobero",
+    "mtaa": "Kusaga",
+    "region": "Mara",
+    "district": "Musoma",
+    "house_no": "12",
+    "birth_date": "01/01/1990",
+    "occupation": "Mkulima",
+    "stay_duration": "5 years",
+    "letter_date": "01/02/2026",
+}
+
+
+def create_requests(rows: int = ROWS, citizens: int = 100) -> None:
+    """Populate the benchmark database with ``rows`` pending requests."""
+    if VerificationRequest.objects.count() >= rows:
+        return
+    password = make_password("benchmark-password")
+    users = User.objects.bulk_create(
+        User(email=f"bench{index}@example.com", full_name=f"Citizen {index}", password=password)
+        for index in range(citizens)
+    )
+    CitizenProfile.objects.bulk_create(
+        CitizenProfile(user=user, phone="0700000000", gender="female", age=30, address="Musoma")
+        for user in users
+    )
+    VerificationRequest.objects.bulk_create(
+        VerificationRequest(
+            citizen=users[index % citizens],
+            request_type=VerificationRequest.RequestType.RESIDENCE,
+            purpose="Bank account",
+            additional_info="x" * 200,
+            metadata=METADATA,
+        )
+        for index in range(rows)
+    )
+
+
+@benchmark("serializers", needs_db=True)
+def serializer_throughput():
+    create_requests()
+    queryset = VerificationRequest.objects.all()[:ROWS]
+    joined = VerificationRequest.objects.select_related("citizen__citizen_profile")[:ROWS]
+    full = VerificationRequestProjection()
+    queue = VerificationRequestProjection(QUEUE_FIELDS)
+
+    def values_path(projection):
+        return lambda: projection.to_representation(projection.project(VerificationRequest.objects.all()[:ROWS]))
+
+    options = {"number": 1, "repeat": 5, "items": ROWS}
+    return [
+        measure(
+            "serializer, no select_related (N+1)",
+            lambda: VerificationRequestSerializer(queryset.all(), many=True).data,
+            **options,
+        ),
+        measure(
+            "serializer, select_related",
+            lambda: VerificationRequestSerializer(joined.all(), many=True).data,
+            **options,
+        ),
+        measure(
+            "serializer, trimmed, queue fields",
+            lambda: VerificationRequestSerializer(
+                queue.trim(VerificationRequest.objects.all())[:ROWS], many=True, fields=QUEUE_FIELDS
+            ).data,
+            **options,
+        ),
+        measure("values() projection, all fields", values_path(full), **options),
+        measure("values() projection, queue fields", values_path(queue), **options),
+    ]
@@ -0,0 +1,25 @@
+from django.test import RequestFactory
+from django.urls import resolve
+
+from core.throttling import IPTokenBucketThrottle, TokenBucketStore
+
+from . import benchmark, measure
+
+
+@benchmark("throttle")
+def throttle_overhead():
+    store = TokenBucketStore(slots=65536)
+    keys = [f"user:{index}:requests" for index in range(1000)]
+    counter = iter(range(10**9))
+
+    def consume_one():
+        store.consume(keys[next(counter) % 1000], 1e9, 1e9)
+
+    request = RequestFactory().get("/api/requests/", REMOTE_ADDR="10.0.0.1")
+    request.resolver_match = resolve("/api/requests/")
+    throttle = IPTokenBucketThrottle()
+
+    return [
+        measure("TokenBucketStore.consume", consume_one),
+        measure("IPTokenBucketThrottle.allow_request", lambda: throttle.allow_request(request, None)),
+    ]
@@ -0,0 +1,59 @@
+import itertools
+
+from core.models import VerificationRequest
+from core.serializers import RegisterSerializer, VerificationRequestSerializer
+
+from . import benchmark, measure
+from .serializers import METADATA, create_requests
+
+# What the app sends when a citizen corrects part of a pending request.
+PARTIAL_UPDATE = {"purpose": "Maombi ya kazi", "metadata": {"house_no": "14", "letter_date": "02/02/2026"}}
+
+
+@benchmark("validation", needs_db=True)
+def request_validation():
+    create_requests()
+    instance = VerificationRequest.objects.select_related("citizen").first()
+    serializer = VerificationRequestSerializer(instance, partial=True)
+
+    def partial_update():
+        VerificationRequestSerializer(instance, data=PARTIAL_UPDATE, partial=True).is_valid(raise_exception=True)
+
+    def full_create():
+        data = {"request_type": "residence", "purpose": "Kufungua akaunti ya benki", "metadata": METADATA}
+        VerificationRequestSerializer(data=data).is_valid(raise_exception=True)
+
+    return [
+        measure("validate(), metadata merge", lambda: serializer.validate(dict(PARTIAL_UPDATE))),
+        measure("is_valid(), partial update", partial_update, number=1000),
+        measure("is_valid(), new request", full_create, number=1000),
+    ]
+
+
+@benchmark("register", needs_db=True)
+def registration():
+    emails = (f"register{index}@example.com" for index in itertools.count())
+
+    def payload():
+        return {
+            "full_name": "Asha Mollel",
+            "email": next(emails),
+            "phone": "0712345678",
+            "gender": "female",
+            "age": 29,
+            "address": "Mtaa wa Kusaga, Kata ya Mwigobero",
+            "nida_number": "19900101123450000123",
+            "password": "benchmark-password",
+            "confirm_password": "benchmark-password",
+        }
+
+    def register():
+        serializer = RegisterSerializer(data=payload())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    return [
+        measure("RegisterSerializer.is_valid", lambda: RegisterSerializer(data=payload()).is_valid(), number=1000),
+        # Dominated by password hashing, as it is in production.
+        measure("RegisterSerializer end to end", register, number=5, repeat=3),
+    ]
@@ -0,0 +1,33 @@
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core import verification
+from core.models import User, VerificationRequest
+
+from . import benchmark, measure
+
+
+@benchmark("verification", needs_db=True)
+def letter_verification():
+    """Checking a letter's token: the signature, the revocation lookup and a whole ``/verify/`` request."""
+    req = VerificationRequest(
+        id=1,
+        citizen=User(full_name="Asha Citizen"),
+        request_type=VerificationRequest.RequestType.RESIDENCE,
+        decided_at=timezone.now(),
+    )
+    token = verification.issue(req)
+    letter = verification.verify(token)
+    # Over HTTPS as the proxy reports it: plain HTTP would only measure SECURE_SSL_REDIRECT's 301.
+    client = Client(HTTP_HOST="localhost", HTTP_X_FORWARDED_PROTO="https", secure=True)
+
+    # The per-IP limit would turn most of the requests below into 429s.
+    with override_settings(RATE_LIMITS={}):
+        status = client.get(f"/verify/{token}").status_code
+        if status != 200:
+            raise RuntimeError(f"GET /verify/<token> returned {status}, not 200")
+        return [
+            measure("verify()", lambda: verification.verify(token)),
+            measure("revocation lookup", lambda: verification.revocations.is_revoked(letter)),
+            measure("GET /verify/<token>", lambda: client.get(f"/verify/{token}"), number=1000),
+        ]
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core import checks
+from django.urls import NoReverseMatch, reverse
+from django.utils.module_loading import import_string
+
+DISPATCHER = "core.middleware.PathMiddlewareDispatcher"
+# What the admin's own checks (admin.E408-E410) require of MIDDLEWARE.
+ADMIN_MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+]
+
+
+def _admin_chain() -> list[str]:
+    try:
+        admin_path = reverse("admin:index")
+    except NoReverseMatch:
+        return []
+    for prefix, middleware_paths in settings.MIDDLEWARE_BY_PATH.items():
+        if admin_path.startswith(prefix):
+            return list(middleware_paths)
+    return []
+
+
+@checks.register(checks.Tags.admin)
+def check_admin_middleware(app_configs, **kwargs):
+    """The admin's middleware checks, applied to the chain that serves it."""
+    middleware_paths = list(settings.MIDDLEWARE)
+    if DISPATCHER in middleware_paths:
+        middleware_paths += _admin_chain()
+    middleware_classes = [import_string(path) for path in middleware_paths]
+    errors = []
+    for required in ADMIN_MIDDLEWARE:
+        if not any(issubclass(cls, import_string(required)) for cls in middleware_classes):
+            errors.append(
+                checks.Error(
+                    f"'{required}' must run for admin requests, in MIDDLEWARE or the "
+                    "MIDDLEWARE_BY_PATH chain that serves the admin.",
+                    id="core.E001",
+                )
+            )
+    return errors
+
+
+@checks.register()
+def check_shard_numbers(app_configs, **kwargs):
+    """Every shard needs its own positive number: it fixes the shard's request id range."""
+    numbers = getattr(settings, "SHARD_NUMBERS", {})
+    errors = []
+    for alias in settings.DATABASE_SHARDS:
+        number = numbers.get(alias)
+        if not isinstance(number, int) or number < 1:
+            errors.append(checks.Error(f"Shard '{alias}' has no number in SHARD_NUMBERS.", id="core.E002"))
+        elif list(numbers.values()).count(number) > 1:
+            errors.append(checks.Error(f"Shard number {number} is used by more than one shard.", id="core.E003"))
+    return errors
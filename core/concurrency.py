@@ -0,0 +1,162 @@
+"""
+Adaptive (AIMD) concurrency limits per route class, shared by all workers.
+
+Every route in ``core/urls.py`` belongs to a class from
+``settings.LOAD_SHEDDING["classes"]`` (routes that are not listed fall into
+``"default"``). A class admits a request only while its in-flight count is
+below the current limit. The limit grows by ``1/limit`` after each request
+that finishes under the class's target latency and shrinks by
+``DECREASE_FACTOR`` after one that is slow or fails, so slow PDF renders
+cannot take every worker away from logins and lists.
+
+In-flight counts are also recorded per worker process so the counts of a
+worker killed mid-request (e.g. by gunicorn's timeout) can be reclaimed.
+"""
+
+import os
+import time
+
+from django.conf import settings
+
+from .sharedstate import SharedSlots, pid_alive
+
+MAX_CLASSES = 8
+MAX_WORKERS = 128
+DECREASE_FACTOR = 0.9
+LATENCY_SMOOTHING = 0.2
+REAP_INTERVAL = 5.0
+
+
+class ConcurrencyLimiter:
+    def __init__(self, classes: dict):
+        self.names = list(classes)
+        if "default" not in classes:
+            self.names.append("default")
+        if len(self.names) > MAX_CLASSES:
+            raise ValueError(f"At most {MAX_CLASSES} load-shedding classes are supported.")
+        self.config = [classes.get(name, {}) for name in self.names]
+        self.index = {name: position for position, name in enumerate(self.names)}
+        self.route_classes = {
+            route: self.index[name] for name, options in classes.items() for route in options.get("routes", ())
+        }
+        # in-flight total, current limit, smoothed latency (seconds)
+        self.classes = SharedSlots("concurrency-classes", "<qdd", MAX_CLASSES)
+        # owning pid, in-flight count; index = worker * MAX_CLASSES + class
+        self.workers = SharedSlots("concurrency-workers", "<qq", MAX_WORKERS * MAX_CLASSES)
+        self._pid = None
+        self._worker = None
+        self._next_reap = 0.0
+
+    def class_for_route(self, route: str | None) -> int:
+        return self.route_classes.get(route, self.index["default"])
+
+    def class_name(self, index: int) -> str:
+        return self.names[index]
+
+    def _worker_slot(self) -> int | None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._worker
+        self._pid = pid
+        self._worker = None
+        for worker in range(MAX_WORKERS):
+            index = worker * MAX_CLASSES
+            self.workers.lock(index)
+            try:
+                owner, count = self.workers.read(index)
+                if owner == 0 or (owner != pid and not pid_alive(owner)):
+                    if owner:
+                        self._release_worker(worker)
+                    self.workers.write(index, pid, count if owner == pid else 0)
+                    self._worker = worker
+                    break
+            finally:
+                self.workers.unlock(index)
+        return self._worker
+
+    def _release_worker(self, worker: int) -> None:
+        """Subtract a dead worker's in-flight counts from the class totals."""
+        for position in range(len(self.names)):
+            index = worker * MAX_CLASSES + position
+            self.classes.lock(position)
+            try:
+                _, count = self.workers.read(index)
+                if count:
+                    inflight, limit, latency = self.classes.read(position)
+                    self.classes.write(position, max(0, inflight - count), limit, latency)
+                    self.workers.write(index, 0, 0)
+            finally:
+                self.classes.unlock(position)
+
+    def reap(self) -> None:
+        for worker in range(MAX_WORKERS):
+            index = worker * MAX_CLASSES
+            owner, _ = self.workers.read(index)
+            if owner and owner != self._pid and not pid_alive(owner):
+                self.workers.lock(index)
+                try:
+                    if self.workers.read(index)[0] == owner:
+                        self._release_worker(worker)
+                        self.workers.write(index, 0, 0)
+                finally:
+                    self.workers.unlock(index)
+
+    def acquire(self, position: int) -> bool:
+        worker = self._worker_slot()
+        now = time.monotonic()
+        if now >= self._next_reap:
+            self._next_reap = now + REAP_INTERVAL
+            self.reap()
+
+        config = self.config[position]
+        self.classes.lock(position)
+        try:
+            inflight, limit, latency = self.classes.read(position)
+            if limit <= 0:
+                limit = float(config.get("initial", 8))
+            if inflight >= int(limit):
+                return False
+            self.classes.write(position, inflight + 1, limit, latency)
+            if worker is not None:
+                index = worker * MAX_CLASSES + position
+                _, count = self.workers.read(index)
+                self.workers.write(index, self._pid, count + 1)
+        finally:
+            self.classes.unlock(position)
+        return True
+
+    def release(self, position: int, elapsed: float, failed: bool) -> None:
+        config = self.config[position]
+        target = config.get("target_ms", 500) / 1000
+        self.classes.lock(position)
+        try:
+            inflight, limit, latency = self.classes.read(position)
+            latency = elapsed if latency <= 0 else latency + LATENCY_SMOOTHING * (elapsed - latency)
+            if failed or elapsed > target:
+                limit = max(float(config.get("min", 1)), limit * DECREASE_FACTOR)
+            else:
+                limit = min(float(config.get("max", 64)), limit + 1 / limit)
+            self.classes.write(position, max(0, inflight - 1), limit, latency)
+            if self._worker is not None:
+                index = self._worker * MAX_CLASSES + position
+                _, count = self.workers.read(index)
+                self.workers.write(index, self._pid, max(0, count - 1))
+        finally:
+            self.classes.unlock(position)
+
+    def snapshot(self) -> dict:
+        result = {}
+        for position, name in enumerate(self.names):
+            inflight, limit, latency = self.classes.read(position)
+            result[name] = {"inflight": inflight, "limit": limit, "latency_ms": latency * 1000}
+        return result
+
+
+_limiter = None
+
+
+def get_limiter() -> ConcurrencyLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = ConcurrencyLimiter(settings.LOAD_SHEDDING["classes"])
+    return _limiter
@@ -0,0 +1,155 @@
+"""
+Per-process pools of DB-API connections, used by the ``core.backends.mysql`` engine.
+
+Each database alias gets one bounded pool per worker process. A checkout
+reuses the most recently returned connection, pinging it first unless it was
+returned less than ``VALIDATE_AFTER`` seconds ago; connections older than
+``MAX_LIFETIME`` are closed instead of reused, and so are connections handed
+back after an error. When every connection is in use, callers wait up to
+``TIMEOUT`` seconds for one to be returned.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_POOL = {"SIZE": 10, "MAX_LIFETIME": 600.0, "TIMEOUT": 5.0, "VALIDATE_AFTER": 1.0}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, validate, size=10, max_lifetime=600.0, timeout=5.0, validate_after=1.0):
+        self.connect = connect
+        self.validate = validate
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self._lock = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        # (connection, created at, returned at); the right end is the most recently returned.
+        self._idle = deque()
+        self._created = {}
+        self._checked_out = 0
+        self.stats = dict.fromkeys(("checkouts", "waits", "timeouts", "creates", "discards"), 0)
+
+    def _check_pid(self):
+        if self.pid != os.getpid():
+            # Inherited across a fork: the parent still owns these sockets, so forget them without closing.
+            self._reset()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            self._check_pid()
+            self.stats["checkouts"] += 1
+            if not self._idle and self._checked_out >= self.size:
+                self.stats["waits"] += 1
+                while not self._idle and self._checked_out >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise PoolTimeout(f"No database connection became free within {self.timeout:g}s.")
+                    self._lock.wait(remaining)
+            self._checked_out += 1
+            entry = self._idle.pop() if self._idle else None
+
+        try:
+            connection, created_at = self._checkout(entry)
+        except BaseException:
+            with self._lock:
+                self._checked_out -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._created[id(connection)] = created_at
+        return connection
+
+    def _checkout(self, entry):
+        # Validation and connecting happen outside the lock; the slot is already reserved.
+        if entry is not None:
+            connection, created_at, returned_at = entry
+            now = time.monotonic()
+            if now - created_at < self.max_lifetime and (
+                now - returned_at < self.validate_after or self.validate(connection)
+            ):
+                return connection, created_at
+            self._discard(connection)
+        connection = self.connect()
+        with self._lock:
+            self.stats["creates"] += 1
+        return connection, time.monotonic()
+
+    def release(self, connection, discard: bool = False) -> None:
+        with self._lock:
+            if self.pid != os.getpid():
+                return
+            created_at = self._created.pop(id(connection), None)
+            if created_at is None:
+                # Not checked out from this pool (e.g. released twice).
+                discard = True
+            else:
+                self._checked_out -= 1
+                self._lock.notify()
+            now = time.monotonic()
+            if not discard and now - created_at < self.max_lifetime:
+                self._idle.append((connection, created_at, now))
+                return
+        self._discard(connection)
+
+    def _discard(self, connection) -> None:
+        with self._lock:
+            self.stats["discards"] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_idle(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._check_pid()
+            return {
+                "size": self.size,
+                "in_use": self._checked_out,
+                "idle": len(self._idle),
+                **self.stats,
+            }
+
+
+def get_pool(alias: str, options: dict, connect, validate) -> ConnectionPool:
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                options = {**DEFAULT_POOL, **options}
+                pool = _pools[alias] = ConnectionPool(
+                    connect,
+                    validate,
+                    size=int(options["SIZE"]),
+                    max_lifetime=float(options["MAX_LIFETIME"]),
+                    timeout=float(options["TIMEOUT"]),
+                    validate_after=float(options["VALIDATE_AFTER"]),
+                )
+    return pool
+
+
+def pool_stats() -> dict:
+    """Stats for every pool this worker process has opened, keyed by database alias."""
+    return {alias: pool.snapshot() for alias, pool in sorted(_pools.items())}
@@ -0,0 +1,332 @@
+"""
+Server-sent events for ``GET /api/events/``.
+
+Request transitions (create, resubmit, approve, reject, reopen) call
+:func:`record_event`, which writes a ``RequestEvent`` row (for a request
+on a shard, once the shard's transaction commits) and, once that row
+commits, hands it to this process's :data:`broadcaster`. Events recorded by
+other workers arrive through the change feed: while any stream is open, one
+thread per process reads the rows created since its last look every
+``EVENTS["poll_seconds"]``. Streams never query the database for live
+events; each one reads what its user may see from an in-memory queue.
+
+Event ids are ``RequestEvent`` ids. A client reconnecting with
+``Last-Event-ID`` first gets the events it missed, looking back
+``SYNC_CLOCK_SKEW`` as delta sync does (so an event may arrive twice;
+events are idempotent). If the id is unknown or more than
+``EVENTS["replay_limit"]`` events were missed, it gets a ``reset`` event and
+should reload its lists instead.
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import RequestEvent, User, VerificationRequest
+
+logger = logging.getLogger(__name__)
+
+PING = ": ping\n\n"
+RESET = "event: reset\ndata: {}\n\n"
+
+
+def record_event(req: VerificationRequest, kind: str) -> None:
+    """Record ``kind`` for ``req``; call in the transaction that changes it."""
+    write = partial(_write_event, kind, req.pk, req.citizen_id, req.status)
+    alias = req._state.db or DEFAULT_DB_ALIAS
+    if alias == DEFAULT_DB_ALIAS:
+        write()
+    else:
+        # The feed lives on the default database whichever shard holds the request. Written before the shard
+        # commits, an event would get ahead of the change it announces, or outlive its rollback.
+        transaction.on_commit(write, using=alias)
+
+
+def _write_event(kind: str, request_id: int, citizen_id: int, status: str) -> None:
+    event = RequestEvent.objects.using(DEFAULT_DB_ALIAS).create(
+        kind=kind, request_id=request_id, citizen_id=citizen_id, status=status
+    )
+    transaction.on_commit(lambda: broadcaster.publish([event]), using=DEFAULT_DB_ALIAS)
+
+
+def purge_events() -> int:
+    cutoff = timezone.now() - settings.EVENTS["retention"]
+    deleted, _ = RequestEvent.objects.using(DEFAULT_DB_ALIAS).filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+class StreamSlots:
+    """
+    Caps the streams one WSGI worker holds open at ``EVENTS["wsgi_streams"]``.
+
+    A sync stream ties up a worker thread for its whole life, so without a cap
+    a few open apps would starve the rest of the API.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+
+    def hold(self, content):
+        """``content``, holding a slot until the response is closed; ``None`` when every slot is taken."""
+        with self.lock:
+            if self.open >= settings.EVENTS["wsgi_streams"]:
+                return None
+            self.open += 1
+        return HeldStream(content, self.release)
+
+    def release(self) -> None:
+        with self.lock:
+            self.open -= 1
+
+
+class HeldStream:
+    """A response body that gives its slot back when the server closes the response."""
+
+    def __init__(self, content, release):
+        self.content = content
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def close(self) -> None:
+        release, self.release = self.release, None
+        try:
+            self.content.close()
+        finally:
+            if release is not None:
+                release()
+
+
+wsgi_streams = StreamSlots()
+
+
+def _follows_every_request(user: User) -> bool:
+    # Officers watch the whole queue; citizens only their own requests.
+    return user.role in {User.Role.OFFICER, User.Role.ADMIN}
+
+
+def visible_to(user: User):
+    if _follows_every_request(user):
+        return lambda event: True
+    return lambda event: event.citizen_id == user.pk
+
+
+def encode(event: RequestEvent) -> str:
+    data = json.dumps({"request_id": event.request_id, "status": event.status, "at": event.created_at.isoformat()})
+    return f"id: {event.pk}\nevent: {event.kind}\ndata: {data}\n\n"
+
+
+def parse_event_id(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+class Subscription:
+    """One stream's queue of events, filled by whichever thread publishes them."""
+
+    def __init__(self, user: User):
+        self.accepts = visible_to(user)
+        self.overflowed = False
+        self.events = queue.Queue(settings.EVENTS["queue_size"])
+
+    def offer(self, event: RequestEvent) -> None:
+        if self.accepts(event):
+            self._put(event)
+
+    def _put(self, event: RequestEvent) -> None:
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # A client this far behind reconnects and catches up from the feed.
+            self.overflowed = True
+
+    def get(self, timeout: float) -> RequestEvent | None:
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """A :class:`Subscription` read from the event loop it was created on."""
+
+    def __init__(self, user: User):
+        self.accepts = visible_to(user)
+        self.overflowed = False
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue(settings.EVENTS["queue_size"])
+
+    def offer(self, event: RequestEvent) -> None:
+        if self.accepts(event):
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: RequestEvent) -> None:
+        try:
+            self.events.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> RequestEvent | None:
+        try:
+            return await asyncio.wait_for(self.events.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broadcaster:
+    """Fans events out to this process's open streams, each event once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        # Ids of recent events, so the feed does not repeat what a local commit already published.
+        self.seen = {}
+        self.polled_at = None
+        self.poller = None
+
+    def subscribe(self, subscription: Subscription) -> Subscription:
+        with self.lock:
+            self.subscriptions.add(subscription)
+            if self.polled_at is None:
+                self.polled_at = timezone.now()
+            if settings.EVENTS["poll_seconds"] and self.poller is None:
+                self.poller = threading.Thread(target=self._poll_while_subscribed, name="events-feed", daemon=True)
+                self.poller.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, events) -> None:
+        with self.lock:
+            fresh = [event for event in events if event.pk not in self.seen]
+            self.seen.update((event.pk, event.created_at) for event in fresh)
+            # Workers that never stream never poll, so pruning here keeps ``seen`` bounded there too.
+            self._prune()
+            subscriptions = list(self.subscriptions)
+        for event in fresh:
+            for subscription in subscriptions:
+                try:
+                    subscription.offer(event)
+                except RuntimeError:
+                    # Its event loop has already closed; the stream is on its way out.
+                    pass
+
+    def poll(self) -> None:
+        """Publish the events any worker committed since the last poll."""
+        started = timezone.now()
+        since = (self.polled_at or started) - settings.SYNC_CLOCK_SKEW
+        events = list(RequestEvent.objects.using(DEFAULT_DB_ALIAS).filter(created_at__gte=since).order_by("pk"))
+        self.publish(events)
+        with self.lock:
+            self.polled_at = started
+            self._prune()
+
+    def _prune(self) -> None:
+        # Older ids cannot come back from the next poll's look-back window. Call with the lock held.
+        horizon = (self.polled_at or timezone.now()) - settings.SYNC_CLOCK_SKEW
+        self.seen = {pk: created_at for pk, created_at in self.seen.items() if created_at >= horizon}
+
+    def _poll_while_subscribed(self) -> None:
+        while True:
+            time.sleep(settings.EVENTS["poll_seconds"])
+            with self.lock:
+                if not self.subscriptions:
+                    self.poller = self.polled_at = None
+                    return
+            try:
+                self.poll()
+            except DatabaseError:
+                logger.exception("Reading the request event feed failed.")
+            finally:
+                connections.close_all()
+
+
+broadcaster = Broadcaster()
+
+
+def _missed(user: User, last_event_id: int, anchor):
+    missed = RequestEvent.objects.using(DEFAULT_DB_ALIAS).filter(
+        Q(pk__gt=last_event_id) | Q(created_at__gte=anchor - settings.SYNC_CLOCK_SKEW)
+    )
+    if not _follows_every_request(user):
+        missed = missed.filter(citizen_id=user.pk)
+    return missed.exclude(pk=last_event_id).order_by("pk")[: settings.EVENTS["replay_limit"] + 1]
+
+
+def _anchor(last_event_id: int):
+    return RequestEvent.objects.using(DEFAULT_DB_ALIAS).filter(pk=last_event_id).values_list("created_at", flat=True)
+
+
+def _replay(missed) -> list[str]:
+    if missed is None or len(missed) > settings.EVENTS["replay_limit"]:
+        return [RESET]
+    return [encode(event) for event in missed]
+
+
+def stream(user: User, last_event_id: int | None):
+    """The ``text/event-stream`` body: missed events, then live ones and pings until ``max_seconds``."""
+    subscription = broadcaster.subscribe(Subscription(user))
+    try:
+        yield f"retry: {settings.EVENTS['retry_ms']}\n\n"
+        replayed = set()
+        if last_event_id is not None:
+            anchor = _anchor(last_event_id).first()
+            missed = None if anchor is None else list(_missed(user, last_event_id, anchor))
+            replayed = {event.pk for event in missed or ()}
+            yield from _replay(missed)
+        deadline = time.monotonic() + settings.EVENTS["max_seconds"]
+        while not subscription.overflowed and (remaining := deadline - time.monotonic()) > 0:
+            event = subscription.get(min(settings.EVENTS["ping_seconds"], remaining))
+            if event is None:
+                yield PING
+            elif event.pk not in replayed:
+                yield encode(event)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def astream(user: User, last_event_id: int | None):
+    """:func:`stream` for the ASGI server: waits on the event loop instead of a thread."""
+    subscription = broadcaster.subscribe(AsyncSubscription(user))
+    try:
+        yield f"retry: {settings.EVENTS['retry_ms']}\n\n"
+        replayed = set()
+        if last_event_id is not None:
+            anchor = await _anchor(last_event_id).afirst()
+            missed = None if anchor is None else [event async for event in _missed(user, last_event_id, anchor)]
+            replayed = {event.pk for event in missed or ()}
+            for chunk in _replay(missed):
+                yield chunk
+        deadline = time.monotonic() + settings.EVENTS["max_seconds"]
+        while not subscription.overflowed and (remaining := deadline - time.monotonic()) > 0:
+            event = await subscription.get(min(settings.EVENTS["ping_seconds"], remaining))
+            if event is None:
+                yield PING
+            elif event.pk not in replayed:
+                yield encode(event)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def event_stream_response(content) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(content, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Proxies (nginx, Render's edge) must pass events through as they are written.
+    response["X-Accel-Buffering"] = "no"
+    return response
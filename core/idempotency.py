@@ -0,0 +1,175 @@
+"""
+``Idempotency-Key`` support for POST endpoints that create or decide requests.
+
+The first request with a given key (per user, or per client address for
+anonymous callers) runs normally and its response is stored; retries with the
+same key and body get the stored response back with ``Idempotent-Replayed:
+true`` instead of running the view again. A retry that arrives while the first
+attempt is still running waits up to ``IDEMPOTENCY_WAIT_SECONDS`` for it to
+finish.
+
+Keys live on the database the view writes to (the request's shard for
+decisions), and the view runs in one transaction with the update that stores
+its response, so a worker dying in between leaves neither behind. Every
+response below ``500`` is stored, whether the view returned it or raised it;
+server errors roll the view back and release the key.
+"""
+
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from .models import IdempotencyKey
+from .sharding import all_shards
+
+HEADER = "Idempotency-Key"
+POLL_INTERVAL = 0.1
+
+
+class Superseded(Exception):
+    """The key was taken over as stale while the view ran; its writes must not commit."""
+
+
+def _scope(request) -> str:
+    if request.user and request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    # Told apart the way the IP rate limits tell anonymous callers apart.
+    return f"anon:{BaseThrottle().get_ident(request)}"
+
+
+def _fingerprint(request) -> str:
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    try:
+        digest.update(request.body)
+    except RawPostDataException:
+        digest.update(repr(sorted(request.data.items())).encode())
+    return digest.hexdigest()
+
+
+def _replay(record: IdempotencyKey) -> Response:
+    response = Response(record.response_body, status=record.status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _claim(keys, scope: str, key: str, fingerprint: str):
+    """Return ``(record, None)`` when this call owns the key, else ``(None, response)``."""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic(using=keys.db):
+                record = keys.create(
+                    scope=scope,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=now + settings.IDEMPOTENCY_KEY_TTL,
+                )
+            return record, None
+        except IntegrityError:
+            pass
+
+        record = keys.filter(scope=scope, key=key).first()
+        if record is None:
+            continue
+        stale = (
+            record.state == IdempotencyKey.State.IN_PROGRESS
+            and record.created_at <= now - settings.IDEMPOTENCY_LOCK_TIMEOUT
+        )
+        if record.expires_at <= now or stale:
+            keys.filter(pk=record.pk, state=record.state).delete()
+            continue
+        if record.fingerprint != fingerprint:
+            return None, Response(
+                {"detail": f"{HEADER} was already used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record.state == IdempotencyKey.State.COMPLETED:
+            return None, _replay(record)
+        if time.monotonic() >= deadline:
+            return None, Response(
+                {"detail": f"A request with this {HEADER} is still being processed."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        time.sleep(POLL_INTERVAL)
+
+
+def _complete(keys, record: IdempotencyKey, response) -> None:
+    completed = keys.filter(pk=record.pk, state=IdempotencyKey.State.IN_PROGRESS).update(
+        state=IdempotencyKey.State.COMPLETED,
+        status_code=response.status_code,
+        response_body=response.data,
+    )
+    if not completed:
+        raise Superseded
+
+
+def idempotent(method=None, *, shard=None):
+    """
+    Decorate an ``APIView`` handler so retries carrying the same key are replayed.
+
+    ``shard(request)`` names the database the handler writes to when the
+    router cannot tell before the handler runs.
+    """
+    if method is None:
+        return functools.partial(idempotent, shard=shard)
+
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return method(view, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            return Response({"detail": f"{HEADER} is too long."}, status=status.HTTP_400_BAD_REQUEST)
+
+        keys = IdempotencyKey.objects.using(shard(request) if shard else router.db_for_write(IdempotencyKey))
+        record, response = _claim(keys, _scope(request), key, _fingerprint(request))
+        if response is not None:
+            return response
+
+        try:
+            with transaction.atomic(using=keys.db):
+                response = method(view, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    transaction.set_rollback(True, using=keys.db)
+                else:
+                    _complete(keys, record, response)
+        except Superseded:
+            return Response(
+                {"detail": f"A request with this {HEADER} is still being processed."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except Exception as exc:
+            try:
+                # Rolled back, but a client error is the answer a retry would get too.
+                response = view.handle_exception(exc)
+            except Exception:
+                keys.filter(pk=record.pk).delete()
+                raise
+            if response.status_code < 500:
+                try:
+                    _complete(keys, record, response)
+                except Superseded:
+                    pass
+
+        if response.status_code >= 500:
+            keys.filter(pk=record.pk).delete()
+        return response
+
+    return wrapper
+
+
+def purge_idempotency_keys() -> int:
+    deleted = 0
+    for alias in all_shards():
+        count, _ = IdempotencyKey.objects.using(alias).filter(expires_at__lte=timezone.now()).delete()
+        deleted += count
+    return deleted
@@ -0,0 +1,177 @@
+"""
+Background jobs kept in the ``Job`` table and run by ``python manage.py run_workers``.
+
+Tasks are plain functions registered with :func:`task` (see core/tasks.py)
+and queued with :func:`enqueue`, a single INSERT on ``default``, so it is
+cheap enough for a request thread; inside a transaction on ``default`` the
+job only becomes visible once it commits. Work that follows a change on a
+request shard is queued from ``transaction.on_commit(using=<shard>)``
+instead, so a worker cannot pick it up before the change is visible. Workers take the due job with the highest ``priority`` (then the
+oldest ``run_at``) with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the
+database has it, and confirm the claim with a conditional UPDATE, which is
+what keeps SQLite workers from running a job twice.
+
+Claiming a job pushes its ``run_at`` out by ``visibility_timeout``; once a
+minute the workers put jobs whose claim ran out (their worker died or hung)
+back in the queue. A failed job is retried with exponential backoff; after
+``max_attempts`` it stays in the table as ``dead`` for someone to look at.
+Recurring jobs (``JOBS["recurring"]``) are queued once per period whichever
+worker gets there first, by ``unique_key``.
+"""
+
+import contextlib
+import logging
+import os
+import random
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+State = Job.State
+REGISTRY = {}
+# Due jobs looked at per claim; more than one, so a job taken by another worker is skipped, not waited for.
+CLAIM_CANDIDATES = 5
+
+
+def task(name: str):
+    """Register the decorated function as the task ``name``; it is called with the job's kwargs."""
+
+    def decorator(func):
+        REGISTRY[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(name: str, *, priority: int = 0, delay: timedelta | None = None, unique_key: str | None = None, **kwargs):
+    """Queue task ``name``; with a ``unique_key`` that is already queued (or was run), nothing is added."""
+    job = Job(name=name, kwargs=kwargs, priority=priority, unique_key=unique_key)
+    if delay:
+        job.run_at = timezone.now() + delay
+    if unique_key is None:
+        job.save(using=DEFAULT_DB_ALIAS)
+    else:
+        Job.objects.using(DEFAULT_DB_ALIAS).bulk_create([job], ignore_conflicts=True)
+    return job
+
+
+def schedule_recurring(now=None) -> None:
+    """Queue each recurring job for the current period, unless a worker already did."""
+    now = now or timezone.now()
+    jobs = []
+    for name, every in settings.JOBS["recurring"].items():
+        period = int(now.timestamp() // every.total_seconds())
+        jobs.append(Job(name=name, unique_key=f"{name}@{period}", priority=settings.JOBS["recurring_priority"]))
+    Job.objects.using(DEFAULT_DB_ALIAS).bulk_create(jobs, ignore_conflicts=True)
+
+
+def requeue_expired(now=None) -> None:
+    """Queue running jobs whose visibility timeout ran out again, or bury them after their last attempt."""
+    now = now or timezone.now()
+    expired = Job.objects.using(DEFAULT_DB_ALIAS).filter(state=State.RUNNING, run_at__lte=now)
+    expired.filter(attempts__gte=F("max_attempts")).update(
+        state=State.DEAD, last_error="Visibility timeout expired on the last attempt.", finished_at=now
+    )
+    expired.update(state=State.QUEUED)
+
+
+def claim(worker: str) -> Job | None:
+    """Take the next due job for ``worker`` and return it, or ``None`` when nothing is due."""
+    now = timezone.now()
+    jobs = Job.objects.using(DEFAULT_DB_ALIAS)
+    locking = connections[DEFAULT_DB_ALIAS].features.has_select_for_update_skip_locked
+    with transaction.atomic(using=DEFAULT_DB_ALIAS) if locking else contextlib.nullcontext():
+        due = jobs.filter(state=State.QUEUED, run_at__lte=now).order_by("-priority", "run_at")
+        if locking:
+            due = due.select_for_update(skip_locked=True)
+        for job in due[:CLAIM_CANDIDATES]:
+            lease = now + timedelta(seconds=settings.JOBS["visibility_timeout"])
+            claimed = jobs.filter(pk=job.pk, state=State.QUEUED, run_at=job.run_at).update(
+                state=State.RUNNING, run_at=lease, attempts=F("attempts") + 1, locked_by=worker
+            )
+            if claimed:
+                job.state, job.run_at, job.attempts, job.locked_by = State.RUNNING, lease, job.attempts + 1, worker
+                return job
+    return None
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    config = settings.JOBS
+    delay = min(config["max_retry_seconds"], config["retry_seconds"] * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def run(job: Job) -> bool:
+    """Run a claimed job and record the outcome; returns whether it succeeded."""
+    # Only the worker holding the current claim may record it; a lease that ran out belongs to someone else.
+    mine = Job.objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=job.pk, state=State.RUNNING, locked_by=job.locked_by, attempts=job.attempts
+    )
+    func = REGISTRY.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f"No task is registered as {job.name!r}.")
+        func(**job.kwargs)
+    except Exception as exc:
+        now = timezone.now()
+        error = f"{type(exc).__name__}: {exc}"[:2000]
+        if func is None or job.attempts >= job.max_attempts:
+            logger.exception("Job %s (%s) failed for good after %d attempt(s).", job.pk, job.name, job.attempts)
+            mine.update(state=State.DEAD, last_error=error, finished_at=now)
+        else:
+            logger.warning("Job %s (%s) failed; retrying: %s", job.pk, job.name, error)
+            mine.update(state=State.QUEUED, run_at=now + _retry_delay(job.attempts), last_error=error)
+        return False
+    mine.update(state=State.DONE, last_error="", finished_at=timezone.now())
+    return True
+
+
+def purge_jobs() -> int:
+    cutoff = timezone.now() - settings.JOBS["retention"]
+    deleted, _ = Job.objects.using(DEFAULT_DB_ALIAS).filter(state=State.DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def worker_name(index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+class Worker:
+    """One worker process's loop: housekeeping once a minute, then claim, run, sleep while idle."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stopping = False
+        self.housekept_at = 0.0
+
+    def stop(self, *args) -> None:
+        # Finish the job in hand, then exit.
+        self.stopping = True
+
+    def work(self, burst: bool = False) -> int:
+        """Run jobs until stopped (or, with ``burst``, until none is due); returns how many ran."""
+        ran = 0
+        while not self.stopping:
+            if time.monotonic() - self.housekept_at >= settings.JOBS["housekeeping_seconds"]:
+                requeue_expired()
+                schedule_recurring()
+                self.housekept_at = time.monotonic()
+            job = claim(self.name)
+            if job is not None:
+                run(job)
+                ran += 1
+                continue
+            if burst:
+                break
+            connections.close_all()
+            time.sleep(settings.JOBS["poll_seconds"])
+        return ran
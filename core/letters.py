@@ -0,0 +1,269 @@
+"""
+Rendering of the verification letter PDF served by ``RequestDownloadView``.
+
+Approving a request queues a ``letters.prerender`` job (core/tasks.py) that
+stores the letter under ``LETTER_CACHE_DIR``; downloads serve that copy when
+it is current and render inline otherwise. A copy is keyed by everything the
+letter prints, so editing the request or the citizen's profile, or rotating
+the letter signing key, retires it.
+"""
+
+import hashlib
+import itertools
+import os
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from reportlab.graphics.barcode import qrencoder
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+
+from . import verification
+from .models import VerificationRequest
+
+
+def _draw_qr(pdf, data: str, x: float, y: float, size: float) -> None:
+    qr = qrencoder.QRCode(None, qrencoder.QRErrorCorrectLevel.M)
+    qr.addData(data)
+    qr.make()
+    module = size / qr.getModuleCount()
+    # One filled path of horizontal runs; ReportLab's QR widget draws a shape per run, twice as slowly.
+    path = pdf.beginPath()
+    for row, modules in enumerate(qr.modules):
+        column = 0
+        for dark, run in itertools.groupby(map(bool, modules)):
+            length = len(list(run))
+            if dark:
+                path.rect(x + column * module, y + size - (row + 1) * module, length * module, module)
+            column += length
+    pdf.drawPath(path, stroke=0, fill=1)
+
+
+def render_letter(req: VerificationRequest) -> bytes:
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin_x = 2 * cm
+    margin_right = width - 2 * cm
+    content_width = margin_right - margin_x
+
+    def draw_center(y, text, size=11, bold=False):
+        pdf.setFont("Helvetica-Bold" if bold else "Helvetica", size)
+        pdf.drawCentredString(width / 2, y, text)
+
+    def draw_wrapped(text, x, y, max_width, size=10, leading=14):
+        pdf.setFont("Helvetica", size)
+        lines = simpleSplit(text, "Helvetica", size, max_width)
+        for line_text in lines:
+            pdf.drawString(x, y, line_text)
+            y -= leading
+        return y
+
+    def draw_field(y, label, value):
+        pdf.setFont("Helvetica-Bold", 10)
+        pdf.drawString(margin_x, y, f"{label}:")
+        pdf.setFont("Helvetica", 10)
+        pdf.drawString(margin_x + 4.2 * cm, y, value)
+        pdf.setLineWidth(0.3)
+        pdf.line(margin_x + 4.2 * cm, y - 1.5, margin_right, y - 1.5)
+        return y - 0.6 * cm
+
+    meta = req.metadata or {}
+    citizen = req.citizen
+    profile = getattr(citizen, "citizen_profile", None)
+
+    def safe(value, fallback="........................"):
+        if value is None:
+            return fallback
+        if isinstance(value, str):
+            trimmed = value.strip()
+            return trimmed if trimmed else fallback
+        return str(value)
+
+    def title_case(value):
+        text = safe(value, "")
+        return text.title() if text else "........................"
+
+    subject_map = {
+        "residence": "UTAMBULISHO WA MKAZI",
+        "nida": "UTAMBULISHO WA NIDA",
+        "license": "UTAMBULISHO WA LESENI",
+    }
+
+    header_y = height - 2.2 * cm
+    draw_center(header_y, "JAMHURI YA MUUNGANO WA TANZANIA", 12, True)
+    draw_center(header_y - 0.6 * cm, "OFISI YA RAIS", 11, True)
+    draw_center(header_y - 1.2 * cm, "TAWALA ZA MIKOA NA SERIKALI ZA MITAA", 11, True)
+    draw_center(header_y - 1.8 * cm, "HALMASHAURI YA MANISPAA YA MUSOMA", 11, True)
+    pdf.setLineWidth(0.6)
+    pdf.line(margin_x, header_y - 2.3 * cm, margin_right, header_y - 2.3 * cm)
+
+    # Photo placeholder
+    photo_x = margin_x
+    photo_y = height - 8.2 * cm
+    pdf.rect(photo_x, photo_y, 4 * cm, 5 * cm)
+    pdf.setFont("Helvetica", 8)
+    pdf.drawCentredString(photo_x + 2 * cm, photo_y + 2.8 * cm, "BANDIKA")
+    pdf.drawCentredString(photo_x + 2 * cm, photo_y + 2.4 * cm, "PICHA")
+    pdf.drawCentredString(photo_x + 2 * cm, photo_y + 2.0 * cm, "HAPA")
+
+    # Right address block
+    pdf.setFont("Helvetica", 9)
+    right_x = width - 8.8 * cm
+    pdf.drawString(right_x, height - 6.2 * cm, "OFISI YA SERIKALI ZA MTAA,")
+    pdf.drawString(right_x, height - 6.7 * cm, f"MTAA WA {title_case(meta.get('mtaa'))}")
+    pdf.drawString(right_x, height - 7.2 * cm, f"KATA {title_case(meta.get('ward'))}")
+    pdf.drawString(right_x, height - 7.7 * cm, f"WILAYA {title_case(meta.get('district'))}")
+    pdf.drawString(right_x, height - 8.2 * cm, f"MKOA {title_case(meta.get('region'))}")
+    pdf.drawString(right_x, height - 8.8 * cm, f"TAREHE: {safe(meta.get('letter_date'), '___/___/_____')}")
+
+    pdf.setFont("Helvetica-Bold", 10.5)
+    pdf.drawString(
+        margin_x,
+        height - 9.3 * cm,
+        f"KUMBUKUMBU NA: {safe(meta.get('reference_no'), 'SM/SN/KN/____')}",
+    )
+    pdf.setFont("Helvetica", 10)
+    pdf.drawString(
+        margin_x,
+        height - 10.0 * cm,
+        f"KWA: {safe(meta.get('to'), 'Husika / Yeyote Anayehusika')}",
+    )
+
+    pdf.setFont("Helvetica-Bold", 11)
+    pdf.drawCentredString(
+        width / 2,
+        height - 11.2 * cm,
+        f"YAH: {subject_map.get(req.request_type, 'UTAMBULISHO WA MKAZI')}",
+    )
+
+    body_y = height - 12.4 * cm
+    body_y = draw_wrapped(
+        "Husika na kichwa cha habari tajwa hapo juu.",
+        margin_x,
+        body_y,
+        content_width,
+    )
+    body_y = draw_wrapped(
+        "Naomba kutambulisha na kumthibitisha ya kwamba ndugu:",
+        margin_x,
+        body_y - 2,
+        content_width,
+    )
+
+    name = citizen.full_name
+    dob = safe(meta.get("birth_date"), "___/___/_____")
+    phone = profile.phone if profile else meta.get("phone", "")
+    address = profile.address if profile else meta.get("address", "")
+    ward = title_case(meta.get("ward"))
+    mtaa = title_case(meta.get("mtaa"))
+    region = title_case(meta.get("region"))
+    district = title_case(meta.get("district"))
+    house_no = safe(meta.get("house_no"), "______")
+    occupation = safe(meta.get("occupation"), "______")
+    stay = safe(meta.get("stay_duration"), "______")
+
+    y = body_y - 12
+    y = draw_field(y, "Jina", safe(name, "........................"))
+    y = draw_field(y, "Amezaliwa", dob)
+    y = draw_field(y, "Namba ya simu", phone or "______")
+    y = draw_field(y, "Kazi", occupation)
+    y = draw_field(y, "Anaishi", address or "______")
+    y = draw_field(y, "Mtaa", mtaa)
+    y = draw_field(y, "Kata", ward)
+    y = draw_field(y, "Wilaya", district)
+    y = draw_field(y, "Mkoa", region)
+    y = draw_field(y, "Nyumba No", house_no)
+    y = draw_field(y, "Muda wa Makazi", stay)
+
+    y = draw_wrapped(
+        f"Sababu ya barua: {safe(req.purpose, '______')}",
+        margin_x,
+        y - 4,
+        content_width,
+    )
+    y = draw_wrapped(
+        "Maelezo hayo hapo juu ni sahihi kwa kadri ya taarifa tulizonazo.",
+        margin_x,
+        y - 2,
+        content_width,
+    )
+    y = draw_wrapped(
+        "Hivyo basi naomba apatiwe huduma anayoiomba.",
+        margin_x,
+        y - 2,
+        content_width,
+    )
+
+    pdf.setFont("Helvetica", 10)
+    pdf.drawString(
+        margin_x,
+        y - 12,
+        "Imesainiwa na: ________________________________   Mhuri: ______________",
+    )
+    pdf.drawString(
+        margin_x,
+        y - 24,
+        "Jina la Afisa: ________________________________   Saini: ______________",
+    )
+
+    # Anyone holding the letter can check it at /verify/<token> (core/verification.py).
+    url = verification.verify_url(verification.issue(req))
+    qr_size = 2.8 * cm
+    _draw_qr(pdf, url, margin_right - qr_size, 1.6 * cm, qr_size)
+    pdf.setFont("Helvetica", 7)
+    pdf.drawString(margin_x, 2.3 * cm, "Thibitisha uhalali wa barua hii kwa kuskani QR au kufungua:")
+    pdf.drawString(margin_x, 1.9 * cm, url)
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _cache_path(req: VerificationRequest) -> Path:
+    profile = getattr(req.citizen, "citizen_profile", None)
+    version = "|".join(
+        [
+            req.updated_at.isoformat(),
+            req.citizen.full_name,
+            profile.updated_at.isoformat() if profile else "",
+            # Changes with the signing key and verification URL too.
+            verification.issue(req),
+            settings.LETTER_VERIFY_URL,
+        ]
+    )
+    digest = hashlib.sha256(version.encode()).hexdigest()[:16]
+    return Path(settings.LETTER_CACHE_DIR) / f"{req.pk}-{digest}.pdf"
+
+
+def cached_letter(req: VerificationRequest) -> bytes | None:
+    try:
+        return _cache_path(req).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def prerender(req: VerificationRequest) -> None:
+    path = _cache_path(req)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so a download never reads a half-written file.
+    fd, temporary = tempfile.mkstemp(dir=path.parent, prefix=".letter-")
+    with os.fdopen(fd, "wb") as handle:
+        handle.write(render_letter(req))
+    os.replace(temporary, path)
+
+
+def purge_cached_letters() -> int:
+    directory = Path(settings.LETTER_CACHE_DIR)
+    cutoff = time.time() - settings.LETTER_CACHE_RETENTION.total_seconds()
+    deleted = 0
+    for path in directory.glob("*.pdf") if directory.is_dir() else ():
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            deleted += 1
+    return deleted
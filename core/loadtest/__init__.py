@@ -0,0 +1,217 @@
+"""
+HTTP load tests, run with ``python manage.py loadtest --settings=backend.settings_loadtest``.
+
+A scenario (``core/loadtest/scenarios.py``) is a virtual user: it logs in once
+and then repeats one iteration of a user journey as fast as the server
+answers. :func:`run_scenario` runs a number of virtual users on threads for a
+fixed time against a server and records every response's latency under an
+endpoint label such as ``GET /api/requests/{id}/``; :func:`summarise` turns
+that into throughput and latency percentiles per endpoint, and
+:func:`compare` flags regressions against a saved baseline.
+"""
+
+import http.client
+import json
+import math
+import os
+import platform
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+# A p95 increase smaller than this is noise, whatever the relative change.
+MIN_REGRESSION_MS = 2.0
+# Error rate (share of responses) that may be added before it counts as a regression.
+ERROR_RATE_SLACK = 0.01
+
+
+@dataclass
+class Response:
+    status: int
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+class Recorder:
+    """Collects ``(endpoint, seconds, status)`` samples from every virtual user."""
+
+    def __init__(self):
+        self.recording = False
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, status: int) -> None:
+        if not self.recording:
+            return
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+
+class Client:
+    """One virtual user's keep-alive HTTP connection."""
+
+    def __init__(self, base_url: str, recorder: Recorder):
+        parts = urlsplit(base_url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.recorder = recorder
+        self.token = None
+
+    def request(self, method: str, path: str, endpoint: str, body=None, headers=None) -> Response:
+        request_headers = {
+            "Accept": "application/json",
+            # Production runs behind a TLS-terminating proxy; without this header it redirects to https.
+            "X-Forwarded-Proto": "https",
+        }
+        if self.token:
+            request_headers["Authorization"] = f"Bearer {self.token}"
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            request_headers["Content-Type"] = "application/json"
+        request_headers.update(headers or {})
+
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=payload, headers=request_headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request; status 0 marks a connection failure.
+            self.connection.close()
+            self.recorder.record(endpoint, time.perf_counter() - started, 0)
+            return Response(0, b"")
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status)
+        return Response(response.status, content)
+
+    def get(self, path: str, endpoint: str | None = None, **kwargs) -> Response:
+        return self.request("GET", path, endpoint or f"GET {path}", **kwargs)
+
+    def post(self, path: str, body, endpoint: str | None = None, **kwargs) -> Response:
+        return self.request("POST", path, endpoint or f"POST {path}", body=body, **kwargs)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def run_scenario(scenario_class, base_url: str, users: int, duration: float, warmup: float, options: dict) -> dict:
+    """Run ``users`` virtual users of ``scenario_class`` and summarise what they measured."""
+    recorder = Recorder()
+    ready = threading.Barrier(users + 1)
+    stop = threading.Event()
+    failures = []
+
+    def virtual_user(number: int) -> None:
+        client = Client(base_url, recorder)
+        scenario = scenario_class(client, number, options)
+        try:
+            scenario.setup()
+        except Exception as exc:
+            failures.append(exc)
+            ready.abort()
+            return
+        try:
+            ready.wait()
+        except threading.BrokenBarrierError:
+            return
+        try:
+            while not stop.is_set():
+                scenario.step()
+        except Exception as exc:
+            failures.append(exc)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=virtual_user, args=(number,), daemon=True) for number in range(users)]
+    for thread in threads:
+        thread.start()
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        raise RuntimeError(f"{scenario_class.name}: virtual user setup failed: {failures[0]!r}") from failures[0]
+
+    time.sleep(warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise RuntimeError(f"{scenario_class.name}: a virtual user failed: {failures[0]!r}") from failures[0]
+    return summarise(recorder, elapsed, users)
+
+
+def percentile(ordered: list, share: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def is_error(status: int) -> bool:
+    # Conflicts and validation errors are part of the journeys; failures to serve are not.
+    return status == 0 or status == 429 or status >= 500
+
+
+def summarise(recorder: Recorder, seconds: float, users: int) -> dict:
+    endpoints = {}
+    for endpoint in sorted(recorder.latencies):
+        ordered = sorted(recorder.latencies[endpoint])
+        statuses = recorder.statuses[endpoint]
+        endpoints[endpoint] = {
+            "requests": len(ordered),
+            "rps": round(len(ordered) / seconds, 2),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+            "errors": sum(count for status, count in statuses.items() if is_error(status)),
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        }
+    total = sum(stats["requests"] for stats in endpoints.values())
+    return {
+        "users": users,
+        "seconds": round(seconds, 2),
+        "requests": total,
+        "rps": round(total / seconds, 2),
+        "errors": sum(stats["errors"] for stats in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Regressions of ``results`` against ``baseline`` (both as written by the loadtest command).
+
+    An endpoint regresses when its p95 latency grows by more than ``tolerance``
+    (and at least ``MIN_REGRESSION_MS``), its throughput drops by more than
+    ``tolerance``, or its error rate rises by more than ``ERROR_RATE_SLACK``.
+    Endpoints and scenarios missing from the baseline are not compared.
+    """
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        before_endpoints = baseline.get("scenarios", {}).get(name, {}).get("endpoints", {})
+        for endpoint, now in scenario["endpoints"].items():
+            before = before_endpoints.get(endpoint)
+            if before is None:
+                continue
+            label = f"{name}: {endpoint}"
+            if now["p95_ms"] > before["p95_ms"] * (1 + tolerance) and now["p95_ms"] - before["p95_ms"] >= MIN_REGRESSION_MS:
+                regressions.append(f"{label} p95 {before['p95_ms']:.1f} ms -> {now['p95_ms']:.1f} ms")
+            if now["rps"] < before["rps"] * (1 - tolerance):
+                regressions.append(f"{label} throughput {before['rps']:.1f} -> {now['rps']:.1f} req/s")
+            error_rate = now["errors"] / max(now["requests"], 1)
+            before_rate = before["errors"] / max(before["requests"], 1)
+            if error_rate > before_rate + ERROR_RATE_SLACK:
+                regressions.append(f"{label} errors {before_rate:.1%} -> {error_rate:.1%}")
+    return regressions
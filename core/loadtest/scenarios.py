@@ -0,0 +1,168 @@
+"""
+Load-test scenarios: the journeys that dominate real traffic.
+
+Each scenario logs in as a different seeded account per virtual user
+(``core/seeding.py``) and repeats :meth:`Scenario.step` until the run ends.
+Endpoint labels replace ids with ``{id}`` so every request of a kind is
+reported together.
+"""
+
+import random
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from core import seeding
+
+SCENARIOS = {}
+
+LIST_FIELDS = "id,request_type,citizen_name,urgency,status,created_at"
+# The citizen-entered fields of a request; the rest is set by the server.
+SUBMITTED_FIELDS = ("request_type", "purpose", "additional_info", "metadata", "urgency")
+
+
+def scenario(cls):
+    SCENARIOS[cls.name] = cls
+    return cls
+
+
+class Scenario:
+    name = ""
+    description = ""
+    role = "citizen"
+    users = 8
+
+    def __init__(self, client, number: int, options: dict):
+        self.client = client
+        self.number = number
+        self.options = options
+        self.rng = random.Random(f"{options['seed']}:{self.name}:{number}")
+
+    def account(self) -> str:
+        population = self.options["officers" if self.role == "officer" else "citizens"]
+        return seeding.seed_email(self.role, self.rng.randrange(population))
+
+    def login(self, email: str) -> bool:
+        path = "/api/auth/officer-login/" if self.role == "officer" else "/api/auth/login/"
+        self.client.token = None
+        response = self.client.post(path, {"email": email, "password": self.options["password"]})
+        self.client.token = response.json()["access"] if response.status == 200 else None
+        return self.client.token is not None
+
+    def setup(self) -> None:
+        email = self.account()
+        if not self.login(email):
+            raise RuntimeError(f"Logging in as {email} failed; is the database seeded with --password?")
+
+    def step(self) -> None:
+        raise NotImplementedError
+
+
+@scenario
+class CitizenSubmitAndPoll(Scenario):
+    name = "citizen"
+    description = "A citizen submits a request, polls it and delta-syncs their list."
+    users = 16
+
+    def setup(self):
+        super().setup()
+        self.cursor = None
+        self.build = seeding.build_request([0], [0], 1, datetime.now(dt_timezone.utc))
+        self.submitted = 0
+
+    def step(self):
+        self.client.get(f"/api/requests/?fields={LIST_FIELDS}", "GET /api/requests/")
+        draft = self.build(self.rng, self.submitted)
+        self.submitted += 1
+        response = self.client.post(
+            "/api/requests/",
+            {field: getattr(draft, field) for field in SUBMITTED_FIELDS},
+            headers={"Idempotency-Key": str(uuid.UUID(int=self.rng.getrandbits(128)))},
+        )
+        if response.status == 201:
+            request_id = response.json()["id"]
+            for _ in range(3):
+                self.client.get(f"/api/requests/{request_id}/?fields=id,status,updated_at", "GET /api/requests/{id}/")
+        since = f"?since={self.cursor}" if self.cursor else ""
+        response = self.client.get(f"/api/sync/{since}", "GET /api/sync/")
+        if response.status == 200:
+            self.cursor = response.json()["cursor"]
+
+
+@scenario
+class OfficerTriage(Scenario):
+    name = "officer"
+    description = "An officer works through the pending queue, approving or rejecting requests."
+    role = "officer"
+    users = 4
+
+    def step(self):
+        response = self.client.get(f"/api/requests/pending/?fields={LIST_FIELDS}", "GET /api/requests/pending/")
+        queue = response.json()["results"] if response.status == 200 else []
+        if queue:
+            request_id = self.rng.choice(queue)["id"]
+            self.client.get(f"/api/requests/{request_id}/", "GET /api/requests/{id}/")
+            headers = {"Idempotency-Key": str(uuid.UUID(int=self.rng.getrandbits(128)))}
+            if self.rng.random() < 0.85:
+                self.client.post(
+                    f"/api/requests/{request_id}/approve/", {}, "POST /api/requests/{id}/approve/", headers=headers
+                )
+            else:
+                self.client.post(
+                    f"/api/requests/{request_id}/reject/",
+                    {"reason": self.rng.choice(seeding.REJECTION_REASONS)},
+                    "POST /api/requests/{id}/reject/",
+                    headers=headers,
+                )
+        if self.rng.random() < 0.2:
+            self.client.get("/api/stats/officer/")
+
+
+@scenario
+class MorningLoginStorm(Scenario):
+    name = "login"
+    description = "Citizens log in all at once and load their dashboard."
+    users = 16
+
+    def setup(self):
+        pass
+
+    def step(self):
+        if not self.login(self.account()):
+            return
+        self.client.get("/api/me/")
+        self.client.get(f"/api/requests/?fields={LIST_FIELDS}", "GET /api/requests/")
+
+
+@scenario
+class BulkLetterDownloads(Scenario):
+    name = "downloads"
+    description = "Officers page through approved requests and download every letter."
+    role = "officer"
+    users = 4
+
+    def step(self):
+        page = self.rng.randrange(1, 51)
+        response = self.client.get(f"/api/requests/approved/?fields=id&page={page}", "GET /api/requests/approved/")
+        if response.status != 200:
+            return
+        for row in response.json()["results"]:
+            self.client.get(f"/api/requests/{row['id']}/download/", "GET /api/requests/{id}/download/")
+
+
+@scenario
+class DashboardPolling(Scenario):
+    name = "dashboard"
+    description = "Many citizens keep the app open, refreshing their profile, requests and delta sync."
+    users = 64
+
+    def setup(self):
+        super().setup()
+        self.cursor = None
+
+    def step(self):
+        self.client.get("/api/me/")
+        self.client.get(f"/api/requests/?fields={LIST_FIELDS}", "GET /api/requests/")
+        since = f"?since={self.cursor}" if self.cursor else ""
+        response = self.client.get(f"/api/sync/{since}", "GET /api/sync/")
+        if response.status == 200:
+            self.cursor = response.json()["cursor"]
@@ -0,0 +1,105 @@
+"""
+Gunicorn as configured by ``gunicorn.conf.py``, for ``loadtest --server wsgi|asgi``.
+
+The server runs with the load-test settings of the calling command and is
+sampled while a scenario runs: proportional set size (PSS, so pages shared
+with the master after the fork count once) and thread count summed over the
+master and its workers.
+"""
+
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+SAMPLE_SECONDS = 0.25
+
+
+def _children(pid: int) -> list[int]:
+    try:
+        return [int(child) for child in Path(f"/proc/{pid}/task/{pid}/children").read_text().split()]
+    except OSError:
+        return []
+
+
+def _pss_kib(pid: int) -> int:
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        if line.startswith("Pss:"):
+            return int(line.split()[1])
+    return 0
+
+
+def _threads(pid: int) -> int:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("Threads:"):
+            return int(line.split()[1])
+    return 0
+
+
+class GunicornServer:
+    def __init__(self, mode: str, workers: int):
+        self.mode = mode
+        self.workers = workers
+        self.process = None
+        self.base_url = None
+
+    def start(self, timeout: float = 60.0) -> str:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}"]
+        command += ["--workers", str(self.workers)]
+        self.process = subprocess.Popen(
+            command,
+            cwd=BASE_DIR,
+            env={**os.environ, "SERVER_MODE": self.mode},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {self.process.returncode}")
+            if self._healthy(port) and len(_children(self.process.pid)) == self.workers:
+                self.base_url = f"http://127.0.0.1:{port}"
+                return self.base_url
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"gunicorn did not answer /healthz/ within {timeout:.0f}s")
+
+    def _healthy(self, port: int) -> bool:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+        try:
+            connection.request("GET", "/healthz/", headers={"X-Forwarded-Proto": "https"})
+            return connection.getresponse().status == 200
+        except OSError:
+            return False
+        finally:
+            connection.close()
+
+    def usage(self) -> dict:
+        pids = [self.process.pid, *_children(self.process.pid)]
+        try:
+            return {
+                "memory_mb": round(sum(_pss_kib(pid) for pid in pids) / 1024, 1),
+                "threads": sum(_threads(pid) for pid in pids),
+            }
+        except OSError:
+            # A worker was replaced between listing and reading it.
+            return {"memory_mb": 0.0, "threads": 0}
+
+    def sample(self, stop: threading.Event, peak: dict) -> None:
+        """Record the highest :meth:`usage` seen until ``stop`` is set; run on a thread."""
+        while not stop.wait(SAMPLE_SECONDS):
+            for key, value in self.usage().items():
+                peak[key] = max(peak.get(key, 0), value)
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
@@ -0,0 +1,94 @@
+import json
+from importlib import import_module
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from core.benchmarks import BENCHMARK_MODULES, REGISTRY, BenchmarkSkipped, compare
+from core.loadtest import environment
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / "benchmarks" / "baseline.json"
+
+
+class Command(BaseCommand):
+    help = "Run in-process benchmarks for hot code paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Benchmarks to run (default: all).")
+        parser.add_argument("--json", help="Write the results to this JSON file.")
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Results to compare against.")
+        parser.add_argument(
+            "--save-baseline", action="store_true", help="Store these results in the baseline (other entries are kept)."
+        )
+        parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown that counts as a regression.")
+        parser.add_argument("--check", action="store_true", help="Exit with an error if anything regressed.")
+
+    def handle(self, *args, **options):
+        for module in BENCHMARK_MODULES:
+            import_module(module)
+
+        names = options["names"] or sorted(REGISTRY)
+        unknown = set(names) - set(REGISTRY)
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+        results = {}
+        old_config = None
+        if any(REGISTRY[name].needs_db for name in names):
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+        try:
+            for name in names:
+                name_results = self.run_benchmark(name)
+                if name_results is not None:
+                    results[name] = name_results
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+        self.write_results(results, options)
+
+    def run_benchmark(self, name):
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        try:
+            results = REGISTRY[name]()
+        except BenchmarkSkipped as exc:
+            self.stdout.write(self.style.WARNING(f"  skipped: {exc}"))
+            return None
+        for result in results:
+            line = (
+                f"  {result['name']:<50} {result['median_us']:>12.2f} us/op ±{result['rsd_pct']:.1f}%"
+                f" (best {result['best_us']:.2f}, {result['ops_per_sec']:,.0f} ops/s"
+            )
+            if result["items_per_sec"] != result["ops_per_sec"]:
+                line += f", {result['items_per_sec']:,.0f} items/s"
+            self.stdout.write(line + f", peak {result['peak_alloc_kib']:,.1f} KiB)")
+        return results
+
+    def write_results(self, results, options):
+        if options["json"]:
+            document = {"environment": environment(), "benchmarks": results}
+            Path(options["json"]).write_text(json.dumps(document, indent=2) + "\n")
+            self.stdout.write(f"Results written to {options['json']}")
+
+        baseline_path = Path(options["baseline"])
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else None
+        if options["save_baseline"]:
+            document = baseline or {}
+            document["environment"] = environment()
+            document["benchmarks"] = {**document.get("benchmarks", {}), **results}
+            baseline_path.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(f"Baseline saved to {baseline_path}")
+            return
+        if baseline is None:
+            return
+
+        regressions = compare(results, baseline["benchmarks"], options["threshold"])
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}."))
+            return
+        self.stdout.write(self.style.WARNING(f"Regressions against {baseline_path}:"))
+        for regression in regressions:
+            self.stdout.write(f"  {regression}")
+        if options["check"]:
+            raise CommandError(f"{len(regressions)} regression(s).")
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import schema
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema for the current code version and store it in OPENAPI_SCHEMA_DIR."
+
+    def handle(self, *args, **options):
+        version = schema.code_version()
+        schema.store(version, schema.generate())
+        self.stdout.write(f"Stored OpenAPI schema {version} in {settings.OPENAPI_SCHEMA_DIR}.")
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import metrics
+from core.notifications import Dispatcher
+
+
+class Command(BaseCommand):
+    help = "Send queued SMS and e-mail notifications from the outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Rows claimed per shard at a time (default: settings).")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to wait when the outbox is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit when nothing is due instead of waiting.")
+
+    def handle(self, *args, **options):
+        if settings.METRICS_PORT and not options["once"]:
+            metrics.serve(settings.METRICS_PORT)
+        dispatcher = Dispatcher(options["batch_size"])
+        while True:
+            counts = dispatcher.dispatch_batch()
+            if any(counts.values()):
+                self.stdout.write(", ".join(f"{count} {outcome}" for outcome, count in counts.items()))
+                continue
+            if options["once"]:
+                return
+            # Don't hold database connections open while idle.
+            connections.close_all()
+            time.sleep(options["interval"])
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import shutil
+import threading
+from pathlib import Path
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.loader import MigrationLoader
+
+from core.loadtest import compare, environment, run_scenario
+from core.loadtest.scenarios import SCENARIOS
+from core.loadtest.server import GunicornServer
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / "loadtest" / "baseline.json"
+# Seeded data is generated around a fixed date so every run sees the same rows.
+SEED_DATE = "2026-01-01"
+
+
+class LoadTestServer(ThreadedWSGIServer):
+    # Every virtual user connects at once when a scenario starts.
+    request_queue_size = 128
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the API over HTTP with load-test scenarios against a seeded SQLite database, "
+        "report latency percentiles per endpoint and compare them with a baseline. "
+        "Run with --settings=backend.settings_loadtest."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)}).")
+        parser.add_argument("--users", type=int, help="Virtual users per scenario (default: per scenario).")
+        parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per scenario.")
+        parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before each measurement.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--citizens", type=int, default=5000)
+        parser.add_argument("--officers", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=50_000)
+        parser.add_argument("--password", default="seed-password")
+        parser.add_argument(
+            "--target",
+            help="Base URL of an already running server using the same settings (default: start one in-process).",
+        )
+        parser.add_argument(
+            "--server",
+            choices=["wsgi", "asgi"],
+            help="Start gunicorn from gunicorn.conf.py with this SERVER_MODE instead of the in-process server, "
+            "and report its peak memory and threads.",
+        )
+        parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers for --server.")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Results to compare against.")
+        parser.add_argument("--save-baseline", action="store_true", help="Replace the baseline with these results.")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Relative change that counts as a regression.")
+        parser.add_argument("--check", action="store_true", help="Exit with an error if anything regressed.")
+
+    def handle(self, *args, **options):
+        names = options["scenarios"] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor != "sqlite":
+            # Scenarios write and the database is replaced between them: never point this at real data.
+            raise CommandError("The load test only runs against SQLite; use --settings=backend.settings_loadtest.")
+        database = Path(connection.settings_dict["NAME"])
+        template = self.seeded_template(database, options)
+
+        server = gunicorn = None
+        base_url = options["target"]
+        if options["server"]:
+            gunicorn = GunicornServer(options["server"], options["workers"])
+            try:
+                base_url = gunicorn.start()
+            except RuntimeError as exc:
+                raise CommandError(str(exc)) from exc
+        elif not base_url:
+            server = LoadTestServer(("127.0.0.1", 0), QuietRequestHandler)
+            server.set_app(WSGIHandler())
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+
+        dataset = {key: options[key] for key in ("seed", "citizens", "officers", "requests")}
+        results = {
+            "environment": environment(),
+            "dataset": dataset,
+            "duration": options["duration"],
+            "scenarios": {},
+        }
+        if gunicorn is not None:
+            results["server"] = {"mode": gunicorn.mode, "workers": gunicorn.workers, "idle": gunicorn.usage()}
+        scenario_options = {**dataset, "password": options["password"]}
+        try:
+            for name in names:
+                scenario_class = SCENARIOS[name]
+                users = options["users"] or scenario_class.users
+                self.restore(template, database)
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {scenario_class.description}"))
+                peak, sampled = {}, threading.Event()
+                if gunicorn is not None:
+                    threading.Thread(target=gunicorn.sample, args=(sampled, peak), daemon=True).start()
+                try:
+                    summary = run_scenario(
+                        scenario_class, base_url, users, options["duration"], options["warmup"], scenario_options
+                    )
+                except RuntimeError as exc:
+                    raise CommandError(str(exc)) from exc
+                finally:
+                    sampled.set()
+                if peak:
+                    summary["server_peak"] = peak
+                results["scenarios"][name] = summary
+                self.report(summary)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if gunicorn is not None:
+                gunicorn.stop()
+
+        self.write_results(results, options)
+
+    def seeded_template(self, database: Path, options) -> Path:
+        """A copy of the database seeded for these options, created on first use."""
+        migrations = sorted(MigrationLoader(None, ignore_no_migrations=True).graph.leaf_nodes())
+        key = [options[name] for name in ("seed", "citizens", "officers", "requests", "password")]
+        digest = hashlib.sha256(repr((key, migrations, SEED_DATE)).encode()).hexdigest()[:12]
+        template = database.with_name(f"{database.stem}-seed-{digest}{database.suffix}")
+        if template.exists():
+            return template
+
+        self.stdout.write(f"Seeding {database} (kept as {template.name} for later runs)...")
+        self.remove(database)
+        call_command("migrate", verbosity=0, interactive=False)
+        call_command(
+            "seed_load",
+            citizens=options["citizens"],
+            officers=options["officers"],
+            requests=options["requests"],
+            seed=options["seed"],
+            password=options["password"],
+            now=SEED_DATE,
+            stdout=self.stdout,
+        )
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            # Readers are not blocked by the single writer, as with MySQL.
+            cursor.execute("PRAGMA journal_mode = WAL")
+        connections.close_all()
+        shutil.copyfile(database, template)
+        return template
+
+    def remove(self, database: Path) -> None:
+        connections.close_all()
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{database}{suffix}").unlink(missing_ok=True)
+
+    def restore(self, template: Path, database: Path) -> None:
+        """Start every scenario from the freshly seeded data."""
+        self.remove(database)
+        shutil.copyfile(template, database)
+
+    def report(self, summary: dict) -> None:
+        self.stdout.write(
+            f"  {summary['users']} users, {summary['seconds']:.0f}s: {summary['requests']:,} requests, "
+            f"{summary['rps']:,.1f} req/s, {summary['errors']:,} errors"
+        )
+        if "server_peak" in summary:
+            peak = summary["server_peak"]
+            self.stdout.write(f"  server peak: {peak['memory_mb']:,.1f} MB PSS, {peak['threads']} threads")
+        self.stdout.write(f"  {'endpoint':<40} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for endpoint, stats in summary["endpoints"].items():
+            self.stdout.write(
+                f"  {endpoint:<40} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f}"
+                f" {stats['p99_ms']:>8.1f} {stats['errors']:>7}"
+            )
+
+    def write_results(self, results: dict, options) -> None:
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2) + "\n")
+            self.stdout.write(f"Results written to {options['output']}")
+
+        baseline_path = Path(options["baseline"])
+        if options["save_baseline"]:
+            baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+            self.stdout.write(f"Baseline saved to {baseline_path}")
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f"No baseline at {baseline_path}; nothing to compare."))
+            return
+
+        regressions = compare(results, json.loads(baseline_path.read_text()), options["tolerance"])
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}."))
+            return
+        self.stdout.write(self.style.WARNING(f"Regressions against {baseline_path}:"))
+        for regression in regressions:
+            self.stdout.write(f"  {regression}")
+        if options["check"]:
+            raise CommandError(f"{len(regressions)} regression(s).")
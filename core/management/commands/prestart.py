@@ -0,0 +1,25 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+
+from core import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply pending migrations to the default database and every request shard, and create the admin user, "
+        "before the web server starts. Does no more than one migration table read per database and one user "
+        "lookup when nothing changed."
+    )
+    # build.sh runs the system checks; repeating them here would only delay every boot.
+    requires_system_checks = []
+
+    def handle(self, *args, **options):
+        for alias in sharding.all_shards():
+            executor = MigrationExecutor(connections[alias])
+            if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+                call_command("migrate", database=alias, interactive=False, verbosity=options["verbosity"])
+            else:
+                self.stdout.write(f"No migrations to apply to {alias}.")
+        call_command("initadmin")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.idempotency import purge_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses that have expired."
+
+    def handle(self, *args, **options):
+        deleted = purge_idempotency_keys()
+        self.stdout.write(f"Deleted {deleted} expired idempotency key(s).")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.notifications import purge_notifications
+
+
+class Command(BaseCommand):
+    help = "Delete sent, superseded and failed notifications older than NOTIFICATIONS['retention']."
+
+    def handle(self, *args, **options):
+        deleted = purge_notifications()
+        self.stdout.write(f"Deleted {deleted} notification(s).")
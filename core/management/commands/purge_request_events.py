@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.events import purge_events
+
+
+class Command(BaseCommand):
+    help = "Delete request events older than EVENTS['retention']."
+
+    def handle(self, *args, **options):
+        deleted = purge_events()
+        self.stdout.write(f"Deleted {deleted} request event(s).")
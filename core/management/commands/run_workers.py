@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import metrics
+from core.jobs import Worker, worker_name
+
+
+def _work(index: int, burst: bool) -> int:
+    worker = Worker(worker_name(index))
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    return worker.work(burst=burst)
+
+
+def _child(index: int, burst: bool) -> None:
+    _work(index, burst)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Run background job workers (core/jobs.py) until stopped with SIGTERM or Ctrl-C."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=int(os.getenv("JOB_WORKERS", "2")), help="Worker processes to run."
+        )
+        parser.add_argument("--burst", action="store_true", help="Exit once no job is due instead of waiting.")
+
+    def handle(self, *args, **options):
+        processes, burst = max(options["processes"], 1), options["burst"]
+        if settings.METRICS_PORT and not burst:
+            # Children record into their own files in METRICS_DIR; this process serves the sum.
+            metrics.serve(settings.METRICS_PORT)
+        if processes == 1:
+            ran = _work(0, burst)
+            self.stdout.write(f"Ran {ran} job(s).")
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        stopping = False
+        children = {}
+
+        def start(index):
+            process = context.Process(target=_child, args=(index, burst), name=f"job-worker-{index}")
+            process.start()
+            children[index] = process
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+            for process in children.values():
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for index in range(processes):
+            start(index)
+        self.stdout.write(f"Started {processes} job worker(s).")
+
+        while children:
+            for index, process in list(children.items()):
+                if process.is_alive():
+                    continue
+                del children[index]
+                if not (stopping or burst):
+                    self.stderr.write(f"Job worker {index} exited with status {process.exitcode}; restarting it.")
+                    start(index)
+            time.sleep(0.5)
@@ -0,0 +1,160 @@
+import time
+from array import array
+from contextlib import ExitStack
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from core import seeding, sharding
+from core.models import CitizenProfile, OfficerProfile, User, VerificationRequest
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate deterministic synthetic citizens, officers and verification requests for load testing. "
+        "Re-running with the same arguments resumes where an interrupted run stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--citizens", type=int, default=100_000)
+        parser.add_argument("--officers", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=500_000)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--days", type=int, default=365, help="Spread requests over this many days.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--now",
+            help="ISO date the data is generated around (default: today, UTC). Pass the same value when resuming.",
+        )
+        parser.add_argument("--password", default="seed-password", help="Password of every seeded account.")
+
+    def handle(self, *args, **options):
+        if options["officers"] < 1 or options["citizens"] < 1:
+            raise CommandError("Seeding needs at least one citizen and one officer.")
+
+        self.options = options
+        self.now = seeding.seed_start(options["now"])
+        self.seed = options["seed"]
+        # Hashing is deliberately slow; every seeded account shares one hash.
+        password_hash = make_password(options["password"])
+
+        for alias in sharding.all_shards():
+            connection = connections[alias]
+            if connection.vendor == "sqlite" and not connection.in_atomic_block:
+                # Throwaway data: skip the fsync per transaction.
+                with connection.cursor() as cursor:
+                    cursor.execute("PRAGMA synchronous = OFF")
+
+        with seeding.explicit_timestamps(CitizenProfile, OfficerProfile, VerificationRequest):
+            officer_ids = self.seed_accounts(
+                "officer", options["officers"], OfficerProfile, seeding.build_officer(password_hash, self.now)
+            )
+            citizen_ids = self.seed_accounts(
+                "citizen", options["citizens"], CitizenProfile, seeding.build_citizen(password_hash, self.now)
+            )
+            self.seed_requests(citizen_ids, officer_ids)
+
+        self.stdout.write(self.style.SUCCESS("Seeding complete."))
+
+    def progress(self, kind: str, done: int, total: int, started: float, created: int) -> None:
+        rate = created / max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f"  {kind}: {done:,}/{total:,} ({rate:,.0f} rows/s)")
+
+    def account_ids(self, kind: str) -> array:
+        """Seeded account ids, indexed by seed index."""
+        rows = User.objects.filter(email__endswith=f"@{seeding.SEED_EMAIL_DOMAIN}", email__startswith=f"{kind}-")
+        by_index = {seeding.seed_index(email): pk for pk, email in rows.values_list("pk", "email").iterator()}
+        return array("q", (by_index[index] for index in range(len(by_index))))
+
+    def seed_accounts(self, kind: str, total: int, profile_model, build) -> array:
+        ids = self.account_ids(kind)
+        self.backfill_shards(ids, profile_model)
+        if len(ids) >= total:
+            self.stdout.write(f"  {kind}s: {total:,} already seeded")
+            return ids[:total]
+
+        started = time.monotonic()
+        batch_size = self.options["batch_size"]
+        generated = seeding.rows(self.seed, kind, len(ids), total, build)
+        while batch := list(islice(generated, batch_size)):
+            users = [user for user, _ in batch]
+            # Commit the accounts on every shard with the batch, before any request there refers to them.
+            with ExitStack() as stack:
+                for alias in sharding.all_shards():
+                    stack.enter_context(transaction.atomic(using=alias))
+                User.objects.bulk_create(users, batch_size=batch_size)
+                # MySQL does not return ids from bulk inserts, so look them up by e-mail.
+                created = dict(User.objects.filter(email__in=[user.email for user in users]).values_list("email", "pk"))
+                for user, profile in batch:
+                    profile.user_id = created[user.email]
+                profile_model.objects.bulk_create([profile for _, profile in batch], batch_size=batch_size)
+                self.copy_to_shards(User.objects.filter(pk__in=created.values()))
+                self.copy_to_shards(profile_model.objects.filter(user_id__in=created.values()))
+            ids.extend(created[user.email] for user in users)
+            self.progress(f"{kind}s", len(ids), total, started, len(ids))
+        return ids
+
+    def copy_to_shards(self, queryset, aliases=None) -> None:
+        """Copy freshly seeded rows from ``default``, keeping their ids (bulk inserts skip the replication signal)."""
+        if not sharding.enabled():
+            return
+        rows = list(queryset.using(DEFAULT_DB_ALIAS))
+        for alias in settings.DATABASE_SHARDS if aliases is None else aliases:
+            # A run interrupted between commits may already have copied some of them.
+            queryset.model._base_manager.using(alias).bulk_create(
+                rows, batch_size=self.options["batch_size"], ignore_conflicts=True
+            )
+
+    def backfill_shards(self, ids: array, profile_model) -> None:
+        """Copy accounts seeded by an earlier run to any shard that is missing them."""
+        if not sharding.enabled():
+            return
+        batch_size = self.options["batch_size"]
+        for offset in range(0, len(ids), batch_size):
+            chunk = ids[offset : offset + batch_size].tolist()
+            missing = [
+                alias
+                for alias in settings.DATABASE_SHARDS
+                if profile_model.objects.using(alias).filter(user_id__in=chunk).count() < len(chunk)
+            ]
+            if missing:
+                self.copy_to_shards(User.objects.filter(pk__in=chunk), missing)
+                self.copy_to_shards(profile_model.objects.filter(user_id__in=chunk), missing)
+
+    def seeded_request_count(self, citizen_ids: array) -> int:
+        # Count by citizen id on each shard: joining users there depends on the shard copies being complete.
+        total = 0
+        for alias in sharding.all_shards():
+            chunk = connections[alias].features.max_query_params or len(citizen_ids) or 1
+            for offset in range(0, len(citizen_ids), chunk):
+                ids = citizen_ids[offset : offset + chunk].tolist()
+                total += VerificationRequest.objects.using(alias).filter(citizen_id__in=ids).count()
+        return total
+
+    def seed_requests(self, citizen_ids: array, officer_ids: array) -> None:
+        total = self.options["requests"]
+        start = self.seeded_request_count(citizen_ids)
+        if start >= total:
+            self.stdout.write(f"  requests: {total:,} already seeded")
+            return
+
+        started = time.monotonic()
+        batch_size = self.options["batch_size"]
+        build = seeding.build_request(citizen_ids, officer_ids, self.options["days"], self.now)
+        generated = seeding.rows(self.seed, "request", start, total, build)
+        done = start
+        while batch := list(islice(generated, batch_size)):
+            by_shard = {}
+            for request in batch:
+                alias = sharding.shard_for_region(request.metadata["region"])
+                by_shard.setdefault(alias, []).append(request)
+            # Commit a batch on every shard together so the resume count stays a whole number of batches.
+            with ExitStack() as stack:
+                for alias, requests in by_shard.items():
+                    stack.enter_context(transaction.atomic(using=alias))
+                    VerificationRequest.objects.using(alias).bulk_create(requests, batch_size=batch_size)
+            done += len(batch)
+            self.progress("requests", done, total, started, done - start)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+from core.signals import SHARD_REFERENCE_MODELS
+
+
+class Command(BaseCommand):
+    help = "Copy users and profiles from the default database to every request shard."
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError("No request shards are configured (DB_SHARDS).")
+
+        for model in SHARD_REFERENCE_MODELS:
+            copied = 0
+            for instance in model._base_manager.using("default").iterator():
+                sharding.replicate(instance)
+                copied += 1
+            self.stdout.write(f"{model.__name__}: {copied} row(s) copied to {len(sharding.all_shards()) - 1} shard(s).")
@@ -0,0 +1,372 @@
+"""
+Prometheus metrics aggregated across gunicorn workers without a collector.
+
+Every worker process appends its series to its own memory-mapped file
+(``metrics-<pid>.db`` under ``METRICS_DIR``) and is the only writer of it, so
+an observation is a dict lookup and an in-place update under a thread lock —
+no cross-process locking. ``/metrics`` reads and sums every file in the
+directory. Files of processes that have exited (recycled workers, management
+commands) are first folded into one ``merged.db`` and deleted, so counters
+stay monotonic across worker restarts while a scrape reads one file per live
+process. Liveness is checked by pid, so every process writing to a
+``METRICS_DIR`` must run on the same host.
+
+File layout: an 8-byte "bytes used" header, then entries of a 4-byte key
+length, the UTF-8 key padded to 8 bytes, and an 8-byte float value. A new
+entry is written before the header is bumped, so readers never see a
+half-written key, and only read the used part of a file.
+"""
+
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+from .dbpool import pool_stats
+from .sharedstate import fcntl, pid_alive, shared_state_dir
+
+logger = logging.getLogger(__name__)
+
+METRICS = {
+    "mtaa_http_requests_total": ("counter", "HTTP responses by route name, method and status code."),
+    "mtaa_http_request_duration_seconds": ("histogram", "Time to produce a response, by route name."),
+    "mtaa_db_queries_total": ("counter", "SQL queries executed while handling requests, by route name."),
+    "mtaa_decisions_total": ("counter", "Officer decisions on verification requests, by decision and request type."),
+    "mtaa_pdf_render_seconds": ("histogram", "Time to render a verification letter PDF."),
+    "mtaa_notifications_total": ("counter", "Outbox notifications handled by the dispatcher, by channel and outcome."),
+    "mtaa_letter_verifications_total": ("counter", "Letter checks at /verify/, by result (valid, revoked, invalid)."),
+}
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+BUCKET_LABELS = tuple("+Inf" if bound == float("inf") else repr(bound) for bound in BUCKETS)
+
+_HEADER = struct.Struct("<Q")
+_LENGTH = struct.Struct("<I")
+_VALUE = struct.Struct("<d")
+_SEPARATOR = "\x1f"
+FILE_PREFIX = "metrics-"
+MERGED_FILE = "merged.db"
+
+
+def metrics_dir() -> str:
+    directory = settings.METRICS_DIR or os.path.join(shared_state_dir(), "metrics")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _encode_key(name: str, labels: tuple) -> str:
+    return _SEPARATOR.join([name, *(f"{label}={value}" for label, value in labels)])
+
+
+def _decode_key(key: str) -> tuple[str, tuple]:
+    name, *pairs = key.split(_SEPARATOR)
+    return name, tuple(tuple(pair.split("=", 1)) for pair in pairs)
+
+
+def _entries(buffer):
+    """Yield ``(key, value offset)`` for every complete entry in a metrics file."""
+    (used,) = _HEADER.unpack_from(buffer, 0)
+    position = _HEADER.size
+    while position < used:
+        (length,) = _LENGTH.unpack_from(buffer, position)
+        key_start = position + _LENGTH.size
+        value_offset = key_start + length + (-(_LENGTH.size + length) % 8)
+        yield bytes(buffer[key_start : key_start + length]).decode(), value_offset
+        position = value_offset + _VALUE.size
+
+
+class MetricsFile:
+    """The current process's metrics file; one writer, any number of readers."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if _HEADER.unpack_from(self._map, 0)[0] == 0:
+            _HEADER.pack_into(self._map, 0, _HEADER.size)
+        # A restarted worker that reuses a pid keeps counting in the same file.
+        self._offsets = dict(_entries(self._map))
+        self._full = False
+
+    def _offset(self, key: str) -> int | None:
+        encoded = key.encode()
+        (used,) = _HEADER.unpack_from(self._map, 0)
+        padding = -(_LENGTH.size + len(encoded)) % 8
+        end = used + _LENGTH.size + len(encoded) + padding + _VALUE.size
+        if end > self.size:
+            if not self._full:
+                logger.warning("Metrics file %s is full; new series are dropped.", self.path)
+                self._full = True
+            return None
+        _LENGTH.pack_into(self._map, used, len(encoded))
+        self._map[used + _LENGTH.size : used + _LENGTH.size + len(encoded)] = encoded
+        value_offset = end - _VALUE.size
+        _VALUE.pack_into(self._map, value_offset, 0.0)
+        _HEADER.pack_into(self._map, 0, end)
+        self._offsets[key] = value_offset
+        return value_offset
+
+    def add(self, keys, amounts) -> None:
+        with self._lock:
+            for key, amount in zip(keys, amounts):
+                offset = self._offsets.get(key)
+                if offset is None:
+                    offset = self._offset(key)
+                    if offset is None:
+                        continue
+                (value,) = _VALUE.unpack_from(self._map, offset)
+                _VALUE.pack_into(self._map, offset, value + amount)
+
+
+_file = None
+_file_pid = None
+_key_cache = {}
+
+
+def _get_file() -> MetricsFile:
+    global _file, _file_pid
+    pid = os.getpid()
+    if _file_pid != pid:
+        # Opened lazily and again after a fork, so every worker gets its own file.
+        _file = MetricsFile(os.path.join(metrics_dir(), f"{FILE_PREFIX}{pid}.db"), settings.METRICS_FILE_BYTES)
+        _file_pid = pid
+    return _file
+
+
+def _keys(name: str, labels: tuple) -> tuple:
+    cache_key = (name, labels)
+    keys = _key_cache.get(cache_key)
+    if keys is None:
+        if METRICS[name][0] == "histogram":
+            keys = tuple(_encode_key(f"{name}_bucket", (*labels, ("le", le))) for le in BUCKET_LABELS)
+            keys += (_encode_key(f"{name}_sum", labels), _encode_key(f"{name}_count", labels))
+        else:
+            keys = (_encode_key(name, labels),)
+        _key_cache[cache_key] = keys
+    return keys
+
+
+def inc(name: str, labels: tuple = (), amount: float = 1.0) -> None:
+    """Increment counter ``name``; ``labels`` is a tuple of ``(label, value)`` pairs."""
+    _get_file().add(_keys(name, labels), (amount,))
+
+
+def observe(name: str, value: float, labels: tuple = ()) -> None:
+    """Record ``value`` (seconds) in histogram ``name``."""
+    keys = _keys(name, labels)
+    bucket = bisect.bisect_left(BUCKETS, value)
+    # Buckets are stored per bucket and made cumulative when rendered.
+    _get_file().add((keys[bucket], keys[-2], keys[-1]), (1.0, value, 1.0))
+
+
+def _read(path: str) -> list[tuple[str, float]]:
+    """The ``(key, value)`` entries of a metrics file, reading only its used part."""
+    with open(path, "rb") as handle:
+        header = handle.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return []
+        (used,) = _HEADER.unpack(header)
+        buffer = header + handle.read(max(0, used - _HEADER.size))
+    if len(buffer) < used:
+        return []
+    return [(key, _VALUE.unpack_from(buffer, offset)[0]) for key, offset in _entries(buffer)]
+
+
+def _pack(values: dict) -> bytes:
+    body = bytearray()
+    for key, value in values.items():
+        encoded = key.encode()
+        body += _LENGTH.pack(len(encoded)) + encoded + bytes(-(_LENGTH.size + len(encoded)) % 8) + _VALUE.pack(value)
+    return _HEADER.pack(_HEADER.size + len(body)) + bytes(body)
+
+
+def _owner(filename: str) -> int | None:
+    if not (filename.startswith(FILE_PREFIX) and filename.endswith(".db")):
+        return None
+    try:
+        return int(filename[len(FILE_PREFIX) : -len(".db")])
+    except ValueError:
+        return None
+
+
+@contextmanager
+def _collect_lock(directory: str):
+    """Serialise scrapes across processes, so a file being merged is never counted twice."""
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(os.path.join(directory, "collect.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _merge_exited(directory: str) -> None:
+    """Fold the files of processes that have exited into ``merged.db`` and delete them."""
+    exited = [
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if (pid := _owner(filename)) is not None and pid != os.getpid() and not pid_alive(pid)
+    ]
+    if not exited:
+        return
+    merged_path = os.path.join(directory, MERGED_FILE)
+    values = defaultdict(float)
+    for path in (merged_path, *exited):
+        try:
+            for key, value in _read(path):
+                values[key] += value
+        except FileNotFoundError:
+            continue
+    temporary = f"{merged_path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as handle:
+        handle.write(_pack(values))
+    os.replace(temporary, merged_path)
+    # Deleted only once merged.db holds their values: a crash in between double-counts, it never loses counts.
+    for path in exited:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def collect() -> dict:
+    """Sum every process's values, keyed by ``(series name, labels)``."""
+    values = defaultdict(float)
+    directory = metrics_dir()
+    with _collect_lock(directory):
+        _merge_exited(directory)
+        for filename in os.listdir(directory):
+            if filename != MERGED_FILE and _owner(filename) is None:
+                continue
+            try:
+                entries = _read(os.path.join(directory, filename))
+            except OSError:
+                continue
+            for key, value in entries:
+                values[key] += value
+    totals = defaultdict(float)
+    for key, value in values.items():
+        totals[_decode_key(key)] += value
+    return totals
+
+
+class QueryCounter:
+    """Database execute wrapper that only counts statements."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format(name: str, labels: tuple, value: float) -> str:
+    label_text = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+    return f"{name}{{{label_text}}} {value!r}" if label_text else f"{name} {value!r}"
+
+
+def _pool_lines() -> list[str]:
+    """Connection pool stats of the answering worker, labelled with its pid (pools are per process)."""
+    connections, events = [], []
+    for alias, stats in pool_stats().items():
+        stats = dict(stats)
+        labels = (("alias", alias), ("pid", str(os.getpid())))
+        for state in ("size", "in_use", "idle"):
+            connections.append(_format("mtaa_db_pool_connections", (*labels, ("state", state)), float(stats.pop(state))))
+        for event, value in stats.items():
+            events.append(_format("mtaa_db_pool_events_total", (*labels, ("event", event)), float(value)))
+    if not connections:
+        return []
+    return [
+        "# HELP mtaa_db_pool_connections Pooled database connections of the answering worker, by alias and state.",
+        "# TYPE mtaa_db_pool_connections gauge",
+        *connections,
+        "# HELP mtaa_db_pool_events_total Pool checkouts, waits, timeouts, creates and discards of the answering worker.",
+        "# TYPE mtaa_db_pool_events_total counter",
+        *events,
+    ]
+
+
+def render() -> str:
+    """Render every series in the Prometheus text exposition format."""
+    totals = collect()
+    lines = []
+    for family, (kind, help_text) in METRICS.items():
+        lines += [f"# HELP {family} {help_text}", f"# TYPE {family} {kind}"]
+        if kind == "counter":
+            for (name, labels), value in sorted(totals.items()):
+                if name == family:
+                    lines.append(_format(name, labels, value))
+            continue
+
+        series = defaultdict(dict)
+        for (name, labels), value in totals.items():
+            if name == f"{family}_bucket":
+                *rest, (_, le) = labels
+                series[tuple(rest)][le] = value
+        for labels in sorted(series):
+            cumulative = 0.0
+            for le in BUCKET_LABELS:
+                cumulative += series[labels].get(le, 0.0)
+                lines.append(_format(f"{family}_bucket", (*labels, ("le", le)), cumulative))
+            lines.append(_format(f"{family}_sum", labels, totals.get((f"{family}_sum", labels), 0.0)))
+            lines.append(_format(f"{family}_count", labels, totals.get((f"{family}_count", labels), 0.0)))
+    lines += _pool_lines()
+    return "\n".join(lines) + "\n"
+
+
+def authorized(authorization: str) -> bool:
+    """Whether an ``Authorization`` header may read the metrics: the token is required unless DEBUG is on."""
+    token = settings.METRICS_TOKEN
+    if not token:
+        return settings.DEBUG
+    return constant_time_compare(authorization, f"Bearer {token}")
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _app(environ, start_response):
+    if environ.get("PATH_INFO") != "/metrics":
+        start_response("404 Not Found", [("Content-Type", "text/plain")])
+        return [b""]
+    if not authorized(environ.get("HTTP_AUTHORIZATION", "")):
+        start_response("401 Unauthorized", [("Content-Type", "text/plain")])
+        return [b""]
+    start_response("200 OK", [("Content-Type", "text/plain; version=0.0.4; charset=utf-8")])
+    return [render().encode()]
+
+
+def serve(port: int):
+    """
+    Serve ``/metrics`` on ``port`` from a daemon thread, for processes that are
+    not behind the web service (the notifier and job runner on their own host).
+    Returns the server, whose ``shutdown()`` stops it.
+    """
+    server = make_server("", port, _app, handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
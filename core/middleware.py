@@ -0,0 +1,535 @@
+import json
+import logging
+import random
+import time
+from functools import wraps
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+
+from . import metrics, routers, sharding
+from .concurrency import get_limiter
+from .querybudget import QueryBudgetExceeded, QueryLog
+from .queryhooks import observe_queries
+from .timing import RequestTimings, current_timings
+
+TIMEOUT_HEADER = "HTTP_X_REQUEST_TIMEOUT_MS"
+
+logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger("core.timing")
+
+HTTP_METHODS = {"GET", "HEAD", "OPTIONS", "POST", "PUT", "PATCH", "DELETE"}
+
+
+def _adapt(is_async: bool, method, method_is_async: bool | None = None):
+    """Make ``method`` callable from a sync or async caller, as Django's ``BaseHandler.adapt_method_mode`` does."""
+    if method_is_async is None:
+        method_is_async = iscoroutinefunction(method)
+    if is_async and not method_is_async:
+        return sync_to_async(method, thread_sensitive=True)
+    if not is_async and method_is_async:
+        return async_to_sync(method)
+    return method
+
+
+def _on_event_loop(method):
+    @wraps(method)
+    async def coroutine(*args):
+        return method(*args)
+
+    return coroutine
+
+
+class HybridMiddleware:
+    """
+    Middleware that runs natively in both the WSGI and the ASGI stack.
+
+    Django runs sync-only middleware in an async stack on a thread, a hop per
+    middleware and request. Subclasses implement ``__call__`` for WSGI and
+    ``__acall__`` for ASGI; their ``process_view`` only touches memory, so in
+    an async stack it is called straight from the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            if hasattr(self, "process_view"):
+                self.process_view = _on_event_loop(self.process_view)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Count, time and count the SQL of every request for ``/metrics`` (see core/metrics.py)."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = metrics.QueryCounter()
+        started = time.perf_counter()
+        with observe_queries(counter):
+            response = self.get_response(request)
+        self.record(request, response, counter, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        counter = metrics.QueryCounter()
+        started = time.perf_counter()
+        with observe_queries(counter):
+            response = await self.get_response(request)
+        self.record(request, response, counter, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, counter, elapsed):
+        match = request.resolver_match
+        # Unnamed routes (admin, docs, probes) are labelled with their pattern to keep cardinality bounded.
+        route = (match.url_name or match.route) if match else "unmatched"
+        method = request.method if request.method in HTTP_METHODS else "other"
+        metrics.inc(
+            "mtaa_http_requests_total",
+            (("route", route), ("method", method), ("status", str(response.status_code))),
+        )
+        metrics.observe("mtaa_http_request_duration_seconds", elapsed, (("route", route),))
+        if counter.queries:
+            metrics.inc("mtaa_db_queries_total", (("route", route),), counter.queries)
+
+
+class QueryBudgetMiddleware(HybridMiddleware):
+    """
+    Enforce the ``query_budget`` of API views and flag N+1 query patterns.
+
+    ``QUERY_BUDGET["mode"]`` is ``"warn"`` (log, the production default),
+    ``"raise"`` (raise :class:`core.querybudget.QueryBudgetExceeded`, used by
+    the test settings) or ``"off"``.
+    """
+
+    def __init__(self, get_response):
+        self.mode = settings.QUERY_BUDGET["mode"]
+        if self.mode == "off":
+            raise MiddlewareNotUsed
+        self.repeat_threshold = settings.QUERY_BUDGET["repeat_threshold"]
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request._query_log = QueryLog(self.repeat_threshold)
+        with observe_queries(request._query_log):
+            response = self.get_response(request)
+        self.check(request)
+        return response
+
+    async def __acall__(self, request):
+        request._query_log = QueryLog(self.repeat_threshold)
+        with observe_queries(request._query_log):
+            response = await self.get_response(request)
+        self.check(request)
+        return response
+
+    def check(self, request):
+        log = request._query_log
+        problems = log.problems() if log.view is not None else []
+        if problems:
+            message = f"{request.method} {request.path}: " + " ".join(problems)
+            if self.mode == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None)
+        if view_class is None:
+            return None
+        budget = getattr(view_class, "query_budget", None)
+        if isinstance(budget, dict):
+            budget = budget.get(request.method)
+        request._query_log.view = view_class.__name__
+        request._query_log.budget = budget
+        return None
+
+
+class ServerTimingMiddleware(HybridMiddleware):
+    """
+    Report where a sampled request's time went.
+
+    A ``SERVER_TIMING["sample_rate"]`` fraction of requests get a
+    ``Server-Timing`` header (SQL count and time, serialization, PDF rendering,
+    total) and one JSON log line on the ``core.timing`` logger. With
+    ``debug_sql`` (only honoured when ``DEBUG`` is on) every request is sampled
+    and its slowest statements are returned in ``X-Debug-Slow-SQL``.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.SERVER_TIMING["sample_rate"]
+        self.debug_sql = settings.DEBUG and settings.SERVER_TIMING["debug_sql"]
+        if not self.sample_rate and not self.debug_sql:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def sampled(self) -> bool:
+        return self.debug_sql or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        timings = RequestTimings(keep_sql=self.debug_sql)
+        token = current_timings.set(timings)
+        try:
+            with observe_queries(timings):
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        self.report(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        timings = RequestTimings(keep_sql=self.debug_sql)
+        token = current_timings.set(timings)
+        try:
+            with observe_queries(timings):
+                response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        self.report(request, response, timings)
+        return response
+
+    def report(self, request, response, timings):
+        total_ms = timings.total_seconds() * 1000
+        db_ms = timings.db_seconds * 1000
+        spans_ms = {name: seconds * 1000 for name, seconds in timings.spans.items()}
+        metrics = [f'db;dur={db_ms:.2f};desc="{timings.queries} queries"']
+        metrics += [f"{name};dur={duration:.2f}" for name, duration in spans_ms.items()]
+        metrics.append(f"total;dur={total_ms:.2f}")
+        response["Server-Timing"] = ", ".join(metrics)
+        if self.debug_sql:
+            response["X-Debug-Slow-SQL"] = json.dumps(timings.slow_queries())
+
+        match = request.resolver_match
+        timing_logger.info(
+            json.dumps(
+                {
+                    "event": "request_timing",
+                    "method": request.method,
+                    "route": match.url_name if match else None,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "total_ms": round(total_ms, 2),
+                    "db_ms": round(db_ms, 2),
+                    "queries": timings.queries,
+                    **{f"{name}_ms": round(duration, 2) for name, duration in spans_ms.items()},
+                }
+            )
+        )
+
+
+def request_start(request) -> float | None:
+    """
+    When the front proxy received ``request``, as Unix time, from its request-start header.
+
+    Accepts ``t=<seconds>`` (nginx ``$msec``) and bare seconds, milliseconds
+    (Heroku) or microseconds (Apache ``%t``).
+    """
+    value = request.META.get(settings.LOAD_SHEDDING["request_start_meta"], "")
+    try:
+        start = float(value.removeprefix("t="))
+    except ValueError:
+        return None
+    if start > 1e14:
+        return start / 1_000_000
+    if start > 1e11:
+        return start / 1000
+    return start
+
+
+class AdaptiveConcurrencyMiddleware(HybridMiddleware):
+    """
+    Shed load early instead of letting requests queue until the platform times out.
+
+    Sync workers hold at most one request each, so most of the queueing happens
+    in front of them, in gunicorn's backlog and the proxy. When the proxy sends a
+    request-start header (``X-Request-Start``), a request that already waited
+    longer than ``max_queue_ms`` gets an immediate ``503`` with ``Retry-After``;
+    so does one over its route class's adaptive limit. Clients may send
+    ``X-Request-Timeout-Ms``, a budget measured from when the request arrived;
+    work whose caller has already given up is skipped with a ``504`` before it
+    reaches the view.
+    """
+
+    def __init__(self, get_response):
+        self.enabled = settings.LOAD_SHEDDING.get("enabled", True)
+        self.exempt = set(settings.LOAD_SHEDDING.get("exempt_routes", ()))
+        self.max_queue = settings.LOAD_SHEDDING.get("max_queue_ms", 0) / 1000
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request._arrived_at = time.time()
+        response = self.get_response(request)
+        self.release(request, response)
+        return response
+
+    async def __acall__(self, request):
+        request._arrived_at = time.time()
+        response = await self.get_response(request)
+        self.release(request, response)
+        return response
+
+    def release(self, request, response):
+        position = getattr(request, "_concurrency_class", None)
+        if position is not None:
+            elapsed = time.monotonic() - request._concurrency_started
+            get_limiter().release(position, elapsed, failed=response.status_code >= 500)
+
+    def busy(self):
+        response = JsonResponse({"detail": "Server is busy, please retry shortly."}, status=503)
+        response["Retry-After"] = "1"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        now = time.time()
+        # The proxy's clock is not ours: a start "in the future" means no measurable wait.
+        arrived = min(request_start(request) or request._arrived_at, now)
+        timeout = request.META.get(TIMEOUT_HEADER)
+        if timeout:
+            try:
+                expired = now - arrived >= float(timeout) / 1000
+            except ValueError:
+                expired = False
+            if expired:
+                return JsonResponse({"detail": "Request timeout exceeded."}, status=504)
+
+        route = request.resolver_match.url_name
+        if not self.enabled or route is None or route in self.exempt:
+            return None
+        if self.max_queue and now - arrived > self.max_queue:
+            return self.busy()
+
+        limiter = get_limiter()
+        position = limiter.class_for_route(route)
+        if not limiter.acquire(position):
+            return self.busy()
+        request._concurrency_class = position
+        request._concurrency_started = time.monotonic()
+        return None
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """Provide the request state :class:`core.routers.PrimaryReplicaRouter` routes on."""
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def start(self, request, key: str) -> dict:
+        safe = request.method in routers.SAFE_METHODS
+        return {
+            "safe": safe,
+            "pinned": safe and routers.recently_wrote(key),
+            "wrote": False,
+            "replica": None,
+        }
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        key = routers.pin_key(request)
+        state = self.start(request, key)
+        token = routers.request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.request_state.reset(token)
+        if state["wrote"]:
+            routers.record_write(key)
+        return response
+
+    async def __acall__(self, request):
+        key = routers.pin_key(request)
+        state = self.start(request, key)
+        token = routers.request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.request_state.reset(token)
+        if state["wrote"]:
+            routers.record_write(key)
+        return response
+
+    def process_exception(self, request, exception):
+        state = routers.request_state.get()
+        if isinstance(exception, DatabaseError) and state and state["replica"] not in (None, DEFAULT_DB_ALIAS):
+            routers.mark_unhealthy(state["replica"])
+        return None
+
+
+class ShardRoutingMiddleware(HybridMiddleware):
+    """Route request-by-id endpoints to the shard that owns the id."""
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_SHARDS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.reset(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.reset(request)
+        return response
+
+    def reset(self, request):
+        token = getattr(request, "_shard_token", None)
+        if token is not None:
+            sharding.current_shard.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        alias = sharding.shard_for_route(request.resolver_match)
+        if alias is not None:
+            request._shard_token = sharding.current_shard.set(alias)
+        return None
+
+
+class MiddlewareChain:
+    """One ``MIDDLEWARE_BY_PATH`` entry, built the way Django builds ``MIDDLEWARE`` in a sync or async stack."""
+
+    def __init__(self, middleware_paths, get_response, is_async: bool = False):
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+        handler = get_response
+        handler_is_async = is_async
+        for middleware_path in reversed(middleware_paths):
+            middleware = import_string(middleware_path)
+            if not handler_is_async and getattr(middleware, "sync_capable", True):
+                middleware_is_async = False
+            else:
+                middleware_is_async = getattr(middleware, "async_capable", False)
+            try:
+                adapted_handler = _adapt(middleware_is_async, handler, handler_is_async)
+                instance = middleware(adapted_handler)
+            except MiddlewareNotUsed:
+                continue
+            handler = adapted_handler
+            if hasattr(instance, "process_view"):
+                self.view_middleware.insert(0, _adapt(is_async, instance.process_view))
+            if hasattr(instance, "process_template_response"):
+                self.template_response_middleware.append(_adapt(is_async, instance.process_template_response))
+            if hasattr(instance, "process_exception"):
+                # Django always runs exception middleware synchronously.
+                self.exception_middleware.append(_adapt(False, instance.process_exception))
+            handler = convert_exception_to_response(instance)
+            handler_is_async = middleware_is_async
+        self.handler = _adapt(is_async, handler, handler_is_async)
+
+
+class PathMiddlewareDispatcher:
+    """
+    Run the rest of the middleware stack according to the request path.
+
+    ``MIDDLEWARE_BY_PATH`` maps path prefixes to middleware lists; the first
+    prefix the path starts with picks the chain that runs inside this
+    middleware, with its ``process_view``, ``process_exception`` and
+    ``process_template_response`` hooks called as if it were listed in
+    ``MIDDLEWARE``. The stateless JWT API skips sessions, CSRF, messages,
+    clickjacking protection and static files; the admin and pages keep all
+    of them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.is_async = iscoroutinefunction(get_response)
+        self.chains = [
+            (prefix, MiddlewareChain(middleware_paths, get_response, self.is_async))
+            for prefix, middleware_paths in settings.MIDDLEWARE_BY_PATH.items()
+        ]
+        # Paths no prefix matches run no further middleware.
+        self.default = MiddlewareChain([], get_response, self.is_async)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+        # Only offer the hooks some chain uses: Django calls each one on every request.
+        chains = [chain for _, chain in self.chains]
+        if any(chain.view_middleware for chain in chains):
+            self.process_view = self._aprocess_view if self.is_async else self._process_view
+        if any(chain.template_response_middleware for chain in chains):
+            self.process_template_response = (
+                self._aprocess_template_response if self.is_async else self._process_template_response
+            )
+        if any(chain.exception_middleware for chain in chains):
+            self.process_exception = self._process_exception
+
+    def chain_for(self, path: str) -> MiddlewareChain:
+        for prefix, chain in self.chains:
+            if path.startswith(prefix):
+                return chain
+        return self.default
+
+    def __call__(self, request):
+        chain = self.chain_for(request.path_info)
+        request._middleware_chain = chain
+        # Returns a coroutine in an async stack.
+        return chain.handler(request)
+
+    def _process_view(self, request, view_func, view_args, view_kwargs):
+        for process_view in request._middleware_chain.view_middleware:
+            response = process_view(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        for process_view in request._middleware_chain.view_middleware:
+            response = await process_view(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def _process_template_response(self, request, response):
+        for process_template_response in request._middleware_chain.template_response_middleware:
+            response = process_template_response(request, response)
+        return response
+
+    async def _aprocess_template_response(self, request, response):
+        for process_template_response in request._middleware_chain.template_response_middleware:
+            response = await process_template_response(request, response)
+        return response
+
+    def _process_exception(self, request, exception):
+        for process_exception in request._middleware_chain.exception_middleware:
+            response = process_exception(request, exception)
+            if response is not None:
+                return response
+        return None
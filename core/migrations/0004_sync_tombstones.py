@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("request_id", models.BigIntegerField()),
+                ("citizen_id", models.BigIntegerField()),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("deleted", "Deleted"),
+                            ("left_queue", "Left pending queue"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="verificationrequest",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name="verificationrequest",
+            index=models.Index(
+                fields=["status", "updated_at"], name="request_status_updated_idx"
+            ),
+        ),
+    ]
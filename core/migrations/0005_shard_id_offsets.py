@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations
+
+# Keep in sync with core.sharding.SHARD_ID_SPAN.
+SHARD_ID_SPAN = 10**12
+
+
+def seed_shard_id_offsets(apps, schema_editor):
+    """Start each shard's request ids in its own range so an id identifies its shard."""
+    connection = schema_editor.connection
+    if connection.alias not in getattr(settings, "DATABASE_SHARDS", []):
+        return
+
+    start = settings.SHARD_NUMBERS[connection.alias] * SHARD_ID_SPAN
+    table = apps.get_model("core", "VerificationRequest")._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("DELETE FROM sqlite_sequence WHERE name = %s", [table])
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start])
+        elif connection.vendor == "mysql":
+            cursor.execute(f"ALTER TABLE {connection.ops.quote_name(table)} AUTO_INCREMENT = {start + 1}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_sync_tombstones"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_shard_id_offsets, migrations.RunPython.noop),
+    ]
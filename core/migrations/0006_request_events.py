@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_shard_id_offsets"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("request.created", "Request created"),
+                            ("request.status_changed", "Request status changed"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("request_id", models.BigIntegerField()),
+                ("citizen_id", models.BigIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("approved", "Approved"),
+                            ("rejected", "Rejected"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
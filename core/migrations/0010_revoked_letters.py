@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_attachments"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevokedLetter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("request_id", models.BigIntegerField()),
+                ("decided_at", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="revokedletter",
+            constraint=models.UniqueConstraint(
+                fields=("request_id", "decided_at"), name="unique_revoked_letter"
+            ),
+        ),
+    ]
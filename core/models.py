@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -123,10 +125,175 @@ class VerificationRequest(models.Model):
     )
     decided_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "updated_at"], name="request_status_updated_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.request_type} - {self.citizen.full_name}"
+
+
+class Attachment(models.Model):
+    """A supporting document on a request; the file is stored once per ``sha256`` (see core/attachments.py)."""
+
+    request = models.ForeignKey(VerificationRequest, on_delete=models.CASCADE, related_name="attachments")
+    sha256 = models.CharField(max_length=64, db_index=True)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    thumbnail = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at", "id"]
+        constraints = [
+            models.UniqueConstraint(fields=["request", "sha256"], name="unique_request_attachment"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.filename} ({self.request_id})"
+
+
+class RequestTombstone(models.Model):
+    """Marks a request that disappeared from a sync scope (see core/sync.py)."""
+
+    class Reason(models.TextChoices):
+        DELETED = "deleted", "Deleted"
+        LEFT_QUEUE = "left_queue", "Left pending queue"
+
+    request_id = models.BigIntegerField()
+    citizen_id = models.BigIntegerField()
+    reason = models.CharField(max_length=20, choices=Reason.choices)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.request_id} {self.reason}"
+
+
+class RequestEvent(models.Model):
+    """A request created or changing status: the change feed behind ``/api/events/`` (see core/events.py)."""
+
+    class Kind(models.TextChoices):
+        CREATED = "request.created", "Request created"
+        STATUS_CHANGED = "request.status_changed", "Request status changed"
+
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    request_id = models.BigIntegerField()
+    citizen_id = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=VerificationRequest.Status.choices)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.request_id}"
+
+
+class RevokedLetter(models.Model):
+    """An approval undone after its letter was issued: ``/verify/`` reports the letter as revoked (core/verification.py)."""
+
+    request_id = models.BigIntegerField()
+    # Time of the revoked decision in Unix microseconds, as encoded in the letter's token.
+    decided_at = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["request_id", "decided_at"], name="unique_revoked_letter"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.request_id} @ {self.decided_at}"
+
+
+class Notification(models.Model):
+    """Outbox row: a message to a citizen, sent later by ``dispatch_notifications`` (see core/notifications.py)."""
+
+    class Channel(models.TextChoices):
+        EMAIL = "email", "E-mail"
+        SMS = "sms", "SMS"
+
+    class State(models.TextChoices):
+        PENDING = "pending", "Pending"
+        SENT = "sent", "Sent"
+        SUPERSEDED = "superseded", "Superseded"
+        FAILED = "failed", "Failed"
+
+    request_id = models.BigIntegerField()
+    channel = models.CharField(max_length=10, choices=Channel.choices)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+    dedupe_key = models.CharField(max_length=100, unique=True)
+    state = models.CharField(max_length=20, choices=State.choices, default=State.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "next_attempt_at"], name="notification_due_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.channel} {self.request_id} {self.state}"
+
+
+class Job(models.Model):
+    """A background task run by ``run_workers`` (see core/jobs.py)."""
+
+    class State(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        DEAD = "dead", "Dead"
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    priority = models.SmallIntegerField(default=0)
+    state = models.CharField(max_length=20, choices=State.choices, default=State.QUEUED)
+    # When the job is next due; while it runs, when its visibility timeout runs out.
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    unique_key = models.CharField(max_length=150, null=True, blank=True, unique=True)
+    locked_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claims read due jobs in this order (see core/jobs.py).
+            models.Index(fields=["state", "-priority", "run_at"], name="job_claim_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} {self.state}"
+
+
+class IdempotencyKey(models.Model):
+    class State(models.TextChoices):
+        IN_PROGRESS = "in_progress", "In progress"
+        COMPLETED = "completed", "Completed"
+
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=128)
+    fingerprint = models.CharField(max_length=64)
+    state = models.CharField(max_length=20, choices=State.choices, default=State.IN_PROGRESS)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="unique_idempotency_key"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.scope} {self.key}"
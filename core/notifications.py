@@ -0,0 +1,208 @@
+"""
+SMS and e-mail notifications to citizens about their requests, through a transactional outbox.
+
+The transition views call :func:`enqueue` inside the transaction that
+changes the request's status, writing one ``Notification`` row per channel
+next to the request, on its shard. Nothing is sent from a request thread:
+``python manage.py dispatch_notifications`` drains the outbox in batches.
+
+A batch is claimed by pushing its rows' ``next_attempt_at`` out by
+``lease_seconds`` (``SELECT ... FOR UPDATE SKIP LOCKED`` where the database
+has it), so several dispatchers can run, and a dispatcher that dies mid-batch
+only delays its rows. Failed sends are retried with exponential backoff until
+``max_attempts``. Each transition's rows have a unique ``dedupe_key``, and
+when a newer message for the same request and channel exists the older one
+is dropped as superseded. Sends are paced per channel by token buckets shared
+by every dispatcher on the instance (``NOTIFICATIONS["rates"]``).
+"""
+
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import metrics, sms
+from .models import CitizenProfile, Notification, VerificationRequest
+from .sharding import all_shards
+from .throttling import get_bucket_store, parse_rate
+
+Channel = Notification.Channel
+State = Notification.State
+
+MESSAGES = {
+    VerificationRequest.Status.APPROVED: (
+        "Your {type} request was approved",
+        "MTAA Connect: your {type} request #{id} was approved. You can download your letter in the app.",
+    ),
+    VerificationRequest.Status.REJECTED: (
+        "Your {type} request was rejected",
+        "MTAA Connect: your {type} request #{id} was rejected: {reason} You can correct and resubmit it in the app.",
+    ),
+    VerificationRequest.Status.PENDING: (
+        "Your {type} request is being reviewed",
+        "MTAA Connect: your {type} request #{id} is pending review by your mtaa office.",
+    ),
+}
+
+
+def _recipients(req: VerificationRequest) -> dict:
+    citizen = req.citizen
+    try:
+        phone = citizen.citizen_profile.phone
+    except CitizenProfile.DoesNotExist:
+        phone = ""
+    return {Channel.EMAIL: citizen.email, Channel.SMS: phone}
+
+
+def enqueue(req: VerificationRequest) -> None:
+    """Queue messages telling ``req``'s citizen its current status; call in the transition's transaction."""
+    subject, body = (
+        template.format(type=req.get_request_type_display(), id=req.pk, reason=req.rejection_reason)
+        for template in MESSAGES[req.status]
+    )
+    stamp = int(req.updated_at.timestamp() * 1_000_000)
+    rows = [
+        Notification(
+            request_id=req.pk,
+            channel=channel,
+            recipient=recipient,
+            subject=subject if channel == Channel.EMAIL else "",
+            body=body,
+            dedupe_key=f"{req.pk}:{req.status}:{stamp}:{channel}",
+        )
+        for channel, recipient in _recipients(req).items()
+        if recipient and channel in settings.NOTIFICATIONS["channels"]
+    ]
+    Notification.objects.using(req._state.db or DEFAULT_DB_ALIAS).bulk_create(rows, ignore_conflicts=True)
+
+
+def _claim(alias: str, batch_size: int) -> list[Notification]:
+    now = timezone.now()
+    outbox = Notification.objects.using(alias)
+    with transaction.atomic(using=alias):
+        due = outbox.select_for_update(skip_locked=True).filter(state=State.PENDING, next_attempt_at__lte=now)
+        rows = list(due.order_by("next_attempt_at")[:batch_size])
+        lease = now + timedelta(seconds=settings.NOTIFICATIONS["lease_seconds"])
+        outbox.filter(pk__in=[row.pk for row in rows]).update(next_attempt_at=lease)
+    return rows
+
+
+def _latest(alias: str, rows: list[Notification]) -> dict:
+    """Newest outbox id per (request, channel) among ``rows``' requests."""
+    latest = (
+        Notification.objects.using(alias)
+        .filter(request_id__in={row.request_id for row in rows}, state__in=[State.PENDING, State.SENT])
+        .values("request_id", "channel")
+        .annotate(latest=Max("pk"))
+    )
+    return {(item["request_id"], item["channel"]): item["latest"] for item in latest}
+
+
+def _take_token(channel: str) -> None:
+    rate = parse_rate(settings.NOTIFICATIONS["rates"].get(channel))
+    if rate is None:
+        return
+    capacity, refill_rate = rate
+    while True:
+        allowed, wait = get_bucket_store().consume(f"notifications:{channel}", capacity, refill_rate)
+        if allowed:
+            return
+        time.sleep(wait)
+
+
+def backoff(attempts: int) -> timedelta:
+    config = settings.NOTIFICATIONS
+    delay = min(config["max_backoff_seconds"], config["backoff_seconds"] * 2 ** (attempts - 1))
+    # Jitter, so a gateway outage does not end in every retry at once.
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+class Dispatcher:
+    """Sends claimed outbox rows; one instance per ``dispatch_notifications`` run."""
+
+    def __init__(self, batch_size: int | None = None):
+        self.batch_size = batch_size or settings.NOTIFICATIONS["batch_size"]
+        self.sms = sms.get_backend()
+        self.email = None
+
+    def dispatch_batch(self) -> dict:
+        """Claim and handle one batch per shard; returns the count of rows per outcome."""
+        counts = {"sent": 0, "retried": 0, "failed": 0, "superseded": 0}
+        try:
+            for alias in all_shards():
+                rows = _claim(alias, self.batch_size)
+                if not rows:
+                    continue
+                latest = _latest(alias, rows)
+                for row in rows:
+                    outcome = self._handle(row, latest)
+                    counts[outcome] += 1
+                    metrics.inc("mtaa_notifications_total", (("channel", row.channel), ("outcome", outcome)))
+        finally:
+            self._close_email()
+        return counts
+
+    def _handle(self, row: Notification, latest: dict) -> str:
+        now = timezone.now()
+        if latest.get((row.request_id, row.channel), row.pk) > row.pk:
+            row.state = State.SUPERSEDED
+            row.save(update_fields=["state"])
+            return "superseded"
+
+        row.attempts += 1
+        try:
+            _take_token(row.channel)
+            self._send(row)
+        except Exception as exc:
+            row.last_error = f"{type(exc).__name__}: {exc}"[:1000]
+            if row.attempts >= settings.NOTIFICATIONS["max_attempts"]:
+                row.state = State.FAILED
+                outcome = "failed"
+            else:
+                row.next_attempt_at = now + backoff(row.attempts)
+                outcome = "retried"
+            # The SMTP connection may be what failed; reopen it for the next row.
+            self._close_email()
+        else:
+            row.state = State.SENT
+            row.sent_at = now
+            row.last_error = ""
+            outcome = "sent"
+        row.save(update_fields=["state", "attempts", "next_attempt_at", "last_error", "sent_at"])
+        return outcome
+
+    def _send(self, row: Notification) -> None:
+        if row.channel == Channel.SMS:
+            self.sms.send(row.recipient, row.body)
+            return
+        if self.email is None:
+            self.email = mail.get_connection(fail_silently=False)
+            self.email.open()
+        mail.EmailMessage(row.subject, row.body, to=[row.recipient], connection=self.email).send()
+
+    def _close_email(self) -> None:
+        if self.email is not None:
+            try:
+                self.email.close()
+            except Exception:
+                pass
+            self.email = None
+
+
+def purge_notifications() -> int:
+    cutoff = timezone.now() - settings.NOTIFICATIONS["retention"]
+    deleted = 0
+    for alias in all_shards():
+        count, _ = (
+            Notification.objects.using(alias)
+            .exclude(state=State.PENDING)
+            .filter(created_at__lt=cutoff)
+            .delete()
+        )
+        deleted += count
+    return deleted
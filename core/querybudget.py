@@ -0,0 +1,102 @@
+"""
+Per-view SQL query budgets and N+1 detection for :class:`core.middleware.QueryBudgetMiddleware`.
+
+API views declare ``query_budget``: the most queries one request may run,
+either an int or a dict keyed by HTTP method. The same statement fanned out
+across request shards counts once. Independently of budgets, a statement
+shape (SQL with literals and ``IN`` lists normalised) that repeats
+``repeat_threshold`` times on one database is reported as a likely N+1,
+with the line of project code that issued it.
+"""
+
+import os
+import re
+import traceback
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+# Transaction control is not a query; it shows up as statements for nested atomic blocks, and for
+# every atomic block on SQLite.
+_TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT", "BEGIN")
+# Frames from these files are plumbing, never the call site worth reporting.
+_CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIPPED_FILES = {
+    os.path.join(_CORE_DIR, name) for name in ("querybudget.py", "queryhooks.py", "middleware.py", "metrics.py", "timing.py")
+}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    shape = _STRING.sub("?", sql)
+    shape = _NUMBER.sub("?", shape)
+    shape = _PLACEHOLDER.sub("?", shape)
+    shape = _IN_LIST.sub("IN (...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def call_site() -> str:
+    """The innermost frame of project code (not Django, DRF or this module) on the current stack."""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(base_dir) and "site-packages" not in filename and filename not in _SKIPPED_FILES:
+            return f"{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+class QueryLog:
+    """Database execute wrapper that records statement shapes for one request."""
+
+    def __init__(self, repeat_threshold: int):
+        self.repeat_threshold = repeat_threshold
+        self.budget = None
+        self.view = None
+        self.shapes = Counter()
+        self.repeat_sites = {}
+        self.over_budget_site = None
+        self._most = {}
+        self._counted = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(_TRANSACTION_CONTROL):
+            return execute(sql, params, many, context)
+        alias = context["connection"].alias
+        shape = fingerprint(sql)
+        self.shapes[shape, alias] += 1
+        seen = self.shapes[shape, alias]
+        if seen > self._most.get(shape, 0):
+            # More of this shape than on any other alias: a new query rather than shard fan-out.
+            self._most[shape] = seen
+            self._counted += 1
+            if self.budget is not None and self._counted == self.budget + 1:
+                self.over_budget_site = call_site()
+        if seen == self.repeat_threshold:
+            self.repeat_sites[shape] = call_site()
+        return execute(sql, params, many, context)
+
+    @property
+    def query_count(self) -> int:
+        return self._counted
+
+    def problems(self) -> list[str]:
+        problems = []
+        if self.budget is not None and self._counted > self.budget:
+            problems.append(
+                f"{self.view} ran {self._counted} queries, over its budget of {self.budget}; "
+                f"the first query over budget came from {self.over_budget_site}."
+            )
+        for shape, site in self.repeat_sites.items():
+            repeats = self._most[shape]
+            problems.append(f"{self.view} repeated a query {repeats} times (likely N+1) at {site}: {shape[:200]}")
+        return problems
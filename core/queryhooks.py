@@ -0,0 +1,43 @@
+"""
+Database execute wrappers scoped to a request instead of a connection.
+
+``connection.execute_wrapper()`` only sees queries made through one thread's
+connection. Under ASGI a request's middleware runs on the event loop while
+its queries run on a worker thread, so the request-level wrappers (metrics,
+query budgets, Server-Timing) are kept in a context variable instead, which
+follows the request into ``sync_to_async`` threads. Every connection gets a
+single dispatching wrapper when it connects.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from functools import partial
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+current_wrappers = contextvars.ContextVar("query_wrappers", default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    wrappers = current_wrappers.get()
+    # The first wrapper registered is the outermost, as with nested execute_wrapper() blocks.
+    for wrapper in reversed(wrappers):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created, dispatch_uid="core.queryhooks")
+def install(sender, connection, **kwargs):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+@contextmanager
+def observe_queries(wrapper):
+    """Run ``wrapper`` (an execute wrapper) around every query made in this context, on any alias or thread."""
+    token = current_wrappers.set((*current_wrappers.get(), wrapper))
+    try:
+        yield wrapper
+    finally:
+        current_wrappers.reset(token)
@@ -0,0 +1,143 @@
+"""
+Dependency probes behind ``/readyz/``.
+
+Probes run on a background thread at most once per ``READINESS["ttl"]``
+seconds per worker process; ``/readyz/`` only reads the last results, so
+load-balancer traffic never waits on (or multiplies queries against) the
+database. Results older than ``READINESS["max_age"]`` — e.g. because a probe
+is stuck on an unreachable host — count as failed. A failing non-critical
+probe (a replica, a shard) leaves the instance ready but "degraded". The
+endpoint is public, so it only shows whether each probe passed; failures are
+logged with their reason.
+"""
+
+import logging
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+from . import sharding
+from .signals import SHARD_REFERENCE_MODELS
+
+logger = logging.getLogger(__name__)
+
+_results = {}
+_checked_at = None
+_refreshing = threading.Lock()
+# Applied migrations stay applied for the life of the process, so the plan is only rebuilt until it is empty.
+_migrations_applied = False
+
+
+def probe_database(alias: str) -> None:
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def probe_cache() -> None:
+    key = "readyz:probe"
+    value = str(time.time())
+    cache.set(key, value, 30)
+    if cache.get(key) != value:
+        raise RuntimeError("cache did not return the value just written")
+
+
+def probe_disk() -> None:
+    path = Path(settings.MEDIA_ROOT)
+    # MEDIA_ROOT may not exist until the first upload; check the volume it will live on.
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    free_mb = shutil.disk_usage(path).free / 2**20
+    if free_mb < settings.READINESS["min_free_disk_mb"]:
+        raise RuntimeError(f"{free_mb:.0f} MB free")
+
+
+def probe_shard_copies(alias: str) -> None:
+    """Users and profiles whose copy to ``alias`` failed (see ``core.signals``) break its joins."""
+    missing = [
+        model.__name__
+        for model in SHARD_REFERENCE_MODELS
+        if model._base_manager.using(alias).count() < model._base_manager.using(DEFAULT_DB_ALIAS).count()
+    ]
+    if missing:
+        raise RuntimeError(f"missing {', '.join(missing)} rows; run sync_shard_reference_data")
+
+
+def probe_migrations() -> None:
+    global _migrations_applied
+    if _migrations_applied:
+        return
+    executor = MigrationExecutor(connections[DEFAULT_DB_ALIAS])
+    pending = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    if pending:
+        raise RuntimeError(f"{len(pending)} unapplied migration(s)")
+    _migrations_applied = True
+
+
+def get_probes() -> dict:
+    """Probe name -> (callable, critical). A failing non-critical probe is reported but keeps the instance ready."""
+    probes = {f"db:{alias}": (lambda alias=alias: probe_database(alias), True) for alias in settings.DATABASES}
+    # Reads fall back to the primary when a replica is down; a shard that is down only fails its region's requests.
+    for alias in [*settings.DATABASE_REPLICAS, *settings.DATABASE_SHARDS]:
+        if alias in settings.DATABASES:
+            probes[f"db:{alias}"] = (probes[f"db:{alias}"][0], False)
+    if sharding.enabled():
+        for alias in settings.DATABASE_SHARDS:
+            probes[f"copies:{alias}"] = (lambda alias=alias: probe_shard_copies(alias), False)
+    probes["cache"] = (probe_cache, True)
+    probes["disk"] = (probe_disk, True)
+    probes["migrations"] = (probe_migrations, True)
+    return probes
+
+
+def run_probes() -> dict:
+    results = {}
+    for name, (probe, critical) in get_probes().items():
+        started = time.perf_counter()
+        try:
+            probe()
+        except Exception:
+            # The reason stays in the log: /readyz/ is public.
+            results[name] = {"ok": False, "critical": critical}
+            logger.warning("Readiness probe %s failed", name, exc_info=True)
+        else:
+            results[name] = {"ok": True, "critical": critical}
+        results[name]["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return results
+
+
+def _refresh() -> None:
+    global _results, _checked_at
+    try:
+        _results = run_probes()
+        _checked_at = time.time()
+    finally:
+        connections.close_all()
+        _refreshing.release()
+
+
+def readiness() -> dict:
+    """Return the cached probe results, starting a background refresh when they are due."""
+    now = time.time()
+    due = _checked_at is None or now - _checked_at >= settings.READINESS["ttl"]
+    if due and _refreshing.acquire(blocking=False):
+        threading.Thread(target=_refresh, name="readyz-probes", daemon=True).start()
+
+    if _checked_at is None:
+        return {"ready": False, "status": "starting", "age_seconds": None, "probes": {}}
+    age = now - _checked_at
+    ready = age < settings.READINESS["max_age"] and all(
+        result["ok"] for result in _results.values() if result["critical"]
+    )
+    degraded = not all(result["ok"] for result in _results.values())
+    return {
+        "ready": ready,
+        "status": ("degraded" if degraded else "ready") if ready else "unavailable",
+        "age_seconds": round(age, 3),
+        "probes": {name: {"ok": result["ok"], "critical": result["critical"]} for name, result in _results.items()},
+    }
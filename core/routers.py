@@ -0,0 +1,119 @@
+"""
+Send safe-method reads to read replicas, everything else to the primary.
+
+Reads are routed to a replica only inside a GET/HEAD/OPTIONS request that has
+not written anything, and whose client (keyed by its ``Authorization`` header,
+or its IP) has not written within ``REPLICA_PIN_SECONDS`` — so callers always
+read their own writes. Management commands and other code outside a request
+use the primary. A replica that fails its periodic health check is skipped
+until it passes again.
+"""
+
+import contextvars
+import itertools
+import logging
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .sharedstate import SharedSlots, key_hash
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+PIN_SLOTS = 16384
+
+request_state = contextvars.ContextVar("replica_request_state", default=None)
+
+_health = {}
+_rotation = None
+_pins = None
+
+
+def _get_pins() -> SharedSlots:
+    global _pins
+    if _pins is None:
+        # key hash, time of the client's last write
+        _pins = SharedSlots("replica-pins", "<Qd", PIN_SLOTS)
+    return _pins
+
+
+def pin_key(request) -> str:
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    if authorization:
+        return f"auth:{authorization}"
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    return f"ip:{forwarded.split(',')[0].strip() or request.META.get('REMOTE_ADDR', '')}"
+
+
+def recently_wrote(key: str) -> bool:
+    hashed = key_hash(key)
+    owner, written_at = _get_pins().read(hashed % PIN_SLOTS)
+    return owner == hashed and time.time() - written_at < settings.REPLICA_PIN_SECONDS
+
+
+def record_write(key: str) -> None:
+    pins = _get_pins()
+    hashed = key_hash(key)
+    index = hashed % PIN_SLOTS
+    pins.lock(index)
+    try:
+        pins.write(index, hashed, time.time())
+    finally:
+        pins.unlock(index)
+
+
+def replica_is_healthy(alias: str) -> bool:
+    healthy, checked_at = _health.get(alias, (True, 0.0))
+    now = time.monotonic()
+    if now - checked_at < settings.REPLICA_HEALTH_INTERVAL:
+        return healthy
+    try:
+        connections[alias].ensure_connection()
+        healthy = connections[alias].is_usable()
+    except DatabaseError:
+        healthy = False
+    if not healthy:
+        logger.warning("Read replica %s is unavailable; reading from the primary.", alias)
+    _health[alias] = (healthy, now)
+    return healthy
+
+
+def mark_unhealthy(alias: str) -> None:
+    _health[alias] = (False, time.monotonic())
+
+
+def _next_replica() -> str | None:
+    global _rotation
+    replicas = settings.DATABASE_REPLICAS
+    if _rotation is None:
+        _rotation = itertools.cycle(replicas)
+    for _ in range(len(replicas)):
+        alias = next(_rotation)
+        if replica_is_healthy(alias):
+            return alias
+    return None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = request_state.get()
+        if state is None or not state["safe"] or state["wrote"] or state["pinned"]:
+            return DEFAULT_DB_ALIAS
+        if state["replica"] is None:
+            # One replica per request keeps its reads consistent with each other.
+            state["replica"] = _next_replica() or DEFAULT_DB_ALIAS
+        return state["replica"]
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state is not None:
+            state["wrote"] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
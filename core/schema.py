@@ -0,0 +1,118 @@
+"""
+The OpenAPI schema served at ``/api/schema/``, generated once per code version.
+
+drf-spectacular introspects every view and serializer to build the schema.
+:func:`get_schema` does that at most once per process: it loads the copy
+``manage.py cache_schema`` wrote at build time, or generates and stores one
+on first use, keyed by :func:`code_version`, and keeps the JSON and YAML
+renderings, their gzip versions and ETags in memory.
+"""
+
+import gzip
+import hashlib
+import importlib.metadata
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+
+FORMATS = ("yaml", "json")
+# Libraries whose upgrades change the generated schema.
+SCHEMA_PACKAGES = ("djangorestframework", "djangorestframework-simplejwt", "drf-spectacular")
+SOURCE_PACKAGES = ("backend", "core")
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cache = {}
+
+
+@dataclass(frozen=True)
+class Representation:
+    content: bytes
+    gzipped: bytes
+    etag: str
+    gzip_etag: str
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    """A digest of the project's Python source and the schema libraries' versions."""
+    digest = hashlib.sha256()
+    base_dir = Path(settings.BASE_DIR)
+    for package in SOURCE_PACKAGES:
+        for path in sorted((base_dir / package).rglob("*.py")):
+            digest.update(str(path.relative_to(base_dir)).encode())
+            digest.update(path.read_bytes())
+    for package in SCHEMA_PACKAGES:
+        digest.update(f"{package}=={importlib.metadata.version(package)}".encode())
+    return digest.hexdigest()[:16]
+
+
+def generate() -> dict[str, bytes]:
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    return {
+        "yaml": OpenApiYamlRenderer().render(schema, renderer_context={}),
+        "json": OpenApiJsonRenderer().render(schema, renderer_context={}),
+    }
+
+
+def _path(version: str, fmt: str) -> Path:
+    return Path(settings.OPENAPI_SCHEMA_DIR) / f"schema-{version}.{fmt}"
+
+
+def load(version: str) -> dict[str, bytes] | None:
+    try:
+        return {fmt: _path(version, fmt).read_bytes() for fmt in FORMATS}
+    except OSError:
+        return None
+
+
+def store(version: str, renderings: dict[str, bytes]) -> None:
+    directory = Path(settings.OPENAPI_SCHEMA_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    for fmt, content in renderings.items():
+        # Write then rename, so a worker never reads a half-written file.
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=".schema-")
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(content)
+        os.replace(temporary, _path(version, fmt))
+
+
+def _representation(content: bytes) -> Representation:
+    tag = hashlib.sha256(content).hexdigest()[:32]
+    return Representation(
+        content=content,
+        gzipped=gzip.compress(content, compresslevel=9, mtime=0),
+        # Strong ETags must differ between encodings of the same content.
+        etag=f'"{tag}"',
+        gzip_etag=f'"{tag}-gzip"',
+    )
+
+
+def get_schema() -> dict[str, Representation]:
+    """The schema for the running code, by format (``"json"``, ``"yaml"``)."""
+    version = code_version()
+    representations = _cache.get(version)
+    if representations is None:
+        with _lock:
+            representations = _cache.get(version)
+            if representations is None:
+                renderings = load(version)
+                if renderings is None:
+                    renderings = generate()
+                    try:
+                        store(version, renderings)
+                    except OSError as exc:
+                        logger.warning("Could not store the OpenAPI schema in %s: %s", settings.OPENAPI_SCHEMA_DIR, exc)
+                representations = {fmt: _representation(content) for fmt, content in renderings.items()}
+                _cache[version] = representations
+    return representations
+
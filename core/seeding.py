@@ -0,0 +1,222 @@
+"""
+Deterministic synthetic data for load and performance testing (``manage.py seed_load``).
+
+Rows are generated in fixed chunks of ``CHUNK`` rows, each from its own
+``random.Random`` seeded with the run's seed, the row kind and the chunk
+number, so a row's content depends only on the seed and its index — not on
+the batch size or on how many earlier runs were interrupted. Seeded accounts
+use the ``SEED_EMAIL_DOMAIN`` e-mail domain, which is also how a re-run finds
+how far the previous one got.
+"""
+
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from .models import CitizenProfile, OfficerProfile, User, VerificationRequest
+
+CHUNK = 1000
+SEED_EMAIL_DOMAIN = "seed.mtaa.test"
+
+FIRST_NAMES = [
+    "Asha", "Baraka", "Neema", "Juma", "Rehema", "Emmanuel", "Zawadi", "Daudi", "Upendo", "Hamisi",
+    "Mwanaisha", "Petro", "Faraja", "Salum", "Grace", "Yusufu", "Halima", "Joseph", "Tumaini", "Mariam",
+]
+LAST_NAMES = [
+    "Mollel", "Mushi", "Kimaro", "Magesa", "Nyerere", "Wambura", "Mwita", "Chacha", "Marwa", "Masanja",
+    "Mwakyusa", "Msuya", "Massawe", "Kisanga", "Mbwambo", "Nyamhanga", "Ryoba", "Mgaya", "Okello", "Lema",
+]
+# (ward, mtaa) pairs in Musoma Municipal.
+LOCALITIES = [
+    ("Mwigobero", "Kusaga"), ("Mwigobero", "Nyarigamba"), ("Kamunyonge", "Bweri"), ("Kitaji", "Kitaji A"),
+    ("Nyasho", "Nyasho Kati"), ("Mukendo", "Mukendo"), ("Iringo", "Iringo Juu"), ("Buhare", "Buhare"),
+    ("Makoko", "Makoko"), ("Nyakato", "Nyakato"), ("Rwamlimi", "Rwamlimi"), ("Kigera", "Kigera"),
+]
+REGIONS = [("Mara", "Musoma", 0.86), ("Mwanza", "Ilemela", 0.09), ("Dar es Salaam", "Kinondoni", 0.05)]
+OCCUPATIONS = ["Mkulima", "Mfanyabiashara", "Mwalimu", "Mvuvi", "Dereva", "Fundi", "Mwanafunzi", "Muuguzi"]
+PURPOSES = [
+    "Kufungua akaunti ya benki",
+    "Maombi ya kazi",
+    "Usajili wa laini ya simu",
+    "Maombi ya mkopo",
+    "Usajili wa NIDA",
+    "Maombi ya leseni ya biashara",
+    "Udahili wa chuo",
+]
+REJECTION_REASONS = [
+    "Taarifa za makazi hazijakamilika.",
+    "Namba ya NIDA haijathibitishwa.",
+    "Mwombaji hajulikani katika mtaa huu.",
+    "Nyaraka zilizoambatishwa hazisomeki.",
+]
+POSITIONS = ["Mtendaji wa Mtaa", "Afisa Mtendaji wa Kata", "Mwenyekiti wa Mtaa"]
+
+REQUEST_TYPES = [
+    (VerificationRequest.RequestType.RESIDENCE, 0.6),
+    (VerificationRequest.RequestType.NIDA, 0.3),
+    (VerificationRequest.RequestType.LICENSE, 0.1),
+]
+URGENT_SHARE = 0.12
+EAT_OFFSET = timedelta(hours=3)
+
+
+def seed_email(kind: str, index: int) -> str:
+    return f"{kind}-{index:08d}@{SEED_EMAIL_DOMAIN}"
+
+
+def seed_index(email: str) -> int:
+    return int(email.split("@")[0].rsplit("-", 1)[1])
+
+
+def chunk_rng(seed: int, kind: str, chunk: int) -> random.Random:
+    return random.Random(f"{seed}:{kind}:{chunk}")
+
+
+def _weighted(rng: random.Random, choices):
+    point = rng.random()
+    for value, weight in choices:
+        point -= weight
+        if point < 0:
+            return value
+    return choices[-1][0]
+
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _phone(rng: random.Random) -> str:
+    return f"0{rng.choice('67')}{rng.randrange(10**8):08d}"
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let ``bulk_create`` keep the ``created_at``/``updated_at`` values set on the rows."""
+    toggled = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            for flag in ("auto_now", "auto_now_add"):
+                if getattr(field, flag, False):
+                    setattr(field, flag, False)
+                    toggled.append((field, flag))
+    try:
+        yield
+    finally:
+        for field, flag in toggled:
+            setattr(field, flag, True)
+
+
+def rows(seed: int, kind: str, start: int, stop: int, build):
+    """Yield ``build(rng, index)`` for indexes ``start <= index < stop``, chunk by chunk."""
+    for chunk in range(start // CHUNK, (stop + CHUNK - 1) // CHUNK):
+        rng = chunk_rng(seed, kind, chunk)
+        for index in range(chunk * CHUNK, min((chunk + 1) * CHUNK, stop)):
+            # Draw every row of the chunk, even skipped ones, so later rows do not shift.
+            row = build(rng, index)
+            if index >= start:
+                yield row
+
+
+def build_citizen(password_hash: str, now: datetime):
+    def build(rng: random.Random, index: int):
+        joined = now - timedelta(days=rng.triangular(0, 730, 0), seconds=rng.randrange(86400))
+        ward, mtaa = rng.choice(LOCALITIES)
+        user = User(
+            email=seed_email("citizen", index),
+            full_name=_name(rng),
+            password=password_hash,
+            role=User.Role.CITIZEN,
+            date_joined=joined,
+        )
+        profile = CitizenProfile(
+            phone=_phone(rng),
+            gender=rng.choice(CitizenProfile.Gender.values),
+            age=min(18 + int(rng.expovariate(1 / 17)), 95),
+            address=f"Mtaa wa {mtaa}, Kata ya {ward}",
+            nida_number=f"{rng.randrange(10**19, 10**20)}" if rng.random() < 0.8 else "",
+            created_at=joined,
+            updated_at=joined,
+        )
+        return user, profile
+
+    return build
+
+
+def build_officer(password_hash: str, now: datetime):
+    def build(rng: random.Random, index: int):
+        ward, mtaa = rng.choice(LOCALITIES)
+        user = User(
+            email=seed_email("officer", index),
+            full_name=_name(rng),
+            password=password_hash,
+            role=User.Role.OFFICER,
+            date_joined=now - timedelta(days=730),
+        )
+        profile = OfficerProfile(
+            phone=_phone(rng),
+            position=rng.choice(POSITIONS),
+            office=f"Ofisi ya Mtaa wa {mtaa}, Kata ya {ward}",
+            created_at=user.date_joined,
+            updated_at=user.date_joined,
+        )
+        return user, profile
+
+    return build
+
+
+def build_request(citizen_ids, officer_ids, days: int, now: datetime):
+    def build(rng: random.Random, index: int) -> VerificationRequest:
+        # Volume grows towards the present; submissions happen in office hours.
+        day = now - timedelta(days=int(rng.triangular(0, days, 0)))
+        hour = rng.choice((8, 9, 9, 10, 10, 11, 12, 14, 15, 16))
+        created = day.replace(hour=hour, minute=rng.randrange(60)) - EAT_OFFSET
+        created = min(created, now - timedelta(minutes=1))
+        age_days = (now - created).days
+
+        if age_days < 2:
+            status = _weighted(rng, [("pending", 0.7), ("approved", 0.22), ("rejected", 0.08)])
+        else:
+            status = _weighted(rng, [("approved", 0.78), ("rejected", 0.14), ("pending", 0.08)])
+        decided_at = None
+        decided_by = None
+        if status != "pending":
+            decided_at = min(created + timedelta(hours=rng.triangular(1, 120, 6)), now)
+            decided_by = rng.choice(officer_ids)
+
+        region, district, _ = _weighted(rng, [(entry, entry[2]) for entry in REGIONS])
+        ward, mtaa = rng.choice(LOCALITIES)
+        return VerificationRequest(
+            citizen_id=rng.choice(citizen_ids),
+            request_type=_weighted(rng, REQUEST_TYPES),
+            purpose=rng.choice(PURPOSES),
+            additional_info="" if rng.random() < 0.7 else "Naomba huduma ya haraka.",
+            metadata={
+                "reference_no": f"SM/SN/{mtaa[:2].upper()}/{index:07d}",
+                "to": "Yeyote Anayehusika",
+                "ward": ward,
+                "mtaa": mtaa,
+                "region": region,
+                "district": district,
+                "house_no": str(rng.randrange(1, 400)),
+                "birth_date": f"{rng.randrange(1, 29):02d}/{rng.randrange(1, 13):02d}/{rng.randrange(1950, 2007)}",
+                "occupation": rng.choice(OCCUPATIONS),
+                "stay_duration": f"{rng.randrange(1, 30)} years",
+                "letter_date": created.strftime("%d/%m/%Y"),
+            },
+            urgency="urgent" if rng.random() < URGENT_SHARE else "normal",
+            status=status,
+            rejection_reason=rng.choice(REJECTION_REASONS) if status == "rejected" else "",
+            decided_by_id=decided_by,
+            decided_at=decided_at,
+            created_at=created,
+            updated_at=decided_at or created,
+        )
+
+    return build
+
+
+def seed_start(seed_time: str | None) -> datetime:
+    """The fixed "now" the data is generated around (UTC midnight today unless given)."""
+    if seed_time:
+        return datetime.fromisoformat(seed_time).replace(tzinfo=dt_timezone.utc)
+    return datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
@@ -1,7 +1,20 @@
 from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import CitizenProfile, OfficerProfile, User, VerificationRequest
+from .models import Attachment, CitizenProfile, OfficerProfile, User, VerificationRequest
+
+
+class SparseFieldsMixin:
+    """Accept ``fields``/``exclude`` keyword arguments that drop unrequested fields."""
+
+    def __init__(self, *args, fields=None, exclude=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in exclude or ():
+            self.fields.pop(name, None)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -108,7 +121,7 @@ class PasswordChangeSerializer(serializers.Serializer):
         return attrs
 
 
-class VerificationRequestSerializer(serializers.ModelSerializer):
+class VerificationRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     citizen_id = serializers.IntegerField(source="citizen.id", read_only=True)
     citizen_name = serializers.CharField(source="citizen.full_name", read_only=True)
     citizen_email = serializers.EmailField(source="citizen.email", read_only=True)
@@ -220,6 +233,102 @@ class VerificationRequestSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class VerificationRequestProjection:
+    """
+    Serialize read-only request lists straight from ``values()`` rows.
+
+    Produces the same output as :class:`VerificationRequestSerializer` for the
+    selected fields, but selects only the needed columns, joins the citizen and
+    profile tables only when their fields are requested and skips DRF's
+    per-field machinery.
+    """
+
+    sources = {
+        "id": "id",
+        "request_type": "request_type",
+        "purpose": "purpose",
+        "additional_info": "additional_info",
+        "metadata": "metadata",
+        "urgency": "urgency",
+        "status": "status",
+        "rejection_reason": "rejection_reason",
+        "decided_at": "decided_at",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+        "citizen_id": "citizen_id",
+        "citizen_name": "citizen__full_name",
+        "citizen_email": "citizen__email",
+        "citizen_phone": "citizen__citizen_profile__phone",
+        "citizen_address": "citizen__citizen_profile__address",
+        "citizen_gender": "citizen__citizen_profile__gender",
+        "citizen_age": "citizen__citizen_profile__age",
+        "citizen_nida": "citizen__citizen_profile__nida_number",
+    }
+    # What the serializer returns for citizens without a profile.
+    profile_defaults = {
+        "citizen_phone": "",
+        "citizen_address": "",
+        "citizen_gender": "",
+        "citizen_nida": "",
+    }
+    datetime_fields = {"decided_at", "created_at", "updated_at"}
+
+    def __init__(self, fields=None):
+        self.fields = [name for name in VerificationRequestSerializer.Meta.fields if fields is None or name in fields]
+
+    def project(self, queryset):
+        # id and created_at are always selected so shard results can be merged in order.
+        columns = {"id", "created_at", *(self.sources[name] for name in self.fields)}
+        return queryset.values(*columns)
+
+    def trim(self, queryset):
+        """Restrict a model queryset to the columns and joins the serializer needs."""
+        columns = {"id", "citizen"}
+        related = set()
+        for name in self.fields:
+            source = self.sources[name]
+            if name == "citizen_id":
+                related.add("citizen")
+                columns.add("citizen__id")
+            elif "__" in source:
+                related.add(source.rsplit("__", 1)[0])
+                columns.add(source)
+            else:
+                columns.add(source)
+        return queryset.select_related(*related).only(*columns)
+
+    def to_representation(self, rows) -> list[dict]:
+        plan = [
+            (
+                name,
+                self.sources[name],
+                name in self.datetime_fields,
+                self.profile_defaults.get(name),
+            )
+            for name in self.fields
+        ]
+        output = []
+        for row in rows:
+            item = {}
+            for name, source, is_datetime, default in plan:
+                value = row[source]
+                if value is None:
+                    value = default
+                elif is_datetime:
+                    value = timezone.localtime(value).isoformat()
+                    if value.endswith("+00:00"):
+                        value = value[:-6] + "Z"
+                item[name] = value
+            output.append(item)
+        return output
+
+
 class CitizenDetailSerializer(serializers.Serializer):
     user = UserSerializer()
     profile = CitizenProfileSerializer(allow_null=True)
+
+
+class AttachmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Attachment
+        fields = ("id", "filename", "content_type", "size", "sha256", "thumbnail", "created_at")
@@ -0,0 +1,186 @@
+"""
+Region-based horizontal sharding of verification requests.
+
+``REQUEST_SHARDS`` maps a region slug (from a request's ``metadata["region"]``)
+to a database alias listed in ``DATABASE_SHARDS``; unmapped regions stay on
+``default``. ``VerificationRequest`` rows, their ``RequestTombstone`` events,
+their outbox ``Notification`` rows and their ``Attachment`` rows live on their
+shard, as do ``IdempotencyKey`` rows for calls that write there. Everything
+else lives on ``default``; users and their profiles are
+copied to every shard so the citizen/profile joins used by the serializers
+keep working there.
+
+Each shard hands out request ids from its own range, ``SHARD_NUMBERS[alias]``
+times ``SHARD_ID_SPAN`` (seeded by migration ``0005``), so a request id alone
+identifies its shard.
+Lists and counts that span shards are answered by scatter-gather.
+"""
+
+import contextvars
+import heapq
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.text import slugify
+
+# Must match the offsets seeded by migration 0005_shard_id_offsets.
+SHARD_ID_SPAN = 10**12
+SHARDED_MODELS = {"verificationrequest", "requesttombstone", "notification", "attachment", "idempotencykey"}
+# Routes whose ``pk`` is a VerificationRequest id.
+REQUEST_PK_ROUTES = {
+    "request-detail",
+    "request-resubmit",
+    "request-download",
+    "request-approve",
+    "request-reject",
+    "request-reopen",
+    "request-attachments",
+    "request-attachment",
+    "request-attachment-thumbnail",
+}
+
+current_shard = contextvars.ContextVar("current_shard", default=None)
+
+
+def enabled() -> bool:
+    return bool(settings.REQUEST_SHARDS)
+
+
+def all_shards() -> list[str]:
+    if not enabled():
+        return [DEFAULT_DB_ALIAS]
+    return [DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS]
+
+
+def shard_for_region(region) -> str:
+    if not region:
+        return DEFAULT_DB_ALIAS
+    return settings.REQUEST_SHARDS.get(slugify(str(region)), DEFAULT_DB_ALIAS)
+
+
+def shard_for_pk(pk) -> str:
+    number = int(pk) // SHARD_ID_SPAN
+    if not enabled() or number == 0:
+        return DEFAULT_DB_ALIAS
+    for alias in settings.DATABASE_SHARDS:
+        if settings.SHARD_NUMBERS.get(alias) == number:
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def shard_for_route(match) -> str | None:
+    if not enabled() or match is None or match.url_name not in REQUEST_PK_ROUTES:
+        return None
+    try:
+        return shard_for_pk(match.kwargs["pk"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+@contextmanager
+def using_shard(alias: str | None):
+    token = current_shard.set(alias)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+class ShardRouter:
+    def _shard_for(self, model, hints) -> str | None:
+        if model._meta.model_name not in SHARDED_MODELS:
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._meta.model_name in SHARDED_MODELS:
+            if instance._state.db:
+                return instance._state.db
+            if instance._meta.model_name == "verificationrequest":
+                return shard_for_region((instance.metadata or {}).get("region"))
+            return shard_for_pk(instance.request_id)
+        return current_shard.get() or DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        return self._shard_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users and profiles are replicated to every shard.
+        return True
+
+
+class ScatterGather:
+    """
+    Ordered, read-only union of one queryset per shard.
+
+    Supports ``count()`` and slicing, which is all the paginator needs. A
+    slice ``[start:stop]`` fetches at most ``stop`` rows from each shard and
+    merges them on ``key`` (newest first by default).
+    """
+
+    ordered = True
+
+    def __init__(self, queryset, key, reverse: bool = True):
+        self.querysets = [queryset.using(alias) for alias in all_shards()]
+        self.key = key
+        self.reverse = reverse
+
+    def count(self) -> int:
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def _merged(self, stop=None):
+        parts = [list(queryset if stop is None else queryset[:stop]) for queryset in self.querysets]
+        return heapq.merge(*parts, key=self.key, reverse=self.reverse)
+
+    def __iter__(self):
+        return iter(self._merged())
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(islice(self._merged(item.stop), item.start or 0, item.stop))
+        return next(islice(self._merged(item + 1), item, None))
+
+    async def acount(self) -> int:
+        return sum([await queryset.acount() for queryset in self.querysets])
+
+    async def aslice(self, start: int = 0, stop: int | None = None) -> list:
+        parts = [[row async for row in queryset[:stop]] for queryset in self.querysets]
+        return list(islice(heapq.merge(*parts, key=self.key, reverse=self.reverse), start, stop))
+
+
+def scatter(queryset, key=lambda row: (row["created_at"], row["id"]), reverse: bool = True):
+    """Spread a ``values()`` queryset over every shard (or return it as-is when unsharded)."""
+    if not enabled():
+        return queryset
+    return ScatterGather(queryset, key, reverse)
+
+
+def count_all(queryset) -> int:
+    return sum(queryset.using(alias).count() for alias in all_shards())
+
+
+async def acount_all(queryset) -> int:
+    return sum([await queryset.using(alias).acount() for alias in all_shards()])
+
+
+def replicate(instance) -> None:
+    """Copy a user or profile row from ``default`` to every shard."""
+    model = type(instance)
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+    }
+    for alias in settings.DATABASE_SHARDS:
+        model._base_manager.using(alias).update_or_create(pk=instance.pk, defaults=values)
+
+
+def delete_replicas(model, pk) -> None:
+    for alias in settings.DATABASE_SHARDS:
+        model._base_manager.using(alias).filter(pk=pk).delete()
@@ -0,0 +1,89 @@
+"""
+Fixed-size records in a memory-mapped file shared by every worker process.
+
+Gunicorn forks several workers per instance and we have no Redis on our plan,
+so state that must be consistent across workers (rate-limit buckets, load
+shedding counters) lives in a small file under ``SHARED_STATE_DIR``. Each
+record is updated under a POSIX byte-range lock, so updates are atomic across
+processes without serialising unrelated records.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: state is per process.
+    fcntl = None
+
+_THREAD_LOCK_STRIPES = 64
+
+
+def shared_state_dir() -> str:
+    directory = getattr(settings, "SHARED_STATE_DIR", "")
+    if not directory:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        directory = os.path.join(base, "mtaa-connect")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def pid_alive(pid: int) -> bool:
+    """Whether process ``pid`` still exists (on this host: pids are per namespace)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def key_hash(key: str) -> int:
+    """Stable, non-zero 64-bit hash of ``key`` (Python's ``hash`` is per process)."""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class SharedSlots:
+    def __init__(self, name: str, record_format: str, slots: int):
+        self.record = struct.Struct(record_format)
+        self.slots = slots
+        self.size = self.record.size * slots
+        self._thread_locks = [threading.Lock() for _ in range(_THREAD_LOCK_STRIPES)]
+        self._fd = None
+
+        if fcntl is None:
+            self._map = mmap.mmap(-1, self.size)
+            return
+
+        # The layout is part of the file name so a deploy that changes the
+        # record format never reads records written by the previous release.
+        layout = hashlib.blake2b(f"{record_format}:{slots}".encode(), digest_size=4).hexdigest()
+        path = os.path.join(shared_state_dir(), f"{name}-{layout}.bin")
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < self.size:
+            os.ftruncate(self._fd, self.size)
+        self._map = mmap.mmap(self._fd, self.size)
+
+    def lock(self, index: int) -> None:
+        self._thread_locks[index % _THREAD_LOCK_STRIPES].acquire()
+        if self._fd is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.record.size, index * self.record.size)
+
+    def unlock(self, index: int) -> None:
+        if self._fd is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self.record.size, index * self.record.size)
+        self._thread_locks[index % _THREAD_LOCK_STRIPES].release()
+
+    def read(self, index: int) -> tuple:
+        return self.record.unpack_from(self._map, index * self.record.size)
+
+    def write(self, index: int, *values) -> None:
+        self.record.pack_into(self._map, index * self.record.size, *values)
@@ -0,0 +1,37 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import sharding, verification
+from .models import CitizenProfile, OfficerProfile, RequestTombstone, User, VerificationRequest
+from .sync import record_tombstone
+
+SHARD_REFERENCE_MODELS = (User, CitizenProfile, OfficerProfile)
+
+
+@receiver(post_delete, sender=VerificationRequest)
+def tombstone_deleted_request(sender, instance, **kwargs):
+    record_tombstone(instance, RequestTombstone.Reason.DELETED)
+
+
+@receiver(post_delete, sender=VerificationRequest)
+def revoke_deleted_letter(sender, instance, using, **kwargs):
+    if instance.status == VerificationRequest.Status.APPROVED:
+        verification.revoke(instance.pk, verification.decision_time(instance), using=using)
+
+
+def replicate_to_shards(sender, instance, using, **kwargs):
+    if sharding.enabled() and using == DEFAULT_DB_ALIAS:
+        # robust: a failed copy is logged and reported by /readyz/, not turned into an error for a saved row.
+        transaction.on_commit(lambda: sharding.replicate(instance), using=using, robust=True)
+
+
+def delete_from_shards(sender, instance, using, **kwargs):
+    if sharding.enabled() and using == DEFAULT_DB_ALIAS:
+        pk = instance.pk
+        transaction.on_commit(lambda: sharding.delete_replicas(sender, pk), using=using, robust=True)
+
+
+for _model in SHARD_REFERENCE_MODELS:
+    post_save.connect(replicate_to_shards, sender=_model, dispatch_uid=f"replicate-{_model.__name__}")
+    post_delete.connect(delete_from_shards, sender=_model, dispatch_uid=f"unreplicate-{_model.__name__}")
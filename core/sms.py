@@ -0,0 +1,56 @@
+"""
+SMS backends for the notification dispatcher, chosen by ``SMS_BACKEND``.
+
+Like Django's e-mail backends: ``HttpBackend`` posts to the gateway at
+``SMS_GATEWAY_URL``, ``ConsoleBackend`` logs messages instead of sending
+them (the default when no gateway is configured) and ``LocmemBackend`` keeps
+them in ``outbox``, the fake sink used by the tests.
+"""
+
+import json
+import logging
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class SMSError(Exception):
+    pass
+
+
+class HttpBackend:
+    """POSTs ``{"to", "message", "sender"}`` as JSON with the ``SMS_GATEWAY_TOKEN`` bearer token."""
+
+    def send(self, to: str, message: str) -> None:
+        payload = json.dumps({"to": to, "message": message, "sender": settings.SMS_SENDER_ID}).encode()
+        request = urllib.request.Request(
+            settings.SMS_GATEWAY_URL,
+            data=payload,
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {settings.SMS_GATEWAY_TOKEN}"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=settings.SMS_GATEWAY_TIMEOUT):
+                pass
+        except (urllib.error.URLError, OSError) as exc:
+            raise SMSError(f"SMS gateway request failed: {exc}") from exc
+
+
+class ConsoleBackend:
+    def send(self, to: str, message: str) -> None:
+        logger.info("SMS to %s: %s", to, message)
+
+
+class LocmemBackend:
+    outbox = []
+
+    def send(self, to: str, message: str) -> None:
+        self.outbox.append({"to": to, "message": message})
+
+
+def get_backend():
+    return import_string(settings.SMS_BACKEND)()
@@ -0,0 +1,157 @@
+"""
+Delta sync for offline-first clients (``GET /api/sync/?since=<cursor>``).
+
+A citizen's scope is their own requests; an officer's scope is the pending
+queue. The response lists rows created or changed since the cursor and the
+ids of rows that left the scope, taken from ``RequestTombstone``. Cursors are
+opaque to clients: a microsecond timestamp taken before the queries run.
+Each sync looks back ``SYNC_CLOCK_SKEW`` before the cursor so rows committed
+by slower transactions are not missed; clients upsert by id, so the overlap
+is harmless.
+
+Changed rows come in pages of at most ``limit``, oldest change first. When
+more are left (``has_more``), the cursor is a :class:`Continuation` that picks
+up after the last row sent, with no look-back. The cursor after the last page
+is the time the first page started, so anything changed while the client was
+paging is sent again on its next sync. Removals are sent with the first page.
+"""
+
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import RequestTombstone, User, VerificationRequest
+from .sharding import all_shards
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Continuation(NamedTuple):
+    """Where the next page of a sync starts: after the row at ``(updated_at, pk)``."""
+
+    started: datetime
+    updated_at: datetime
+    pk: int
+
+
+def _micros(moment: datetime) -> int:
+    return (moment - EPOCH) // MICROSECOND
+
+
+def _moment(micros: int) -> datetime:
+    return EPOCH + micros * MICROSECOND
+
+
+def encode_cursor(moment: datetime | Continuation) -> str:
+    if isinstance(moment, Continuation):
+        return f"{_micros(moment.started)}.{_micros(moment.updated_at)}.{moment.pk}"
+    return str(_micros(moment))
+
+
+def decode_cursor(cursor: str) -> datetime | Continuation:
+    try:
+        parts = [int(part) for part in cursor.split(".")]
+        if len(parts) == 1:
+            return _moment(parts[0])
+        if len(parts) == 3:
+            return Continuation(_moment(parts[0]), _moment(parts[1]), parts[2])
+    except (ValueError, OverflowError) as exc:
+        raise InvalidCursor(cursor) from exc
+    raise InvalidCursor(cursor)
+
+
+def record_tombstone(req: VerificationRequest, reason: str) -> None:
+    # Tombstones live next to their request, on its shard.
+    RequestTombstone.objects.using(req._state.db or DEFAULT_DB_ALIAS).create(request_id=req.pk, citizen_id=req.citizen_id, reason=reason)
+
+
+def purge_tombstones() -> int:
+    cutoff = timezone.now() - settings.SYNC_TOMBSTONE_RETENTION
+    deleted = 0
+    for alias in all_shards():
+        count, _ = RequestTombstone.objects.using(alias).filter(created_at__lt=cutoff).delete()
+        deleted += count
+    return deleted
+
+
+def _scope(user: User, since: datetime | Continuation | None, limit: int):
+    now = timezone.now()
+    resume = since if isinstance(since, Continuation) else None
+    if resume is not None:
+        since = None
+    oldest = resume.started if resume is not None else since
+    if oldest is not None and oldest < now - settings.SYNC_TOMBSTONE_RETENTION:
+        # Tombstones this old may already be purged; the client must start over.
+        resume = since = None
+    started = resume.started if resume is not None else now
+
+    if user.role == User.Role.CITIZEN:
+        changed = VerificationRequest.objects.filter(citizen=user)
+        tombstones = RequestTombstone.objects.filter(
+            citizen_id=user.pk,
+            reason=RequestTombstone.Reason.DELETED,
+        )
+    else:
+        changed = VerificationRequest.objects.filter(status=VerificationRequest.Status.PENDING)
+        tombstones = RequestTombstone.objects.all()
+
+    if since is not None:
+        window_start = since - settings.SYNC_CLOCK_SKEW
+        changed = changed.filter(updated_at__gt=window_start)
+        tombstones = tombstones.filter(created_at__gt=window_start).values_list("request_id", flat=True)
+    if resume is not None:
+        changed = changed.filter(
+            Q(updated_at__gt=resume.updated_at) | Q(updated_at=resume.updated_at, pk__gt=resume.pk)
+        )
+    changed = changed.select_related("citizen__citizen_profile").order_by("updated_at", "pk")[: limit + 1]
+    return started, since, resume, changed, tombstones
+
+
+def _delta(started: datetime, since, resume, parts: list[list], removed: set, limit: int) -> dict:
+    changed = list(islice(heapq.merge(*parts, key=lambda row: (row.updated_at, row.pk)), limit + 1))
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+    if has_more:
+        cursor = Continuation(started, changed[-1].updated_at, changed[-1].pk)
+    else:
+        cursor = started
+    return {
+        "cursor": encode_cursor(cursor),
+        "full": since is None and resume is None,
+        "has_more": has_more,
+        "changed": changed,
+        "removed": sorted(removed - {row.pk for row in changed}),
+    }
+
+
+def changes_since(user: User, since: datetime | Continuation | None, limit: int) -> dict:
+    """Return a page of changed rows and the removed ids for ``user``'s scope."""
+    started, since, resume, changed, tombstones = _scope(user, since, limit)
+    removed = set()
+    if since is not None:
+        for alias in all_shards():
+            removed.update(tombstones.using(alias))
+    parts = [list(changed.using(alias)) for alias in all_shards()]
+    return _delta(started, since, resume, parts, removed, limit)
+
+
+async def achanges_since(user: User, since: datetime | Continuation | None, limit: int) -> dict:
+    """:func:`changes_since` through the async ORM."""
+    started, since, resume, changed, tombstones = _scope(user, since, limit)
+    removed = set()
+    if since is not None:
+        for alias in all_shards():
+            removed.update([pk async for pk in tombstones.using(alias)])
+    parts = [[row async for row in changed.using(alias)] for alias in all_shards()]
+    return _delta(started, since, resume, parts, removed, limit)
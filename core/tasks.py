@@ -0,0 +1,63 @@
+"""Tasks run by the background workers (core/jobs.py)."""
+
+from . import attachments, letters
+from .events import purge_events
+from .idempotency import purge_idempotency_keys
+from .jobs import purge_jobs, task
+from .models import VerificationRequest
+from .notifications import purge_notifications
+from .sharding import shard_for_pk
+from .sync import purge_tombstones
+
+
+@task("letters.prerender")
+def prerender_letter(request_id: int) -> None:
+    req = (
+        VerificationRequest.objects.using(shard_for_pk(request_id))
+        .select_related("citizen__citizen_profile")
+        .filter(pk=request_id, status=VerificationRequest.Status.APPROVED)
+        .first()
+    )
+    # Reopened or deleted since it was approved: nothing to pre-render.
+    if req is not None:
+        letters.prerender(req)
+
+
+@task("attachments.thumbnail")
+def attachment_thumbnail(sha256: str) -> None:
+    attachments.make_thumbnail(sha256)
+
+
+@task("cleanup.sync_tombstones")
+def cleanup_sync_tombstones() -> None:
+    purge_tombstones()
+
+
+@task("cleanup.request_events")
+def cleanup_request_events() -> None:
+    purge_events()
+
+
+@task("cleanup.notifications")
+def cleanup_notifications() -> None:
+    purge_notifications()
+
+
+@task("cleanup.idempotency_keys")
+def cleanup_idempotency_keys() -> None:
+    purge_idempotency_keys()
+
+
+@task("cleanup.letters")
+def cleanup_letters() -> None:
+    letters.purge_cached_letters()
+
+
+@task("cleanup.jobs")
+def cleanup_jobs() -> None:
+    purge_jobs()
+
+
+@task("cleanup.attachments")
+def cleanup_attachments() -> None:
+    attachments.purge_orphans()
@@ -1,3 +1,1863 @@
-from django.test import TestCase
+import gzip
+import itertools
+import json
+import io
+import multiprocessing
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+from pathlib import Path
+from datetime import timedelta
+import threading
+import time
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import attachments, background, benchmarks, checks, events, jobs, loadtest, metrics, notifications, queryhooks, readiness, routers, schema, sharding, sms, throttling, verification, warmup
+from .concurrency import ConcurrencyLimiter, get_limiter
+from .dbpool import ConnectionPool, PoolTimeout
+from .querybudget import QueryBudgetExceeded, QueryLog, fingerprint
+from .serializers import VerificationRequestSerializer
+from .sync import decode_cursor
+from .models import (
+    Attachment,
+    CitizenProfile,
+    IdempotencyKey,
+    Job,
+    Notification,
+    RequestEvent,
+    RevokedLetter,
+    User,
+    VerificationRequest,
+)
+
+REPLICA_ROUTER = ["core.routers.PrimaryReplicaRouter"]
+SHARD_ROUTER = ["core.sharding.ShardRouter"]
+REQUEST_SHARDS = {"mara": "shard_mara", "mwanza": "shard_mwanza"}
+# Read-your-writes pins are shared across tests, so every test gets its own client IPs.
+_client_ips = (f"10.0.{index // 250}.{index % 250 + 1}" for index in itertools.count())
+
+
+def _drain_bucket(key):
+    throttling.get_bucket_store().consume(key, 2, 2 / 60)
+    throttling.get_bucket_store().consume(key, 2, 2 / 60)
+
+
+@override_settings(RATE_LIMITS={"default": {"ip": "100/min"}, "me": {"ip": "2/min"}})
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+
+    def client_for(self, ip):
+        client = APIClient(REMOTE_ADDR=ip)
+        client.force_authenticate(self.citizen)
+        return client
+
+    def test_callers_over_the_limit_are_told_when_to_retry(self):
+        client = self.client_for(next(_client_ips))
+        self.assertEqual([client.get("/api/me/").status_code for _ in range(2)], [200, 200])
+        response = client.get("/api/me/")
+        self.assertEqual(response.status_code, 429)
+        # One token comes back every 30 seconds.
+        self.assertTrue(0 < int(response["Retry-After"]) <= 30)
+        # Other routes and other clients have their own buckets.
+        self.assertEqual(client.get("/api/requests/").status_code, 200)
+        self.assertEqual(self.client_for(next(_client_ips)).get("/api/me/").status_code, 200)
+
+    def test_spoofed_forwarded_addresses_share_the_callers_bucket(self):
+        ip = next(_client_ips)
+        client = self.client_for("10.255.0.1")
+        for spoofed in ("203.0.113.1", "203.0.113.2"):
+            response = client.get("/api/me/", HTTP_X_FORWARDED_FOR=f"{spoofed}, {ip}")
+            self.assertEqual(response.status_code, 200)
+        response = client.get("/api/me/", HTTP_X_FORWARDED_FOR=f"203.0.113.3, {ip}")
+        self.assertEqual(response.status_code, 429)
+
+    def test_buckets_are_shared_across_processes(self):
+        ip = next(_client_ips)
+        child = multiprocessing.get_context("fork").Process(target=_drain_bucket, args=(f"ip:{ip}:me",))
+        child.start()
+        child.join()
+        self.assertEqual(self.client_for(ip).get("/api/me/").status_code, 429)
+
+
+class LoadSheddingTests(TestCase):
+    def setUp(self):
+        citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(citizen)
+
+    def test_requests_over_the_class_limit_are_shed(self):
+        limiter = get_limiter()
+        position = limiter.class_for_route("me")
+        held = 0
+        while limiter.acquire(position):
+            held += 1
+        try:
+            response = self.client.get("/api/me/")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], "1")
+            # Other classes still admit requests.
+            self.assertEqual(self.client.get("/api/requests/").status_code, 200)
+        finally:
+            for _ in range(held):
+                limiter.release(position, 0.0, failed=False)
+        self.assertEqual(self.client.get("/api/me/").status_code, 200)
+
+    def test_requests_that_queued_too_long_are_shed(self):
+        now = time.time()
+        response = self.client.get("/api/me/", HTTP_X_REQUEST_START=f"t={now - 5:.3f}")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        for start in (f"t={now:.3f}", str(int(now * 1000)), str(int((now + 60) * 1_000_000)), "garbage"):
+            with self.subTest(start=start):
+                self.assertEqual(self.client.get("/api/me/", HTTP_X_REQUEST_START=start).status_code, 200)
+
+    def test_requests_past_their_timeout_are_skipped(self):
+        self.assertEqual(self.client.get("/api/me/", HTTP_X_REQUEST_TIMEOUT_MS="0").status_code, 504)
+        self.assertEqual(self.client.get("/api/me/", HTTP_X_REQUEST_TIMEOUT_MS="60000").status_code, 200)
+        # The budget runs from when the proxy received the request.
+        response = self.client.get(
+            "/api/me/", HTTP_X_REQUEST_TIMEOUT_MS="1000", HTTP_X_REQUEST_START=f"t={time.time() - 1.5:.3f}"
+        )
+        self.assertEqual(response.status_code, 504)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        self.req = VerificationRequest.objects.create(
+            citizen=self.citizen, request_type=VerificationRequest.RequestType.NIDA, purpose="Bank account"
+        )
+        self.citizen_client = APIClient(REMOTE_ADDR=next(_client_ips), raise_request_exception=False)
+        self.citizen_client.force_authenticate(self.citizen)
+        self.officer_client = APIClient(REMOTE_ADDR=next(_client_ips), raise_request_exception=False)
+        self.officer_client.force_authenticate(self.officer)
+
+    def create(self, key, purpose="Bank account"):
+        metadata = dict.fromkeys(
+            ("reference_no", "to", "ward", "mtaa", "district", "house_no", "occupation", "stay_duration"), "-"
+        )
+        metadata.update(region="Arusha", birth_date="1990-01-01", letter_date="2024-01-01")
+        payload = {"request_type": VerificationRequest.RequestType.NIDA, "purpose": purpose, "metadata": metadata}
+        return self.citizen_client.post("/api/requests/", payload, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def approve(self, key):
+        return self.officer_client.post(f"/api/requests/{self.req.pk}/approve/", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_replay_the_first_response(self):
+        first = self.create("create-1")
+        self.assertEqual(first.status_code, 201)
+        retry = self.create("create-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(VerificationRequest.objects.filter(citizen=self.citizen).count(), 2)
+        # Keys are per caller: another user's key of the same name is unrelated.
+        self.assertNotIn("Idempotent-Replayed", self.approve("create-1"))
+
+    def test_a_key_reused_for_a_different_body_is_rejected(self):
+        self.assertEqual(self.create("create-2").status_code, 201)
+        response = self.create("create-2", purpose="Passport")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(VerificationRequest.objects.filter(citizen=self.citizen).count(), 2)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_a_duplicate_of_a_request_in_flight_gets_a_conflict(self):
+        self.assertEqual(self.approve("approve-1").status_code, 200)
+        # As if the first attempt were still running in another worker.
+        IdempotencyKey.objects.filter(key="approve-1").update(state=IdempotencyKey.State.IN_PROGRESS)
+        response = self.approve("approve-1")
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn("Idempotent-Replayed", response)
+
+    def test_keys_are_released_after_a_server_error(self):
+        with mock.patch("core.api.VerificationRequestSerializer", side_effect=RuntimeError("serializer down")):
+            self.assertEqual(self.approve("approve-2").status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.filter(key="approve-2").exists())
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.status, VerificationRequest.Status.PENDING)
+        # The retry runs the view again instead of replaying the failure.
+        response = self.approve("approve-2")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", response)
+
+    def test_writes_commit_only_with_the_stored_response(self):
+        with mock.patch("core.idempotency._complete", side_effect=DatabaseError("connection lost")):
+            self.assertEqual(self.create("create-3").status_code, 500)
+        self.assertEqual(VerificationRequest.objects.filter(citizen=self.citizen).count(), 1)
+        self.assertFalse(IdempotencyKey.objects.filter(key="create-3").exists())
+
+    def test_a_view_whose_key_was_taken_over_is_rolled_back(self):
+        def take_over(*args, **kwargs):
+            # Another worker judged the key stale and deleted it.
+            IdempotencyKey.objects.filter(key="approve-3").delete()
+            return VerificationRequestSerializer(*args, **kwargs)
+
+        with mock.patch("core.api.VerificationRequestSerializer", side_effect=take_over):
+            self.assertEqual(self.approve("approve-3").status_code, 409)
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.status, VerificationRequest.Status.PENDING)
+
+    def test_client_errors_are_replayed_whether_returned_or_raised(self):
+        for send in (
+            lambda: self.citizen_client.post("/api/requests/", {"purpose": ""}, format="json", HTTP_IDEMPOTENCY_KEY="bad"),
+            lambda: self.officer_client.post("/api/requests/999999/approve/", HTTP_IDEMPOTENCY_KEY="missing"),
+        ):
+            first = send()
+            self.assertIn(first.status_code, (400, 404))
+            retry = send()
+            self.assertEqual((retry.status_code, retry.json()), (first.status_code, first.json()))
+            self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+    def test_anonymous_callers_are_scoped_by_address(self):
+        payload = {
+            "full_name": "Neema Newcomer",
+            "phone": "0700000001",
+            "gender": CitizenProfile.Gender.FEMALE,
+            "age": 25,
+            "address": "Mtaa 2",
+            "password": "password123",
+            "confirm_password": "password123",
+        }
+        for email in ("neema@example.com", "baraka@example.com"):
+            client = APIClient(REMOTE_ADDR=next(_client_ips))
+            response = client.post("/api/auth/register/", {**payload, "email": email}, HTTP_IDEMPOTENCY_KEY="signup")
+            self.assertEqual(response.status_code, 201)
+            self.assertNotIn("Idempotent-Replayed", response)
+            retry = client.post("/api/auth/register/", {**payload, "email": email}, HTTP_IDEMPOTENCY_KEY="signup")
+            self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        self.requests = [
+            VerificationRequest.objects.create(
+                citizen=self.citizen, request_type=VerificationRequest.RequestType.NIDA, purpose=purpose
+            )
+            for purpose in ("Bank account", "Passport")
+        ]
+        self.clients = {}
+        for user in (self.citizen, self.officer):
+            self.clients[user] = APIClient(REMOTE_ADDR=next(_client_ips))
+            self.clients[user].force_authenticate(user)
+
+    def sync(self, user, cursor=None):
+        path = f"/api/sync/?since={cursor}" if cursor else "/api/sync/"
+        response = self.clients[user].get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def changed_ids(self, delta):
+        return {row["id"] for row in delta["changed"]}
+
+    def test_deleted_requests_come_back_as_tombstones(self):
+        first = self.sync(self.citizen)
+        self.assertTrue(first["full"])
+        self.assertEqual(self.changed_ids(first), {req.pk for req in self.requests})
+        deleted = self.requests[0].pk
+        self.requests[0].delete()
+
+        delta = self.sync(self.citizen, first["cursor"])
+        self.assertFalse(delta["full"])
+        self.assertEqual(delta["removed"], [deleted])
+        self.assertNotIn(deleted, self.changed_ids(delta))
+
+    def test_decided_requests_leave_the_officer_queue(self):
+        first = self.sync(self.officer)
+        self.assertEqual(self.changed_ids(first), {req.pk for req in self.requests})
+        approved = self.requests[1].pk
+        response = self.clients[self.officer].post(f"/api/requests/{approved}/approve/")
+        self.assertEqual(response.status_code, 200)
+
+        delta = self.sync(self.officer, first["cursor"])
+        self.assertEqual(delta["removed"], [approved])
+        self.assertNotIn(approved, self.changed_ids(delta))
+        # The citizen still owns the row, so for them it changed rather than went away.
+        citizen_delta = self.sync(self.citizen, first["cursor"])
+        self.assertIn(approved, self.changed_ids(citizen_delta))
+        self.assertEqual(citizen_delta["removed"], [])
+
+    def test_rows_just_before_the_cursor_are_sent_again(self):
+        cursor = self.sync(self.citizen)["cursor"]
+        since = decode_cursor(cursor)
+        recent, old = self.requests
+        skew = settings.SYNC_CLOCK_SKEW
+        VerificationRequest.objects.filter(pk=recent.pk).update(updated_at=since - skew / 2)
+        VerificationRequest.objects.filter(pk=old.pk).update(updated_at=since - skew * 2)
+
+        delta = self.sync(self.citizen, cursor)
+        self.assertEqual(self.changed_ids(delta), {recent.pk})
+
+    def test_capped_responses_resume_where_they_stopped(self):
+        self.requests += [
+            VerificationRequest.objects.create(
+                citizen=self.citizen, request_type=VerificationRequest.RequestType.NIDA, purpose=f"Loan {index}"
+            )
+            for index in range(3)
+        ]
+        # Equal timestamps: pages must break ties on id.
+        VerificationRequest.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        pages = [self.clients[self.citizen].get("/api/sync/?limit=2").json()]
+        edited = pages[0]["changed"][0]["id"]
+        VerificationRequest.objects.filter(pk=edited).update(purpose="Edited", updated_at=timezone.now())
+        while pages[-1]["has_more"]:
+            pages.append(self.sync(self.citizen, f"{pages[-1]['cursor']}&limit=2"))
+        self.assertEqual([len(page["changed"]) for page in pages], [2, 2, 2])
+        self.assertEqual([page["full"] for page in pages], [True, False, False])
+        sent = [row["id"] for page in pages for row in page["changed"]]
+        self.assertEqual(sent, sorted(req.pk for req in self.requests) + [edited])
+
+        # The last cursor is where paging started, so changes made meanwhile come again.
+        delta = self.sync(self.citizen, pages[-1]["cursor"])
+        self.assertEqual(self.changed_ids(delta), {edited})
+        self.assertFalse(delta["has_more"])
+
+    def test_malformed_cursors_are_rejected(self):
+        for query in ("since=yesterday", "since=1.2", "limit=many"):
+            with self.subTest(query=query):
+                response = self.clients[self.citizen].get(f"/api/sync/?{query}")
+                self.assertEqual(response.status_code, 400)
+
+
+# Pool threads open their own connections, which only see committed rows.
+class BatchTests(TransactionTestCase):
+    def setUp(self):
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        VerificationRequest.objects.create(
+            citizen=self.citizen, request_type=VerificationRequest.RequestType.NIDA, purpose="Bank account"
+        )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.officer)
+
+    def batch(self, *items, client=None):
+        response = (client or self.client).post("/api/batch/", {"requests": list(items)}, format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_dashboard_calls_come_back_in_one_response(self):
+        paths = ["/api/me/", "/api/stats/officer/", "/api/requests/pending/", "/api/citizens/"]
+        results = self.batch(*({"path": path} for path in paths))
+        self.assertEqual([result["status"] for result in results], [200] * 4)
+        for path, result in zip(paths, results):
+            self.assertEqual(result["body"], self.client.get(path).json())
+
+    def test_writes_run_in_order_between_reads(self):
+        client = APIClient(REMOTE_ADDR=next(_client_ips))
+        client.force_authenticate(self.citizen)
+        metadata = dict.fromkeys(
+            ("reference_no", "to", "ward", "mtaa", "district", "house_no", "occupation", "stay_duration"), "-"
+        )
+        metadata.update(region="Arusha", birth_date="1990-01-01", letter_date="2024-01-01")
+        create = {"request_type": VerificationRequest.RequestType.NIDA, "purpose": "Bank account", "metadata": metadata}
+        results = self.batch(
+            {"path": "/api/requests/"},
+            {"method": "POST", "path": "/api/requests/", "body": create},
+            {"path": "/api/requests/"},
+            {"path": "/api/me/"},
+            client=client,
+        )
+        self.assertEqual([result["status"] for result in results], [200, 201, 200, 200])
+        self.assertEqual([results[0]["body"]["count"], results[2]["body"]["count"]], [1, 2])
+
+    def test_concurrent_reads_run_in_the_request_context(self):
+        items = [{"path": path} for path in ("/api/me/", "/api/stats/officer/", "/api/requests/pending/", "/api/citizens/")]
+        self.batch(*items)  # The first call caches the officer's profile on the user.
+        counts = []
+        for workers in (1, 4):
+            counter = metrics.QueryCounter()
+            with override_settings(BATCH_MAX_WORKERS=workers), queryhooks.observe_queries(counter):
+                self.batch(*items)
+            counts.append(counter.queries)
+        self.assertGreater(counts[0], 0)
+        self.assertEqual(counts[1], counts[0])
+
+    def test_sub_requests_take_a_slot_in_their_route_class(self):
+        def acquire(limiter, position):
+            return limiter.class_name(position) != "list"
+
+        with mock.patch.object(ConcurrencyLimiter, "acquire", autospec=True, side_effect=acquire):
+            results = self.batch({"path": "/api/requests/pending/"}, {"path": "/api/me/"})
+        self.assertEqual([result["status"] for result in results], [503, 200])
+        self.assertEqual(results[0]["headers"]["Retry-After"], "1")
+
+    def test_invalid_batches_are_rejected(self):
+        for items in ([], [{"path": "/api/batch/"}], [{"path": "/admin/"}], [{"method": "TRACE", "path": "/api/me/"}]):
+            with self.subTest(items=items):
+                response = self.client.post("/api/batch/", {"requests": items}, format="json")
+                self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        CitizenProfile.objects.create(user=self.citizen, phone="0700000000", gender="F", age=30, address="Mtaa 1")
+        # No profile: the projection must fall back to what the serializer returns.
+        self.newcomer = User.objects.create_user("newcomer@example.com", "password123", full_name="Neema Newcomer")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        for citizen in (self.citizen, self.newcomer):
+            VerificationRequest.objects.create(
+                citizen=citizen,
+                request_type=VerificationRequest.RequestType.NIDA,
+                purpose="Bank account",
+                metadata={"region": "Arusha", "ward": "Kati"},
+            )
+        VerificationRequest.objects.create(
+            citizen=self.citizen,
+            request_type=VerificationRequest.RequestType.NIDA,
+            purpose="Passport",
+            status=VerificationRequest.Status.APPROVED,
+            decided_by=self.officer,
+            decided_at=timezone.now(),
+        )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.officer)
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def expected(self, pk, **kwargs):
+        req = VerificationRequest.objects.select_related("citizen__citizen_profile").get(pk=pk)
+        return VerificationRequestSerializer(req, **kwargs).data
+
+    def test_list_projections_match_the_serializer(self):
+        for query, kwargs in (
+            ("", {}),
+            ("?fields=id,status,citizen_phone,citizen_age", {"fields": ["id", "status", "citizen_phone", "citizen_age"]}),
+            ("?exclude=metadata,citizen_nida", {"exclude": ["metadata", "citizen_nida"]}),
+        ):
+            for path in ("/api/requests/pending/", "/api/requests/approved/"):
+                with self.subTest(path=path, query=query):
+                    rows = self.get(path + query)["results"]
+                    self.assertTrue(rows)
+                    for row in rows:
+                        self.assertEqual(row, self.expected(row["id"], **kwargs))
+
+    def test_detail_honours_requested_fields(self):
+        pk = VerificationRequest.objects.get(citizen=self.newcomer).pk
+        fields = ["id", "decided_at", "citizen_name", "citizen_gender"]
+        self.assertEqual(self.get(f"/api/requests/{pk}/?fields={','.join(fields)}"), self.expected(pk, fields=fields))
+
+    def test_unknown_fields_are_rejected(self):
+        for query in ("?fields=id,password", "?exclude=citizen"):
+            with self.subTest(query=query):
+                response = self.client.get("/api/requests/pending/" + query)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("fields", response.json())
+
+
+@override_settings(DATABASE_ROUTERS=REPLICA_ROUTER)
+class ReplicaRoutingTests(TestCase):
+    databases = {"default", "replica1"}
+
+    def setUp(self):
+        routers._health.clear()
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        # Only the primary has the request; the replica has not caught up yet.
+        self.request = VerificationRequest.objects.create(
+            citizen=self.citizen,
+            request_type=VerificationRequest.RequestType.NIDA,
+            purpose="Bank account",
+        )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.officer)
+
+    def pending_count(self, client=None):
+        return (client or self.client).get("/api/requests/pending/").json()["count"]
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(routers.PrimaryReplicaRouter().db_for_read(VerificationRequest), "default")
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.pending_count(), 0)
+
+    def test_client_reads_primary_after_its_write(self):
+        response = self.client.post(f"/api/requests/{self.request.pk}/reopen/")
+        self.assertEqual(response.status_code, 400)  # still pending, but no write happened
+        self.assertEqual(self.pending_count(), 0)
+
+        self.client.post(f"/api/requests/{self.request.pk}/reject/", {"reason": "Blurry scan"})
+        rejected = self.client.get(f"/api/requests/{self.request.pk}/").json()
+        self.assertEqual(rejected["status"], VerificationRequest.Status.REJECTED)
+
+        other = APIClient(REMOTE_ADDR=next(_client_ips))
+        other.force_authenticate(self.officer)
+        self.assertEqual(other.get(f"/api/requests/{self.request.pk}/").status_code, 404)
+
+    def test_pin_expires(self):
+        self.client.post(f"/api/requests/{self.request.pk}/reject/", {"reason": "Blurry scan"})
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            self.assertEqual(self.client.get(f"/api/requests/{self.request.pk}/").status_code, 404)
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        with mock.patch("django.db.backends.sqlite3.base.DatabaseWrapper.is_usable", return_value=False):
+            self.assertEqual(self.pending_count(), 1)
+
+    def test_replica_error_marks_it_unhealthy(self):
+        def failing_list(*args, **kwargs):
+            VerificationRequest.objects.exists()
+            raise DatabaseError("replica gone")
+
+        with mock.patch("core.api.PendingRequestList.list", side_effect=failing_list):
+            client = APIClient(REMOTE_ADDR=next(_client_ips), raise_request_exception=False)
+            client.force_authenticate(self.officer)
+            client.get("/api/requests/pending/")
+        self.assertEqual(self.pending_count(), 1)
+
+
+@override_settings(DATABASE_ROUTERS=SHARD_ROUTER, REQUEST_SHARDS=REQUEST_SHARDS)
+class ShardRoutingTests(TestCase):
+    databases = {"default", "shard_mara", "shard_mwanza"}
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+            self.officer = User.objects.create_user(
+                "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+            )
+        self.citizen_client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.citizen_client.force_authenticate(self.citizen)
+        self.officer_client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.officer_client.force_authenticate(self.officer)
+
+    def create_request(self, region, **extra):
+        metadata = dict.fromkeys(
+            ("reference_no", "to", "ward", "mtaa", "district", "house_no", "occupation", "stay_duration"), "-"
+        )
+        metadata.update(region=region, birth_date="1990-01-01", letter_date="2024-01-01")
+        payload = {"request_type": VerificationRequest.RequestType.NIDA, "purpose": "Bank account", "metadata": metadata}
+        response = self.citizen_client.post("/api/requests/", payload, format="json", **extra)
+        self.assertEqual(response.status_code, 201)
+        return response.json()["id"]
+
+    def test_users_are_replicated_to_shards(self):
+        for alias in ("shard_mara", "shard_mwanza"):
+            self.assertTrue(User.objects.using(alias).filter(email="citizen@example.com").exists())
+
+    def test_requests_are_stored_on_their_region_shard(self):
+        mara = self.create_request("Mara")
+        mwanza = self.create_request("mwanza")
+        other = self.create_request("Arusha")
+
+        self.assertEqual(sharding.shard_for_pk(mara), "shard_mara")
+        self.assertEqual(sharding.shard_for_pk(mwanza), "shard_mwanza")
+        self.assertEqual(sharding.shard_for_pk(other), "default")
+        self.assertTrue(VerificationRequest.objects.using("shard_mara").filter(pk=mara).exists())
+        self.assertFalse(VerificationRequest.objects.using("default").filter(pk=mara).exists())
+
+    def test_request_ids_follow_shard_numbers_not_listing_order(self):
+        mara = self.create_request("Mara")
+        with override_settings(DATABASE_SHARDS=["shard_mwanza", "shard_mara"]):
+            self.assertEqual(sharding.shard_for_pk(mara), "shard_mara")
+            self.assertEqual(self.citizen_client.get(f"/api/requests/{mara}/").status_code, 200)
+
+    def test_shards_need_distinct_numbers(self):
+        self.assertEqual(checks.check_shard_numbers(None), [])
+        cases = {"core.E002": {"shard_mara": 1}, "core.E003": {"shard_mara": 1, "shard_mwanza": 1}}
+        for error_id, numbers in cases.items():
+            with self.subTest(error_id), override_settings(SHARD_NUMBERS=numbers):
+                self.assertIn(error_id, [error.id for error in checks.check_shard_numbers(None)])
+
+    def test_failed_copies_are_reported_without_failing_the_save(self):
+        with mock.patch("core.sharding.replicate", side_effect=DatabaseError("shard down")):
+            with self.assertLogs(level="ERROR"):
+                with self.captureOnCommitCallbacks(execute=True):
+                    User.objects.create_user("late@example.com", "password123", full_name="Late Copy")
+        with self.assertRaisesMessage(RuntimeError, "sync_shard_reference_data"):
+            readiness.probe_shard_copies("shard_mara")
+        self.assertFalse(readiness.get_probes()["copies:shard_mara"][1])
+
+        call_command("sync_shard_reference_data", stdout=io.StringIO())
+        readiness.probe_shard_copies("shard_mara")
+
+    def test_idempotency_keys_are_stored_with_the_writes_they_guard(self):
+        pk = self.create_request("Mara", HTTP_IDEMPOTENCY_KEY="create-1")
+        response = self.officer_client.post(
+            f"/api/requests/{pk}/reject/", {"reason": "Blurry scan"}, HTTP_IDEMPOTENCY_KEY="reject-1"
+        )
+        self.assertEqual(response.status_code, 200)
+        for key in ("create-1", "reject-1"):
+            self.assertTrue(IdempotencyKey.objects.using("shard_mara").filter(key=key).exists())
+            self.assertFalse(IdempotencyKey.objects.using("default").filter(key=key).exists())
+
+    def test_request_endpoints_route_by_id(self):
+        pk = self.create_request("Mara")
+        self.assertEqual(self.citizen_client.get(f"/api/requests/{pk}/").status_code, 200)
+        response = self.officer_client.post(f"/api/requests/{pk}/reject/", {"reason": "Blurry scan"})
+        self.assertEqual(response.status_code, 200)
+        stored = VerificationRequest.objects.using("shard_mara").get(pk=pk)
+        self.assertEqual(stored.status, VerificationRequest.Status.REJECTED)
+
+    def test_default_database_writes_wait_for_the_shard_to_commit(self):
+        pk = self.create_request("Mara")
+        follow_ups = {
+            "approve": lambda: Job.objects.filter(name="letters.prerender").exists()
+            and RequestEvent.objects.filter(request_id=pk).exists(),
+            "reopen": lambda: RevokedLetter.objects.filter(request_id=pk).exists(),
+        }
+        for action, written in follow_ups.items():
+            with self.subTest(action=action):
+                with self.captureOnCommitCallbacks(using="shard_mara") as callbacks:
+                    self.assertEqual(self.officer_client.post(f"/api/requests/{pk}/{action}/").status_code, 200)
+                    self.assertFalse(written())
+                for callback in callbacks:
+                    callback()
+                self.assertTrue(written())
+
+    def test_lists_and_stats_gather_every_shard(self):
+        created = [self.create_request(region) for region in ("Mara", "Arusha", "Mwanza", "Mara")]
+
+        pending = self.officer_client.get("/api/requests/pending/").json()
+        self.assertEqual(pending["count"], 4)
+        # Newest first, across shards.
+        self.assertEqual([row["id"] for row in pending["results"]], created[::-1])
+        mine = self.citizen_client.get("/api/requests/").json()
+        self.assertEqual(mine["count"], 4)
+
+        stats = self.officer_client.get("/api/stats/officer/").json()
+        self.assertEqual(stats["pending_requests"], 4)
+
+
+@override_settings(
+    DATABASE_ROUTERS=SHARD_ROUTER, REQUEST_SHARDS={"mara": "shard_mara"}, DATABASE_SHARDS=["shard_mara"]
+)
+class SeedLoadTests(TestCase):
+    databases = {"default", "shard_mara"}
+
+    def seed(self, requests):
+        call_command(
+            "seed_load",
+            "--citizens", "50", "--officers", "2", "--requests", str(requests),
+            "--batch-size", "40", "--now", "2024-06-01", "--days", "30",
+            stdout=io.StringIO(),
+        )
+
+    def test_seeding_with_a_shard_copies_accounts_first(self):
+        self.seed(200)
+
+        seeded = User.objects.filter(email__endswith="@seed.mtaa.test")
+        self.assertEqual(seeded.count(), 52)
+        self.assertEqual(seeded.using("shard_mara").count(), 52)
+        self.assertEqual(CitizenProfile.objects.using("shard_mara").count(), 50)
+        on_shard = VerificationRequest.objects.using("shard_mara").count()
+        self.assertGreater(on_shard, 0)
+        self.assertEqual(on_shard + VerificationRequest.objects.using("default").count(), 200)
+
+        # Re-running resumes from the per-shard count instead of seeding again.
+        self.seed(250)
+        self.assertEqual(sharding.count_all(VerificationRequest.objects.all()), 250)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        options = {"size": 2, "max_lifetime": 60.0, "timeout": 0.05, "validate_after": 0.0, **kwargs}
+        return ConnectionPool(FakeConnection, lambda connection: connection.healthy, **options)
+
+    def test_connections_are_reused(self):
+        pool = self.make_pool()
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.snapshot()["creates"], 1)
+        self.assertEqual(pool.snapshot()["checkouts"], 2)
+
+    def test_unhealthy_connection_is_replaced_on_checkout(self):
+        pool = self.make_pool()
+        first = pool.acquire()
+        pool.release(first)
+        first.healthy = False
+        second = pool.acquire()
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+
+    def test_recently_returned_connection_skips_validation(self):
+        pool = self.make_pool(validate_after=60.0)
+        first = pool.acquire()
+        pool.release(first)
+        first.healthy = False
+        self.assertIs(pool.acquire(), first)
+
+    def test_connections_past_max_lifetime_are_closed(self):
+        pool = self.make_pool(max_lifetime=0.0)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.snapshot()["idle"], 0)
+
+    def test_discarded_connections_are_closed(self):
+        pool = self.make_pool()
+        first = pool.acquire()
+        pool.release(first, discard=True)
+        self.assertTrue(first.closed)
+        self.assertIsNot(pool.acquire(), first)
+
+    def test_checkout_waits_then_times_out_when_exhausted(self):
+        pool = self.make_pool()
+        pool.acquire()
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        stats = pool.snapshot()
+        self.assertEqual((stats["in_use"], stats["waits"], stats["timeouts"]), (2, 1, 1))
+
+    def test_pool_starts_empty_after_fork(self):
+        pool = self.make_pool()
+        inherited = pool.acquire()
+        pool.release(inherited)
+        with mock.patch("core.dbpool.os.getpid", return_value=-1):
+            self.assertIsNot(pool.acquire(), inherited)
+        self.assertFalse(inherited.closed)
+
+
+class SynchronousThread:
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@override_settings(READINESS={"ttl": 60, "max_age": 120, "min_free_disk_mb": 0})
+class ReadinessTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        readiness._checked_at = None
+        readiness._results = {}
+        readiness._migrations_applied = False
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+
+    def refresh(self):
+        with mock.patch("core.readiness.threading.Thread", SynchronousThread):
+            readiness._checked_at = None
+            self.client.get("/readyz/")
+        return self.client.get("/readyz/")
+
+    def test_probes_report_latency(self):
+        results = readiness.run_probes()
+        self.assertTrue(all(result["ok"] for result in results.values()), results)
+        self.assertIn("db:default", results)
+        self.assertGreaterEqual(results["migrations"]["latency_ms"], 0)
+
+    def test_ready_after_first_background_refresh(self):
+        with mock.patch("core.readiness.threading.Thread") as thread:
+            self.assertEqual(self.client.get("/readyz/").status_code, 503)
+        thread.return_value.start.assert_called_once()
+        readiness._refreshing.release()
+
+        response = self.refresh()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ready")
+
+    def test_failing_critical_probe_makes_instance_unavailable(self):
+        with override_settings(READINESS={"ttl": 60, "max_age": 120, "min_free_disk_mb": 10**12}):
+            with self.assertLogs("core.readiness", "WARNING") as logs:
+                response = self.refresh()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["probes"]["disk"], {"ok": False, "critical": True})
+        # The reason is logged, not served.
+        self.assertIn("MB free", "\n".join(logs.output))
+        self.assertNotIn("MB free", response.content.decode())
+
+    @override_settings(DATABASE_ROUTERS=SHARD_ROUTER, REQUEST_SHARDS=REQUEST_SHARDS)
+    def test_failing_shard_leaves_instance_ready_but_degraded(self):
+        def probe_database(alias):
+            if alias == "shard_mara":
+                raise DatabaseError("Can't connect to MySQL server on 'db-mara'")
+
+        with mock.patch("core.readiness.probe_database", probe_database), self.assertLogs("core.readiness", "WARNING"):
+            response = self.refresh()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "degraded")
+        self.assertEqual(response.json()["probes"]["db:shard_mara"], {"ok": False, "critical": False})
+        self.assertNotIn("db-mara", response.content.decode())
+
+    def test_migration_plan_is_not_rebuilt_once_applied(self):
+        readiness.probe_migrations()
+        with mock.patch("core.readiness.MigrationExecutor") as executor:
+            readiness.probe_migrations()
+        executor.assert_not_called()
+
+
+@override_settings(SERVER_TIMING={"sample_rate": 1.0, "debug_sql": False})
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.request = VerificationRequest.objects.create(
+            citizen=citizen,
+            request_type=VerificationRequest.RequestType.NIDA,
+            purpose="Bank account",
+            status=VerificationRequest.Status.APPROVED,
+        )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.officer)
+
+    def timings(self, response) -> dict:
+        metrics = {}
+        for metric in response["Server-Timing"].split(", "):
+            name, *params = metric.split(";")
+            metrics[name] = dict(param.split("=", 1) for param in params)
+        return metrics
+
+    def test_list_reports_queries_and_serialization(self):
+        with self.assertLogs("core.timing", "INFO") as logs:
+            response = self.client.get("/api/requests/approved/")
+        metrics = self.timings(response)
+        self.assertEqual(set(metrics), {"db", "serialize", "total"})
+        self.assertNotEqual(metrics["db"]["desc"], '"0 queries"')
+        self.assertIn('"route": "approved-requests"', logs.output[0])
+
+    def test_download_reports_pdf_rendering(self):
+        response = self.client.get(f"/api/requests/{self.request.pk}/download/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("pdf", self.timings(response))
+
+    @override_settings(DEBUG=True, SERVER_TIMING={"sample_rate": 0.0, "debug_sql": True})
+    def test_debug_switch_returns_slowest_sql(self):
+        response = self.client.get("/api/requests/approved/")
+        slow = json.loads(response["X-Debug-Slow-SQL"])
+        self.assertTrue(slow)
+        self.assertIn("SELECT", slow[0]["sql"])
+
+    @override_settings(SERVER_TIMING={"sample_rate": 0.0, "debug_sql": False})
+    def test_unsampled_requests_have_no_header(self):
+        self.assertFalse(self.client.get("/api/requests/approved/").has_header("Server-Timing"))
+
+
+def _increment_in_child():
+    metrics.inc("mtaa_decisions_total", (("decision", "approved"), ("request_type", "child")), 2)
+
+
+@override_settings(METRICS_TOKEN="secret")
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.request = VerificationRequest.objects.create(
+            citizen=citizen,
+            request_type=VerificationRequest.RequestType.NIDA,
+            purpose="Bank account",
+        )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.officer)
+
+    def value(self, name, **labels):
+        return metrics.collect().get((name, tuple(labels.items())), 0.0)
+
+    def test_requests_decisions_and_queries_are_counted(self):
+        requests_before = self.value("mtaa_http_requests_total", route="request-approve", method="POST", status="200")
+        decisions_before = self.value("mtaa_decisions_total", decision="approved", request_type="nida")
+        self.client.post(f"/api/requests/{self.request.pk}/approve/")
+        self.assertEqual(
+            self.value("mtaa_http_requests_total", route="request-approve", method="POST", status="200"),
+            requests_before + 1,
+        )
+        self.assertEqual(self.value("mtaa_decisions_total", decision="approved", request_type="nida"), decisions_before + 1)
+        self.assertGreater(self.value("mtaa_db_queries_total", route="request-approve"), 0)
+
+    def test_exposition_format(self):
+        self.client.get(f"/api/requests/{self.request.pk}/")
+        body = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").content.decode()
+        self.assertIn("# TYPE mtaa_http_request_duration_seconds histogram", body)
+        self.assertIn('mtaa_http_request_duration_seconds_bucket{route="request-detail",le="+Inf"}', body)
+        self.assertIn('mtaa_http_request_duration_seconds_count{route="request-detail"}', body)
+
+    def test_values_are_summed_across_processes(self):
+        before = self.value("mtaa_decisions_total", decision="approved", request_type="child")
+        metrics.inc("mtaa_decisions_total", (("decision", "approved"), ("request_type", "child")))
+        child = multiprocessing.get_context("fork").Process(target=_increment_in_child)
+        child.start()
+        child.join()
+        self.assertEqual(self.value("mtaa_decisions_total", decision="approved", request_type="child"), before + 3)
+
+        # The exited child's file was folded into merged.db, and is counted from there once.
+        files = os.listdir(metrics.metrics_dir())
+        self.assertNotIn(f"metrics-{child.pid}.db", files)
+        self.assertIn(metrics.MERGED_FILE, files)
+        self.assertEqual(self.value("mtaa_decisions_total", decision="approved", request_type="child"), before + 3)
+
+    def test_pool_stats_are_on_metrics_not_health(self):
+        pool = ConnectionPool(connect=object, validate=lambda connection: True, size=4)
+        pool.release(pool.acquire())
+        with mock.patch.dict("core.dbpool._pools", {"default": pool}):
+            for path in ("/healthz/", "/api/health/"):
+                self.assertEqual(self.client.get(path).json(), {"status": "ok"})
+            body = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").content.decode()
+        labels = f'alias="default",pid="{os.getpid()}"'
+        self.assertIn(f'mtaa_db_pool_connections{{{labels},state="idle"}} 1.0', body)
+        self.assertIn(f'mtaa_db_pool_events_total{{{labels},event="checkouts"}} 1.0', body)
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_worker_processes_serve_their_own_metrics(self):
+        metrics.inc("mtaa_notifications_total", (("channel", "sms"), ("outcome", "sent")))
+        server = metrics.serve(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with self.assertRaises(HTTPError) as denied:
+            urlopen(url, timeout=5)
+        self.assertEqual(denied.exception.code, 401)
+        with urlopen(Request(url, headers={"Authorization": "Bearer secret"}), timeout=5) as response:
+            self.assertIn('mtaa_notifications_total{channel="sms",outcome="sent"}', response.read().decode())
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        for index in range(6):
+            citizen = User.objects.create_user(f"citizen{index}@example.com", "password123", full_name="Citizen")
+            VerificationRequest.objects.create(
+                citizen=citizen,
+                request_type=VerificationRequest.RequestType.NIDA,
+                purpose="Bank account",
+            )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.officer)
+
+    def test_fingerprint_normalises_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            fingerprint("SELECT *  FROM t WHERE id IN (%s) AND name = 'y' LIMIT 5"),
+        )
+
+    def test_views_stay_within_budget(self):
+        self.assertEqual(self.client.get("/api/requests/pending/").status_code, 200)
+
+    def test_transaction_control_is_not_counted(self):
+        log = QueryLog(repeat_threshold=5)
+        context = {"connection": mock.Mock(alias="default")}
+        for sql in ("BEGIN", 'SAVEPOINT "s1"', "SELECT 1", 'RELEASE SAVEPOINT "s1"'):
+            log(lambda *args: None, sql, None, False, context)
+        self.assertEqual(log.query_count, 1)
+
+    def test_exceeding_the_budget_raises_in_tests(self):
+        with mock.patch("core.api.PendingRequestList.query_budget", 0):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "PendingRequestList ran 2 queries, over its budget of 0"):
+                self.client.get("/api/requests/pending/")
+
+    def test_repeated_queries_are_reported_with_call_site(self):
+        def list_with_n_plus_one(view, request, *args, **kwargs):
+            return Response([row.citizen.full_name for row in VerificationRequest.objects.all()])
+
+        with mock.patch("core.api.PendingRequestList.list", list_with_n_plus_one):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "likely N+1) at core/tests.py"):
+                self.client.get("/api/requests/pending/")
+
+    @override_settings(QUERY_BUDGET={"mode": "warn", "repeat_threshold": 5})
+    def test_warn_mode_logs_instead(self):
+        with mock.patch("core.api.PendingRequestList.query_budget", 0):
+            with self.assertLogs("core.middleware", "WARNING"):
+                response = self.client.get("/api/requests/pending/")
+        self.assertEqual(response.status_code, 200)
+
+
+class LoadTestTests(SimpleTestCase):
+    def summary(self, latencies_ms, statuses):
+        recorder = loadtest.Recorder()
+        recorder.recording = True
+        for latency, status in zip(latencies_ms, statuses):
+            recorder.record("GET /api/requests/", latency / 1000, status)
+        return {"scenarios": {"citizen": loadtest.summarise(recorder, 10.0, users=4)}}
+
+    def test_summary_reports_percentiles_and_errors(self):
+        results = self.summary(range(1, 101), [200] * 97 + [400, 503, 0])
+        stats = results["scenarios"]["citizen"]["endpoints"]["GET /api/requests/"]
+        self.assertEqual((stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["max_ms"]), (50, 95, 99, 100))
+        self.assertEqual(stats["rps"], 10.0)
+        # A 400 is part of the journey; a 503 or a dropped connection is not.
+        self.assertEqual(stats["errors"], 2)
+
+    def test_compare_flags_slower_and_failing_endpoints(self):
+        baseline = self.summary(range(1, 101), [200] * 100)
+        self.assertEqual(loadtest.compare(baseline, baseline, tolerance=0.25), [])
+
+        slower = self.summary(range(101, 201), [200] * 90 + [500] * 10)
+        regressions = loadtest.compare(slower, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn("p95 95.0 ms -> 195.0 ms", regressions[0])
+        self.assertIn("errors 0.0% -> 10.0%", regressions[1])
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_measure_reports_variance_and_allocations(self):
+        result = benchmarks.measure("allocate", lambda: bytearray(256 * 1024), number=10, repeat=3)
+        self.assertGreaterEqual(result["stdev_us"], 0)
+        self.assertGreaterEqual(result["peak_alloc_kib"], 256)
+
+    def test_compare_ignores_noise_and_flags_slowdowns(self):
+        before = {"median_us": 100.0, "stdev_us": 10.0, "peak_alloc_kib": 1.0}
+        baseline = {"letter": [{"name": "render_letter", **before}]}
+
+        def result(median_us, peak_alloc_kib=1.0):
+            return {"letter": [{"name": "render_letter", "median_us": median_us, "stdev_us": 1.0, "peak_alloc_kib": peak_alloc_kib}]}
+
+        self.assertEqual(benchmarks.compare(result(125.0), baseline, threshold=0.2), [])
+        self.assertEqual(len(benchmarks.compare(result(140.0), baseline, threshold=0.2)), 1)
+        self.assertIn("peak allocation", benchmarks.compare(result(100.0, 64.0), baseline, threshold=0.2)[0])
+
+
+class OpenApiSchemaTests(TestCase):
+    def setUp(self):
+        schema._cache.clear()
+
+    def test_schema_is_served_gzipped_with_strong_etag(self):
+        response = self.client.get("/api/schema/?format=json", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertRegex(response["ETag"], r'^"[0-9a-f]{32}-gzip"$')
+        self.assertIn("openapi", json.loads(gzip.decompress(response.content)))
+
+        yaml = self.client.get("/api/schema/")
+        self.assertEqual(yaml["Content-Type"], "application/vnd.oai.openapi")
+        self.assertNotEqual(yaml["ETag"], response["ETag"])
+
+    def test_unchanged_schema_is_not_sent_again(self):
+        etag = self.client.get("/api/schema/")["ETag"]
+        response = self.client.get("/api/schema/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_schema_is_generated_once_and_reused_from_disk(self):
+        with override_settings(OPENAPI_SCHEMA_DIR=tempfile.mkdtemp()), mock.patch("core.schema.generate", wraps=schema.generate) as generate:
+            schema.get_schema()
+            schema.get_schema()
+            # A new worker finds the stored copy.
+            schema._cache.clear()
+            schema.get_schema()
+        self.assertEqual(generate.call_count, 1)
+
+    @override_settings(OPENAPI_SCHEMA_LIVE=True)
+    def test_live_generation_when_enabled(self):
+        with mock.patch("core.schema.get_schema") as get_schema:
+            response = self.client.get("/api/schema/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+        get_schema.assert_not_called()
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_warm_up_runs_every_step_without_the_database(self):
+        schema._cache.clear()
+        # SimpleTestCase rejects queries, so a warmer touching the database before the fork would log an error.
+        with mock.patch("core.warmup.gc.freeze") as freeze, self.assertNoLogs("core.warmup", "ERROR"):
+            timings = warmup.warm_up()
+        self.assertEqual(list(timings), [warmer.__name__ for warmer in warmup.WARMERS])
+        freeze.assert_called_once()
+
+
+class PrestartTests(TestCase):
+    databases = {"default", "shard_mara", "shard_mwanza"}
+
+    def test_prestart_skips_migrate_when_nothing_is_pending(self):
+        output = io.StringIO()
+        with mock.patch.dict("os.environ", {"DJANGO_SUPERUSER_EMAIL": ""}):
+            call_command("prestart", stdout=output)
+        self.assertIn("No migrations to apply to default.", output.getvalue())
+
+    @override_settings(DATABASE_ROUTERS=SHARD_ROUTER, REQUEST_SHARDS=REQUEST_SHARDS)
+    def test_prestart_migrates_every_shard(self):
+        def migration_plan(executor, targets):
+            return ["0001_initial"] if executor.connection.alias == "shard_mwanza" else []
+
+        output = io.StringIO()
+        with mock.patch("core.management.commands.prestart.MigrationExecutor.migration_plan", migration_plan):
+            with mock.patch("core.management.commands.prestart.call_command") as call:
+                call_command("prestart", stdout=output)
+        call.assert_any_call("migrate", database="shard_mwanza", interactive=False, verbosity=1)
+        self.assertEqual([c.args[0] for c in call.call_args_list], ["migrate", "initadmin"])
+        self.assertIn("No migrations to apply to shard_mara.", output.getvalue())
+
+
+class PathMiddlewareTests(TestCase):
+    def setUp(self):
+        self.client = APIClient(enforce_csrf_checks=True)
+
+    def test_api_runs_the_lean_chain(self):
+        response = self.client.get("/api/health/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("X-Frame-Options"))
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+        # CommonMiddleware still applies.
+        self.assertEqual(self.client.get("/api/health").status_code, 301)
+
+    # The manifest storage needs collectstatic, which the tests do not run.
+    @override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+    def test_admin_keeps_the_full_chain(self):
+        response = self.client.get("/admin/login/")
+        self.assertEqual(response["X-Frame-Options"], "DENY")
+        self.assertIn("csrftoken", response.cookies)
+        # CSRF is still enforced on admin forms.
+        response = self.client.post("/admin/login/", {"username": "a@example.com", "password": "x"})
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_chain_is_checked(self):
+        self.assertEqual(checks.check_admin_middleware(None), [])
+        with override_settings(MIDDLEWARE_BY_PATH={"/api/": [], "": []}):
+            self.assertEqual(len(checks.check_admin_middleware(None)), 3)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        CitizenProfile.objects.create(user=self.citizen, phone="0700000000", gender="F", age=30, address="Mtaa 1")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        for status in (VerificationRequest.Status.PENDING, VerificationRequest.Status.APPROVED):
+            VerificationRequest.objects.create(
+                citizen=self.citizen,
+                request_type=VerificationRequest.RequestType.NIDA,
+                purpose="Bank account",
+                status=status,
+            )
+
+    def get(self, user, path, asgi=False):
+        authorization = f"Bearer {AccessToken.for_user(user)}"
+        if not asgi:
+            return APIClient(REMOTE_ADDR=next(_client_ips)).get(path, HTTP_AUTHORIZATION=authorization)
+        return self.asgi("get", path, headers={"Authorization": authorization})
+
+    def asgi(self, method, path, *args, **kwargs):
+        async def send():
+            return await getattr(self.async_client, method)(path, *args, **kwargs)
+
+        with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+            return async_to_sync(send)()
+
+    def test_read_endpoints_match_the_sync_views(self):
+        for user, path in (
+            (self.citizen, "/api/me/"),
+            (self.officer, "/api/me/"),
+            (self.citizen, "/api/requests/?fields=id,status,citizen_phone"),
+            (self.officer, "/api/requests/pending/"),
+            (self.officer, "/api/requests/approved/?page=2"),
+            (self.officer, "/api/stats/officer/"),
+            (self.citizen, "/api/sync/?since=bad"),
+            (self.officer, "/healthz/"),
+        ):
+            with self.subTest(path=path, user=user.email):
+                expected = self.get(user, path)
+                response = self.get(user, path, asgi=True)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.json(), expected.json())
+
+        expected = self.get(self.citizen, "/api/sync/").json()
+        response = self.get(self.citizen, "/api/sync/", asgi=True).json()
+        self.assertEqual(response["changed"], expected["changed"])
+        self.assertEqual(len(response["changed"]), 2)
+
+    def test_citizens_can_still_create_requests(self):
+        metadata = dict.fromkeys(
+            ("reference_no", "to", "ward", "mtaa", "district", "house_no", "occupation", "stay_duration"), "-"
+        )
+        metadata.update(region="Arusha", birth_date="1990-01-01", letter_date="2024-01-01")
+        response = self.asgi(
+            "post",
+            "/api/requests/",
+            {"request_type": VerificationRequest.RequestType.NIDA, "purpose": "Bank account", "metadata": metadata},
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.citizen)}"},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(VerificationRequest.objects.filter(citizen=self.citizen).count(), 3)
+
+    def test_queries_are_counted_across_threads(self):
+        queries_before = metrics.collect().get(("mtaa_db_queries_total", (("route", "pending-requests"),)), 0.0)
+        # The user lookup runs on the request's thread, the page and count through the async ORM.
+        with mock.patch("core.api.PendingRequestList.query_budget", 0):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "PendingRequestList ran 3 queries, over its budget of 0"):
+                self.get(self.officer, "/api/requests/pending/", asgi=True)
+        queries = metrics.collect().get(("mtaa_db_queries_total", (("route", "pending-requests"),)), 0.0)
+        self.assertEqual(queries, queries_before + 3)
+
+
+@override_settings(EVENTS={**settings.EVENTS, "max_seconds": 0, "wsgi_streams": 1})
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.neighbour = User.objects.create_user("neighbour@example.com", "password123", full_name="Baraka Citizen")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        self.requests = {
+            user: VerificationRequest.objects.create(
+                citizen=user, request_type=VerificationRequest.RequestType.NIDA, purpose="Bank account"
+            )
+            for user in (self.citizen, self.neighbour)
+        }
+        # Database ids repeat across tests, so each test gets a broadcaster that has seen none of them.
+        patcher = mock.patch.object(events, "broadcaster", events.Broadcaster())
+        self.broadcaster = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def subscribe(self, user):
+        subscription = self.broadcaster.subscribe(events.Subscription(user))
+        self.addCleanup(self.broadcaster.unsubscribe, subscription)
+        return subscription
+
+    def received(self, subscription):
+        return [(event.kind, event.request_id, event.status) for event in iter(lambda: subscription.get(0), None)]
+
+    def record(self, user, kind=RequestEvent.Kind.STATUS_CHANGED):
+        with self.captureOnCommitCallbacks(execute=True):
+            events.record_event(self.requests[user], kind)
+        return RequestEvent.objects.latest("pk")
+
+    def stream(self, user, last_event_id, asgi=False):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}", "Last-Event-ID": str(last_event_id)}
+        if not asgi:
+            response = APIClient(REMOTE_ADDR=next(_client_ips)).get("/api/events/", headers=headers)
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            return b"".join(response.streaming_content).decode()
+
+        async def read():
+            response = await self.async_client.get("/api/events/", headers=headers)
+            return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+        with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+            return async_to_sync(read)()
+
+    def test_events_reach_only_users_allowed_to_see_them(self):
+        citizen, neighbour, officer = map(self.subscribe, (self.citizen, self.neighbour, self.officer))
+        req = self.requests[self.citizen]
+        client = APIClient(REMOTE_ADDR=next(_client_ips))
+        client.force_authenticate(self.officer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(f"/api/requests/{req.pk}/approve/").status_code, 200)
+            # Approving twice changes nothing, so it is not an event.
+            self.assertEqual(client.post(f"/api/requests/{req.pk}/approve/").status_code, 200)
+
+        approved = [(RequestEvent.Kind.STATUS_CHANGED, req.pk, VerificationRequest.Status.APPROVED)]
+        self.assertEqual(self.received(citizen), approved)
+        self.assertEqual(self.received(officer), approved)
+        self.assertEqual(self.received(neighbour), [])
+
+    def test_the_feed_delivers_other_workers_events_once(self):
+        officer = self.subscribe(self.officer)
+        local = self.record(self.citizen)
+        # Written by another worker: only the feed knows about it.
+        remote = RequestEvent.objects.create(
+            kind=RequestEvent.Kind.CREATED,
+            request_id=self.requests[self.neighbour].pk,
+            citizen_id=self.neighbour.pk,
+            status=VerificationRequest.Status.PENDING,
+        )
+        self.broadcaster.poll()
+        self.broadcaster.poll()
+        self.assertEqual(
+            [event[1] for event in self.received(officer)], [local.request_id, remote.request_id]
+        )
+
+    def test_reconnecting_clients_get_the_events_they_missed(self):
+        first = self.record(self.citizen, RequestEvent.Kind.CREATED)
+        neighbours = self.record(self.neighbour, RequestEvent.Kind.CREATED)
+        missed = self.record(self.citizen)
+
+        body = self.stream(self.citizen, first.pk)
+        self.assertTrue(body.startswith("retry: "))
+        self.assertIn(events.encode(missed), body)
+        self.assertNotIn(f"id: {first.pk}\n", body)
+        self.assertNotIn(f"id: {neighbours.pk}\n", body)
+        self.assertIn(events.encode(neighbours), self.stream(self.officer, first.pk))
+        self.assertIn(events.RESET, self.stream(self.citizen, missed.pk + 100))
+        with override_settings(EVENTS={**settings.EVENTS, "replay_limit": 1}):
+            self.assertIn(events.RESET, self.stream(self.officer, first.pk))
+
+    def test_wsgi_streams_are_capped_per_worker(self):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.citizen)}"}
+        with override_settings(EVENTS={**settings.EVENTS, "wsgi_streams": 0}):
+            response = APIClient(REMOTE_ADDR=next(_client_ips)).get("/api/events/", headers=headers)
+        self.assertEqual(response.status_code, 503)
+
+        held = events.wsgi_streams.hold(chunk for chunk in ())
+        self.addCleanup(held.close)
+        response = APIClient(REMOTE_ADDR=next(_client_ips)).get("/api/events/", headers=headers)
+        self.assertEqual(response.status_code, 503)
+        held.close()
+        response = APIClient(REMOTE_ADDR=next(_client_ips)).get("/api/events/", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        b"".join(response.streaming_content)
+        # Closing the response gave the slot back.
+        self.assertEqual(events.wsgi_streams.open, 0)
+
+    def test_workers_without_streams_forget_old_event_ids(self):
+        old = RequestEvent.objects.create(
+            kind=RequestEvent.Kind.CREATED,
+            request_id=self.requests[self.citizen].pk,
+            citizen_id=self.citizen.pk,
+            status=VerificationRequest.Status.PENDING,
+        )
+        old.created_at -= timedelta(minutes=1)
+        self.broadcaster.publish([old])
+        # Nothing polls in a worker without streams; publishing prunes ids the feed could not repeat.
+        recent = self.record(self.neighbour)
+        self.assertEqual(list(self.broadcaster.seen), [recent.pk])
+
+    def test_asgi_streams_wait_on_the_event_loop(self):
+        first = self.record(self.citizen, RequestEvent.Kind.CREATED)
+        missed = self.record(self.citizen)
+        self.assertEqual(self.stream(self.citizen, first.pk, asgi=True), self.stream(self.citizen, first.pk))
+
+        async def receive():
+            subscription = self.broadcaster.subscribe(events.AsyncSubscription(self.officer))
+            try:
+                # Publishing happens on whichever thread committed the event.
+                await sync_to_async(self.broadcaster.publish, thread_sensitive=False)([missed])
+                return await subscription.get(1)
+            finally:
+                self.broadcaster.unsubscribe(subscription)
+
+        self.broadcaster.seen.clear()
+        self.assertEqual(async_to_sync(receive)(), missed)
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """The smallest SMTP server Django's SMTP backend will talk to; keeps each message's recipients and data."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPSinkHandler)
+        self.messages = []
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 sink")
+        recipients = []
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command.startswith("DATA"):
+                self.reply("354 go ahead")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                self.server.messages.append((recipients, data.decode()))
+                recipients = []
+                self.reply("250 queued")
+            elif command.startswith("RCPT"):
+                recipients.append(line.decode().split(":", 1)[1].strip().strip("<>"))
+                self.reply("250 ok")
+            elif command.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@override_settings(NOTIFICATIONS={**settings.NOTIFICATIONS, "rates": {}})
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        CitizenProfile.objects.create(user=self.citizen, phone="0700000000", gender="F", age=30, address="Mtaa 1")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        self.req = VerificationRequest.objects.create(
+            citizen=self.citizen, request_type=VerificationRequest.RequestType.NIDA, purpose="Bank account"
+        )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.officer)
+        sms.LocmemBackend.outbox = []
+
+    def decide(self, action, **data):
+        response = self.client.post(f"/api/requests/{self.req.pk}/{action}/", data, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_decisions_are_queued_with_the_status_change(self):
+        self.decide("reject", reason="Photo is unclear.")
+        outbox = Notification.objects.order_by("channel")
+        self.assertEqual([(row.channel, row.recipient) for row in outbox], [("email", "citizen@example.com"), ("sms", "0700000000")])
+        self.assertIn("rejected: Photo is unclear.", outbox[1].body)
+        self.assertEqual(mail.outbox, [])
+
+        with mock.patch("core.notifications.enqueue", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.post(f"/api/requests/{self.req.pk}/reopen/")
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.status, VerificationRequest.Status.REJECTED)
+
+    def test_dispatcher_sends_each_message_once(self):
+        self.decide("approve")
+        counts = notifications.Dispatcher().dispatch_batch()
+        self.assertEqual(counts["sent"], 2)
+        self.assertEqual([message.to for message in mail.outbox], [["citizen@example.com"]])
+        self.assertEqual([message["to"] for message in sms.LocmemBackend.outbox], ["0700000000"])
+        self.assertEqual(set(Notification.objects.values_list("state", flat=True)), {Notification.State.SENT})
+        self.assertFalse(any(notifications.Dispatcher().dispatch_batch().values()))
+
+    def test_only_the_latest_status_is_sent(self):
+        self.decide("approve")
+        self.decide("reopen")
+        counts = notifications.Dispatcher().dispatch_batch()
+        self.assertEqual((counts["sent"], counts["superseded"]), (2, 2))
+        self.assertIn("pending review", mail.outbox[0].body)
+
+    def test_failures_back_off_then_give_up(self):
+        self.decide("approve")
+        with mock.patch.object(sms.LocmemBackend, "send", side_effect=sms.SMSError("gateway down")):
+            counts = notifications.Dispatcher().dispatch_batch()
+            self.assertEqual((counts["sent"], counts["retried"]), (1, 1))
+            row = Notification.objects.get(channel=Notification.Channel.SMS)
+            self.assertEqual((row.attempts, row.last_error), (1, "SMSError: gateway down"))
+            self.assertFalse(any(notifications.Dispatcher().dispatch_batch().values()))
+
+            Notification.objects.filter(pk=row.pk).update(next_attempt_at=row.created_at)
+            with override_settings(NOTIFICATIONS={**settings.NOTIFICATIONS, "max_attempts": 2}):
+                self.assertEqual(notifications.Dispatcher().dispatch_batch()["failed"], 1)
+        self.assertEqual(Notification.objects.get(pk=row.pk).state, Notification.State.FAILED)
+        self.assertLessEqual(notifications.backoff(20).total_seconds(), settings.NOTIFICATIONS["max_backoff_seconds"])
+
+    def test_sends_are_paced_per_channel(self):
+        self.decide("approve")
+        store = mock.Mock()
+        store.consume.side_effect = [(False, 0.25), (True, 0.0), (True, 0.0)]
+        rates = {"email": "1/s", "sms": "1/s"}
+        with override_settings(NOTIFICATIONS={**settings.NOTIFICATIONS, "rates": rates}):
+            with mock.patch("core.notifications.get_bucket_store", return_value=store), mock.patch(
+                "core.notifications.time.sleep"
+            ) as sleep:
+                notifications.Dispatcher().dispatch_batch()
+        sleep.assert_called_once_with(0.25)
+        self.assertEqual(
+            [call.args[0] for call in store.consume.call_args_list],
+            ["notifications:email", "notifications:email", "notifications:sms"],
+        )
+
+    def test_email_goes_through_smtp(self):
+        self.decide("approve")
+        sink = SMTPSink()
+        self.addCleanup(sink.server_close)
+        self.addCleanup(sink.shutdown)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        smtp = {"EMAIL_BACKEND": "django.core.mail.backends.smtp.EmailBackend", "EMAIL_PORT": sink.server_address[1]}
+        with override_settings(EMAIL_HOST="127.0.0.1", **smtp):
+            call_command("dispatch_notifications", "--once", stdout=io.StringIO())
+        [(recipients, data)] = sink.messages
+        self.assertEqual(recipients, ["citizen@example.com"])
+        self.assertIn("request #%d was approved" % self.req.pk, data)
+
+
+@override_settings(JOBS={**settings.JOBS, "recurring": {}})
+class JobTests(TestCase):
+    def setUp(self):
+        self.ran = []
+        registry = mock.patch.dict(jobs.REGISTRY, {"test.record": self.record, "test.fail": self.fail_job})
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def record(self, value):
+        self.ran.append(value)
+
+    def fail_job(self, value):
+        raise ValueError(value)
+
+    def test_due_jobs_run_by_priority(self):
+        jobs.enqueue("test.record", value="normal")
+        jobs.enqueue("test.record", value="urgent", priority=5)
+        jobs.enqueue("test.record", value="later", priority=9, delay=timedelta(hours=1))
+        self.assertEqual(jobs.Worker("test").work(burst=True), 2)
+        self.assertEqual(self.ran, ["urgent", "normal"])
+        self.assertEqual(Job.objects.filter(state=Job.State.DONE).count(), 2)
+
+    def test_failed_jobs_are_retried_then_dead_lettered(self):
+        job = jobs.enqueue("test.fail", value="boom")
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+        with self.assertLogs("core.jobs", "WARNING"):
+            self.assertFalse(jobs.run(jobs.claim("test")))
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts, job.last_error), (Job.State.QUEUED, 1, "ValueError: boom"))
+        self.assertIsNone(jobs.claim("test"))
+
+        Job.objects.filter(pk=job.pk).update(run_at=job.created_at)
+        with self.assertLogs("core.jobs", "ERROR"):
+            jobs.run(jobs.claim("test"))
+        self.assertEqual(Job.objects.get(pk=job.pk).state, Job.State.DEAD)
+
+        # A job whose task no longer exists is not retried.
+        unknown = jobs.enqueue("test.removed")
+        with self.assertLogs("core.jobs", "ERROR"):
+            jobs.run(jobs.claim("test"))
+        self.assertEqual(Job.objects.get(pk=unknown.pk).state, Job.State.DEAD)
+
+    def test_expired_claims_are_run_again(self):
+        job = jobs.enqueue("test.record", value="slow")
+        stuck = jobs.claim("stuck")
+        Job.objects.filter(pk=job.pk).update(run_at=job.created_at)
+        jobs.requeue_expired()
+        retried = jobs.claim("healthy")
+        self.assertEqual((retried.pk, retried.attempts), (job.pk, 2))
+        # The first worker finishing late cannot overwrite the second claim.
+        jobs.run(stuck)
+        self.assertEqual(Job.objects.get(pk=job.pk).locked_by, "healthy")
+        self.assertEqual(Job.objects.get(pk=job.pk).state, Job.State.RUNNING)
+        self.assertTrue(jobs.run(retried))
+        self.assertEqual(Job.objects.get(pk=job.pk).state, Job.State.DONE)
+
+        Job.objects.filter(pk=job.pk).update(state=Job.State.RUNNING, run_at=job.created_at, attempts=5)
+        jobs.requeue_expired()
+        self.assertEqual(Job.objects.get(pk=job.pk).state, Job.State.DEAD)
+
+    def test_recurring_jobs_are_queued_once_per_period(self):
+        with override_settings(JOBS={**settings.JOBS, "recurring": {"test.record": timedelta(hours=1)}}):
+            jobs.schedule_recurring()
+            jobs.schedule_recurring()
+            self.assertEqual(Job.objects.count(), 1)
+            jobs.schedule_recurring(timezone.now() + timedelta(hours=1))
+            self.assertEqual(Job.objects.count(), 2)
+
+    def test_approved_letters_are_prerendered(self):
+        citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        req = VerificationRequest.objects.create(
+            citizen=citizen, request_type=VerificationRequest.RequestType.NIDA, purpose="Bank account"
+        )
+        client = APIClient(REMOTE_ADDR=next(_client_ips))
+        client.force_authenticate(officer)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f"/api/requests/{req.pk}/approve/")
+        self.assertEqual(list(Job.objects.values_list("name", "kwargs")), [("letters.prerender", {"request_id": req.pk})])
+
+        call_command("run_workers", "--processes", "1", "--burst", stdout=io.StringIO())
+        with mock.patch("core.api.render_letter") as render:
+            response = client.get(f"/api/requests/{req.pk}/download/")
+        render.assert_not_called()
+        self.assertTrue(response.content.startswith(b"%PDF"))
+
+
+class BackgroundProcessTests(SimpleTestCase):
+    def test_exited_processes_are_restarted_and_all_stopped_on_exit(self):
+        exits = (sys.executable, "-c", "pass")
+        runs = (sys.executable, "-c", "import time; time.sleep(60)")
+        supervisor = background.Supervisor([exits, runs], interval=0.05)
+        supervisor.start()
+        first = supervisor.processes[exits]
+        deadline = time.monotonic() + 10
+        with self.assertLogs("core.background", "WARNING"):
+            while supervisor.processes[exits] is first and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self.assertIsNot(supervisor.processes[exits], first)
+
+        running = supervisor.processes[runs]
+        supervisor.stop(timeout=5)
+        self.assertIsNotNone(running.poll())
+        time.sleep(0.2)
+        # Nothing is restarted after stop().
+        self.assertIs(supervisor.processes[runs], running)
+
+
+class AttachmentTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix="mtaa-connect-attachments-")
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        overrides = override_settings(
+            ATTACHMENTS={**settings.ATTACHMENTS, "root": root}, JOBS={**settings.JOBS, "recurring": {}}
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.root = root
+        self.citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha Citizen")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        self.req = VerificationRequest.objects.create(
+            citizen=self.citizen, request_type=VerificationRequest.RequestType.RESIDENCE, purpose="Bank account"
+        )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.citizen)
+        self.pdf = b"%PDF-1.4\n" + bytes(range(256)) * 400
+
+    def upload(self, req, content, name="scan.pdf"):
+        return self.client.post(
+            f"/api/requests/{req.pk}/attachments/", {"file": SimpleUploadedFile(name, content)}, format="multipart"
+        )
+
+    def stored_files(self):
+        return list((Path(self.root) / "blobs").glob("*/*"))
+
+    def test_same_document_is_stored_once(self):
+        first = self.upload(self.req, self.pdf)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.data["content_type"], "application/pdf")
+        self.assertEqual(first.data["size"], len(self.pdf))
+
+        again = self.upload(self.req, self.pdf, name="copy.pdf")
+        self.assertEqual((again.status_code, again.data["id"]), (200, first.data["id"]))
+
+        other = VerificationRequest.objects.create(
+            citizen=self.citizen, request_type=VerificationRequest.RequestType.LICENSE, purpose="Driving"
+        )
+        self.assertEqual(self.upload(other, self.pdf).status_code, 201)
+        self.assertEqual(Attachment.objects.count(), 2)
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(list((Path(self.root) / "tmp").iterdir()), [])
+
+        listed = self.client.get(f"/api/requests/{self.req.pk}/attachments/")
+        self.assertEqual([item["filename"] for item in listed.data], ["scan.pdf"])
+
+    def test_oversized_and_unknown_files_are_refused(self):
+        with override_settings(ATTACHMENTS={**settings.ATTACHMENTS, "max_bytes": 1000}):
+            # Refused from Content-Length alone...
+            self.assertEqual(self.upload(self.req, self.pdf).status_code, 413)
+            # ...or once the parsed file passes the limit.
+            self.assertEqual(self.upload(self.req, self.pdf[:5000]).status_code, 413)
+        refused = self.upload(self.req, b"MZ\x90\x00 not a document", name="scan.pdf")
+        self.assertEqual(refused.status_code, 415)
+        self.assertEqual(self.upload(self.req, b"").status_code, 400)
+        self.assertFalse(Attachment.objects.exists())
+        self.assertEqual(list((Path(self.root) / "tmp").iterdir()), [])
+
+    def test_downloads_support_etags_and_ranges(self):
+        attachment_id = self.upload(self.req, self.pdf).data["id"]
+        url = f"/api/requests/{self.req.pk}/attachments/{attachment_id}/"
+        officer = APIClient(REMOTE_ADDR=next(_client_ips))
+        officer.force_authenticate(self.officer)
+
+        full = officer.get(url)
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(b"".join(full.streaming_content), self.pdf)
+        self.assertEqual(full["Accept-Ranges"], "bytes")
+        self.assertIn('filename="scan.pdf"', full["Content-Disposition"])
+        etag = full["ETag"]
+
+        self.assertEqual(officer.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        part = officer.get(url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(part["Content-Range"], f"bytes 100-199/{len(self.pdf)}")
+        self.assertEqual(b"".join(part.streaming_content), self.pdf[100:200])
+        tail = officer.get(url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(tail.streaming_content), self.pdf[-10:])
+        # A range for an older version of the file gets the whole current file.
+        self.assertEqual(officer.get(url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(officer.get(url, HTTP_RANGE=f"bytes={len(self.pdf)}-").status_code, 416)
+
+        stranger = User.objects.create_user("other@example.com", "password123", full_name="Other Citizen")
+        other = APIClient(REMOTE_ADDR=next(_client_ips))
+        other.force_authenticate(stranger)
+        self.assertEqual(other.get(url).status_code, 403)
+        self.assertEqual(self.upload(self.req, self.pdf).status_code, 200)
+        self.client = other
+        self.assertEqual(self.upload(self.req, self.pdf).status_code, 404)
+
+    def test_images_get_thumbnails_in_the_background(self):
+        image = io.BytesIO()
+        Image.new("RGB", (1200, 900), "navy").save(image, "PNG")
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.upload(self.req, image.getvalue(), name="id.png")
+        self.assertEqual(created.data["content_type"], "image/png")
+        self.assertFalse(created.data["thumbnail"])
+        url = f"/api/requests/{self.req.pk}/attachments/{created.data['id']}/thumbnail/"
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        jobs.Worker("test").work(burst=True)
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        with Image.open(io.BytesIO(b"".join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 240))
+
+    def test_only_undecodable_images_skip_their_thumbnail(self):
+        image = io.BytesIO()
+        Image.new("RGB", (1200, 900), "navy").save(image, "PNG")
+        sha256 = self.upload(self.req, image.getvalue()[:200], name="id.png").data["sha256"]
+        with self.assertLogs("core.attachments", "WARNING"):
+            attachments.make_thumbnail(sha256)
+        self.assertFalse(attachments.thumbnail_path(sha256).exists())
+
+        # A file that cannot be read fails the job, which is retried.
+        with self.assertRaises(FileNotFoundError):
+            attachments.make_thumbnail("0" * 64)
+
+    def test_limit_is_checked_again_under_the_request_lock(self):
+        receive = attachments.AttachmentUploadHandler.file_complete
+
+        def concurrent_upload_finishes(handler, file_size):
+            # Another upload to the same request is stored while this one's body is still arriving.
+            Attachment.objects.create(
+                request=self.req, sha256="f" * 64, filename="other.pdf", content_type="application/pdf", size=1
+            )
+            return receive(handler, file_size)
+
+        with override_settings(ATTACHMENTS={**settings.ATTACHMENTS, "max_per_request": 1}):
+            with mock.patch.object(attachments.AttachmentUploadHandler, "file_complete", concurrent_upload_finishes):
+                response = self.upload(self.req, self.pdf)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Attachment.objects.filter(request=self.req).count(), 1)
+
+    def test_removed_attachments_free_their_files(self):
+        attachment_id = self.upload(self.req, self.pdf).data["id"]
+        url = f"/api/requests/{self.req.pk}/attachments/{attachment_id}/"
+        self.req.status = VerificationRequest.Status.APPROVED
+        self.req.save()
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.req.status = VerificationRequest.Status.REJECTED
+        self.req.save()
+        self.assertEqual(self.client.delete(url).status_code, 204)
+
+        (blob,) = self.stored_files()
+        self.assertEqual(attachments.purge_orphans(), 0)
+        os.utime(blob, (0, 0))
+        self.assertEqual(attachments.purge_orphans(), 1)
+        self.assertEqual(self.stored_files(), [])
+
+
+class LetterVerificationTests(TestCase):
+    def setUp(self):
+        revocations = mock.patch.object(verification, "revocations", verification.Revocations())
+        revocations.start()
+        self.addCleanup(revocations.stop)
+        citizen = User.objects.create_user("citizen@example.com", "password123", full_name="Asha  Citizen")
+        self.officer = User.objects.create_user(
+            "officer@example.com", "password123", full_name="Juma Officer", role=User.Role.OFFICER
+        )
+        self.req = VerificationRequest.objects.create(
+            citizen=citizen, request_type=VerificationRequest.RequestType.RESIDENCE, purpose="Bank account"
+        )
+        self.client = APIClient(REMOTE_ADDR=next(_client_ips))
+        self.client.force_authenticate(self.officer)
+
+    def approve(self) -> str:
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/requests/{self.req.pk}/approve/")
+        self.req.refresh_from_db()
+        return verification.issue(self.req)
+
+    def check(self, token, **params):
+        return APIClient(REMOTE_ADDR=next(_client_ips)).get(f"/verify/{token}", params)
+
+    def test_signed_letters_verify_without_request_lookups(self):
+        token = self.approve()
+        self.assertEqual(len(token), 56)
+        self.check(token)  # Loads this worker's revocation filter.
+        with self.assertNumQueries(0):
+            response = self.check(token, name="asha citizen")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.data[key] for key in ("valid", "revoked", "request_id", "request_type", "name_matches")},
+            {"valid": True, "revoked": False, "request_id": self.req.pk, "request_type": "residence", "name_matches": True},
+        )
+        self.assertEqual(response.data["decided_on"], self.req.decided_at.date())
+        self.assertFalse(self.check(token, name="Someone Else").data["name_matches"])
+
+        forged = token[:20] + ("A" if token[20] != "A" else "B") + token[21:]
+        self.assertEqual(self.check(forged).status_code, 404)
+        self.assertEqual(self.check("not-a-token").status_code, 404)
+
+    def test_retired_keys_still_verify(self):
+        token = self.approve()
+        with override_settings(LETTER_SIGNING_KEY="rotated", LETTER_SIGNING_FALLBACK_KEYS=[settings.LETTER_SIGNING_KEY]):
+            self.assertTrue(self.check(token, name="Asha Citizen").data["name_matches"])
+            self.assertNotEqual(verification.issue(self.req), token)
+        with override_settings(LETTER_SIGNING_KEY="rotated"):
+            self.assertEqual(self.check(token).status_code, 404)
+
+    def test_undone_approvals_revoke_their_letters(self):
+        first = self.approve()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/requests/{self.req.pk}/reopen/")
+        self.assertTrue(self.check(first).data["revoked"])
+
+        second = self.approve()
+        self.assertNotEqual(second, first)
+        self.assertTrue(self.check(second).data["valid"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/requests/{self.req.pk}/reject/", {"reason": "Forged stamp."})
+        self.assertFalse(self.check(second).data["valid"])
+
+        # Another worker learns of revocations from the table.
+        other = verification.Revocations()
+        other.refresh()
+        self.assertTrue(other.is_revoked(verification.verify(first)))
+        self.assertEqual(RevokedLetter.objects.count(), 2)
+
+    def test_filter_hits_are_confirmed(self):
+        token = self.approve()
+        letter = verification.verify(token)
+        self.assertFalse(verification.revocations.is_revoked(letter))
+        # A false positive: the filter says revoked, the table does not.
+        verification.revocations.add(verification.revocation_key(letter.request_id, letter.decided_at))
+        with self.assertNumQueries(1):
+            self.assertFalse(verification.revocations.is_revoked(letter))
+
+        self.req.delete()
+        self.assertTrue(verification.revocations.is_revoked(letter))
+
+    def test_rows_committed_out_of_id_order_are_picked_up(self):
+        revocations = verification.Revocations()
+        RevokedLetter.objects.create(pk=10, request_id=1, decided_at=1)
+        revocations.refresh()
+        # Another worker's insert took a lower id but committed after this refresh.
+        RevokedLetter.objects.create(pk=5, request_id=2, decided_at=1)
+        revocations.refresh()
+        revocations.refresh()
+        self.assertIn(verification.revocation_key(2, 1), revocations.filter)
+        # Rows re-read from the look-back window are only added once.
+        self.assertEqual(revocations.filter.count, 2)
+
+    def test_bloom_filter_grows_past_its_capacity(self):
+        with override_settings(LETTER_VERIFICATION={**settings.LETTER_VERIFICATION, "bloom_capacity": 10}):
+            RevokedLetter.objects.bulk_create([RevokedLetter(request_id=pk, decided_at=1) for pk in range(8)])
+            revocations = verification.Revocations()
+            revocations.refresh()
+            RevokedLetter.objects.bulk_create([RevokedLetter(request_id=pk, decided_at=1) for pk in range(8, 30)])
+            revocations.refresh()
+        self.assertGreaterEqual(revocations.filter.capacity, 30)
+        self.assertTrue(all(verification.revocation_key(pk, 1) in revocations.filter for pk in range(30)))
@@ -0,0 +1,122 @@
+"""
+Token-bucket throttles shared by all gunicorn workers on an instance.
+
+Limits are configured per route name from ``core/urls.py`` in
+``settings.RATE_LIMITS``; the ``"default"`` entry applies to routes that are
+not listed. Authenticated callers are limited per user and every caller per
+client IP. Buckets live in a :class:`~core.sharedstate.SharedSlots` table, so
+a client cannot multiply its allowance by landing on different workers.
+"""
+
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .sharedstate import SharedSlots, key_hash
+
+_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: str | None) -> tuple[float, float] | None:
+    """Turn ``"30/min"`` into ``(capacity, tokens_per_second)``."""
+    if not rate:
+        return None
+    num, period = rate.split("/")
+    capacity = float(num)
+    return capacity, capacity / _PERIODS[period.strip()[0]]
+
+
+class TokenBucketStore:
+    # key hash, tokens left, last refill timestamp
+    RECORD_FORMAT = "<Qdd"
+
+    def __init__(self, slots: int):
+        self.slots = SharedSlots("ratelimit", self.RECORD_FORMAT, slots)
+
+    def consume(self, key: str, capacity: float, refill_rate: float) -> tuple[bool, float]:
+        """
+        Take one token from the bucket for ``key``.
+
+        Returns ``(allowed, wait)`` where ``wait`` is the number of seconds
+        until a token becomes available. Buckets are direct-mapped; when two
+        keys collide the newcomer starts with a full bucket, which errs on the
+        side of letting traffic through.
+        """
+        hashed = key_hash(key)
+        index = hashed % self.slots.slots
+        now = time.time()
+        self.slots.lock(index)
+        try:
+            owner, tokens, updated = self.slots.read(index)
+            if owner != hashed:
+                tokens = capacity
+            else:
+                tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            if tokens >= 1:
+                self.slots.write(index, hashed, tokens - 1, now)
+                return True, 0.0
+            self.slots.write(index, hashed, tokens, now)
+        finally:
+            self.slots.unlock(index)
+        return False, (1 - tokens) / refill_rate
+
+
+_store = None
+
+
+def get_bucket_store() -> TokenBucketStore:
+    global _store
+    if _store is None:
+        _store = TokenBucketStore(settings.RATE_LIMIT_SLOTS)
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = ""
+
+    def get_rate(self, route: str | None) -> str | None:
+        limits = settings.RATE_LIMITS
+        route_limits = limits.get(route) or {}
+        if self.scope in route_limits:
+            return route_limits[self.scope]
+        return limits.get("default", {}).get(self.scope)
+
+    def get_ident_key(self, request) -> str | None:
+        raise NotImplementedError(".get_ident_key() must be overridden")
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        match = request.resolver_match
+        route = match.url_name if match else None
+        rate = parse_rate(self.get_rate(route))
+        if rate is None:
+            return True
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+
+        capacity, refill_rate = rate
+        allowed, wait = get_bucket_store().consume(f"{self.scope}:{ident}:{route}", capacity, refill_rate)
+        if not allowed:
+            self.wait_seconds = wait
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    scope = "user"
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return str(request.user.pk)
+        return None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    scope = "ip"
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
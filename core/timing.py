@@ -0,0 +1,68 @@
+"""
+Per-request timings for :class:`core.middleware.ServerTimingMiddleware`.
+
+A sampled request gets a :class:`RequestTimings` in ``current_timings``; it
+counts SQL queries and their time through a database execute wrapper, and
+code wraps expensive phases in :func:`span` (``serialize``, ``pdf``). Outside
+a sampled request ``span`` costs one context variable lookup.
+"""
+
+import contextvars
+import heapq
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+current_timings = contextvars.ContextVar("request_timings", default=None)
+
+SLOW_SQL_KEPT = 3
+SQL_PREVIEW_CHARS = 300
+
+
+class RequestTimings:
+    def __init__(self, keep_sql: bool = False):
+        self.started = time.perf_counter()
+        self.spans = defaultdict(float)
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.keep_sql = keep_sql
+        # Min-heap of (seconds, sequence, sql) holding the slowest statements.
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_seconds += elapsed
+            if self.keep_sql:
+                entry = (elapsed, self.queries, sql[:SQL_PREVIEW_CHARS])
+                if len(self.slowest) < SLOW_SQL_KEPT:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def slow_queries(self) -> list[dict]:
+        return [
+            {"ms": round(elapsed * 1000, 2), "sql": sql}
+            for elapsed, _, sql in sorted(self.slowest, reverse=True)
+        ]
+
+
+@contextmanager
+def span(name: str):
+    """Add the time spent in the block to the current request's ``name`` timing."""
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.spans[name] += time.perf_counter() - started
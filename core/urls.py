@@ -20,9 +20,23 @@ urlpatterns = [
     path("requests/<int:pk>/", api.RequestDetail.as_view(), name="request-detail"),
     path("requests/<int:pk>/resubmit/", api.ResubmitRequest.as_view(), name="request-resubmit"),
     path("requests/<int:pk>/download/", api.RequestDownloadView.as_view(), name="request-download"),
+    path("requests/<int:pk>/attachments/", api.RequestAttachmentList.as_view(), name="request-attachments"),
+    path(
+        "requests/<int:pk>/attachments/<int:attachment_id>/",
+        api.RequestAttachmentDetail.as_view(),
+        name="request-attachment",
+    ),
+    path(
+        "requests/<int:pk>/attachments/<int:attachment_id>/thumbnail/",
+        api.RequestAttachmentThumbnail.as_view(),
+        name="request-attachment-thumbnail",
+    ),
     path("requests/<int:pk>/approve/", api.ApproveRequest.as_view(), name="request-approve"),
     path("requests/<int:pk>/reject/", api.RejectRequest.as_view(), name="request-reject"),
     path("requests/<int:pk>/reopen/", api.ReopenRequest.as_view(), name="request-reopen"),
+    path("batch/", api.BatchView.as_view(), name="batch"),
+    path("sync/", api.SyncView.as_view(), name="sync"),
+    path("events/", api.EventStreamView.as_view(), name="events"),
     path("citizens/", api.CitizenList.as_view(), name="citizens"),
     path("citizens/<int:pk>/", api.CitizenDetailView.as_view(), name="citizen-detail"),
     path("stats/officer/", api.OfficerStatsView.as_view(), name="officer-stats"),
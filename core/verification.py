@@ -0,0 +1,254 @@
+"""
+Signed tokens printed on issued letters, checked by ``/verify/<token>``.
+
+A token is 42 bytes, base64url-encoded into 56 characters: a version byte,
+the request id, its type, the decision time (Unix microseconds), an 8-byte
+keyed hash of the citizen's name and a 16-byte HMAC-SHA256 of all that under
+``LETTER_SIGNING_KEY``. Checking one needs no database: the signature proves
+we issued the letter, and revocation is looked up in :data:`revocations`, a
+per-process bloom filter of decisions undone since (the request was reopened,
+rejected after approval or deleted). Only a hit, a revoked letter or a rare
+false positive, is confirmed against the small ``RevokedLetter`` table, never
+against ``VerificationRequest``.
+
+Each worker loads that table on its first verification and then picks up new
+rows every ``LETTER_VERIFICATION["refresh_seconds"]`` on a background thread,
+so a revocation made by another worker shows there within that time. Each
+refresh re-reads rows created within ``SYNC_CLOCK_SKEW`` of the last one, as
+the event feed does, so a row committed after a higher id is not missed.
+Approving the request again issues a letter with a new decision time, and
+so a new token that is valid.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import math
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .models import RevokedLetter, VerificationRequest
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+# Version, request id, request type, decision time, name hash; then the truncated signature.
+PAYLOAD = struct.Struct(">BQBQ8s")
+SIGNATURE_BYTES = 16
+TOKEN_BYTES = PAYLOAD.size + SIGNATURE_BYTES
+TYPE_CODES = {
+    VerificationRequest.RequestType.RESIDENCE: 1,
+    VerificationRequest.RequestType.NIDA: 2,
+    VerificationRequest.RequestType.LICENSE: 3,
+}
+TYPES = {code: request_type for request_type, code in TYPE_CODES.items()}
+KEY_SALT = "core.verification"
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+@lru_cache(maxsize=4)
+def _derive_keys(secrets: tuple) -> tuple:
+    return tuple(hashlib.sha256(f"{KEY_SALT}{secret}".encode()).digest() for secret in secrets)
+
+
+def _keys() -> tuple:
+    """The signing key first, then retired keys that letters already printed may still use."""
+    return _derive_keys((settings.LETTER_SIGNING_KEY, *settings.LETTER_SIGNING_FALLBACK_KEYS))
+
+
+def _sign(key: bytes, payload: bytes) -> bytes:
+    return hmac.digest(key, payload, "sha256")[:SIGNATURE_BYTES]
+
+
+def _name_hash(key: bytes, name: str) -> bytes:
+    normalized = " ".join(name.casefold().split())
+    return hmac.digest(key, b"name:" + normalized.encode(), "sha256")[:8]
+
+
+def decision_time(req: VerificationRequest) -> int:
+    """When ``req`` was approved, in Unix microseconds: what tokens and revocations identify a letter by."""
+    return ((req.decided_at or req.updated_at) - EPOCH) // timedelta(microseconds=1)
+
+
+def revocation_key(request_id: int, decided_at: int) -> str:
+    return f"{request_id}:{decided_at}"
+
+
+@dataclass(frozen=True)
+class Letter:
+    """What a valid token says about the letter it is printed on."""
+
+    request_id: int
+    request_type: str
+    decided_at: int
+    name_hash: bytes = field(repr=False)
+    key: bytes = field(repr=False)
+
+    @property
+    def decided_on(self):
+        return (EPOCH + timedelta(microseconds=self.decided_at)).date()
+
+    def name_matches(self, name: str) -> bool:
+        return hmac.compare_digest(_name_hash(self.key, name), self.name_hash)
+
+
+def issue(req: VerificationRequest) -> str:
+    """The token for ``req``'s approved letter."""
+    key = _keys()[0]
+    payload = PAYLOAD.pack(
+        VERSION, req.pk, TYPE_CODES[req.request_type], decision_time(req), _name_hash(key, req.citizen.full_name)
+    )
+    return base64.urlsafe_b64encode(payload + _sign(key, payload)).rstrip(b"=").decode()
+
+
+def verify_url(token: str) -> str:
+    return f"{settings.LETTER_VERIFY_URL}/verify/{token}"
+
+
+def verify(token: str) -> Letter | None:
+    """The letter ``token`` was issued for, or ``None`` when it is malformed or not signed by us."""
+    if len(token) != math.ceil(TOKEN_BYTES * 4 / 3):
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    payload, signature = raw[: PAYLOAD.size], raw[PAYLOAD.size :]
+    key = next((key for key in _keys() if hmac.compare_digest(_sign(key, payload), signature)), None)
+    if key is None:
+        return None
+    version, request_id, type_code, decided_at, name_hash = PAYLOAD.unpack(payload)
+    if version != VERSION or type_code not in TYPES:
+        return None
+    return Letter(request_id, TYPES[type_code], decided_at, name_hash, key)
+
+
+def revoke(request_id: int, decided_at: int, using: str | None = None) -> None:
+    """
+    Revoke the letter issued for the approval at ``decided_at``; call in the
+    transaction that undoes it, on database ``using`` (the request's shard).
+    """
+    write = partial(_write_revocation, request_id, decided_at)
+    if (using or DEFAULT_DB_ALIAS) == DEFAULT_DB_ALIAS:
+        write()
+    else:
+        # The table lives on default: wait for the shard to commit, so a rolled-back change revokes nothing.
+        transaction.on_commit(write, using=using)
+
+
+def _write_revocation(request_id: int, decided_at: int) -> None:
+    RevokedLetter.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+        [RevokedLetter(request_id=request_id, decided_at=decided_at)], ignore_conflicts=True
+    )
+    key = revocation_key(request_id, decided_at)
+    transaction.on_commit(lambda: revocations.add(key), using=DEFAULT_DB_ALIAS)
+
+
+class BloomFilter:
+    """A bloom filter sized for ``capacity`` keys at ``error_rate``; adds take a lock, lookups do not."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, step = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + index * step) % self.size for index in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        positions = self._positions(key)
+        with self.lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class Revocations:
+    """This process's view of ``RevokedLetter``: a bloom filter kept current by a refresh thread."""
+
+    def __init__(self):
+        self.filter = None
+        self.refreshed_at = None
+        # Rows already in the filter from inside the look-back window, by id: their created_at.
+        self.seen = {}
+        self.lock = threading.Lock()
+        self.refresher = None
+
+    def refresh(self) -> None:
+        """Add rows recorded since the last refresh, rebuilding a bigger filter when this one is full."""
+        started = timezone.now()
+        with self.lock:
+            revoked = RevokedLetter.objects.using(DEFAULT_DB_ALIAS).order_by("pk").values_list(
+                "pk", "request_id", "decided_at", "created_at"
+            )
+            if self.filter is not None:
+                # Re-read a look-back window rather than ids above the last one seen: rows can commit out of
+                # id order, and one committed late would otherwise be skipped for good.
+                since = self.refreshed_at - settings.SYNC_CLOCK_SKEW
+                rows = [row for row in revoked.filter(created_at__gte=since) if row[0] not in self.seen]
+            if self.filter is None or self.filter.count + len(rows) > self.filter.capacity:
+                rows = list(revoked)
+                config = settings.LETTER_VERIFICATION
+                self.filter = BloomFilter(max(config["bloom_capacity"], 2 * len(rows)), config["bloom_error_rate"])
+                self.seen = {}
+            for pk, request_id, decided_at, created_at in rows:
+                self.filter.add(revocation_key(request_id, decided_at))
+                self.seen[pk] = created_at
+            self.refreshed_at = started
+            # Older ids cannot come back from the next refresh's look-back window.
+            horizon = started - settings.SYNC_CLOCK_SKEW
+            self.seen = {pk: created_at for pk, created_at in self.seen.items() if created_at >= horizon}
+
+    def add(self, key: str) -> None:
+        if self.filter is not None:
+            self.filter.add(key)
+
+    def is_revoked(self, letter: Letter) -> bool:
+        if self.filter is None:
+            self.refresh()
+            self._start_refresher()
+        if revocation_key(letter.request_id, letter.decided_at) not in self.filter:
+            return False
+        return (
+            RevokedLetter.objects.using(DEFAULT_DB_ALIAS)
+            .filter(request_id=letter.request_id, decided_at=letter.decided_at)
+            .exists()
+        )
+
+    def _start_refresher(self) -> None:
+        with self.lock:
+            if settings.LETTER_VERIFICATION["refresh_seconds"] and self.refresher is None:
+                self.refresher = threading.Thread(target=self._refresh_forever, name="letter-revocations", daemon=True)
+                self.refresher.start()
+
+    def _refresh_forever(self) -> None:
+        while True:
+            time.sleep(settings.LETTER_VERIFICATION["refresh_seconds"])
+            try:
+                self.refresh()
+            except DatabaseError:
+                logger.exception("Reading revoked letters failed.")
+            finally:
+                connections.close_all()
+
+
+revocations = Revocations()
@@ -1,12 +1,66 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render
 from django.utils import timezone
+from django.utils.cache import parse_etags, patch_vary_headers
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+from . import schema
+from .metrics import authorized, render as render_metrics
+from .readiness import readiness
 
 
 def health(request):
+    # Public and unauthenticated: pool stats are on the token-protected /metrics instead.
     return JsonResponse({"status": "ok"})
 
 
+def readyz(request):
+    state = readiness()
+    return JsonResponse(
+        {key: state[key] for key in ("status", "age_seconds", "probes")},
+        status=200 if state["ready"] else 503,
+    )
+
+
+def metrics(request):
+    if not authorized(request.META.get("HTTP_AUTHORIZATION", "")):
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class OpenApiSchemaView(SpectacularAPIView):
+    """``SpectacularAPIView`` serving the schema cached for the running code (``core/schema.py``)."""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if settings.OPENAPI_SCHEMA_LIVE:
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        representation = schema.get_schema()[renderer.format]
+        gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+        etag = representation.gzip_etag if gzipped else representation.etag
+
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                representation.gzipped if gzipped else representation.content,
+                content_type=renderer.media_type,
+            )
+            response["Content-Disposition"] = f'inline; filename="{settings.SPECTACULAR_SETTINGS["TITLE"]}.{renderer.format}"'
+            if gzipped:
+                response["Content-Encoding"] = "gzip"
+        response["ETag"] = etag
+        # Clients revalidate every time, so a deploy is picked up at once; an unchanged schema costs a 304.
+        response["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+        return response
+
+
 def home(request):
     base_url = request.build_absolute_uri("/")
     context = {
@@ -27,6 +81,7 @@ def api_root(request):
         {
             "health": f"{base_url}api/health/",
             "healthz": f"{base_url}healthz/",
+            "readyz": f"{base_url}readyz/",
             "auth_register": f"{base_url}api/auth/register/",
             "auth_login": f"{base_url}api/auth/login/",
             "auth_refresh": f"{base_url}api/auth/refresh/",
@@ -36,8 +91,10 @@ def api_root(request):
             "pending_requests": f"{base_url}api/requests/pending/",
             "approved_requests": f"{base_url}api/requests/approved/",
             "download_request": f"{base_url}api/requests/<id>/download/",
+            "request_attachments": f"{base_url}api/requests/<id>/attachments/",
             "reopen_request": f"{base_url}api/requests/<id>/reopen/",
             "officer_stats": f"{base_url}api/stats/officer/",
+            "sync": f"{base_url}api/sync/?since=<cursor>",
             "docs": f"{base_url}docs/",
             "redoc": f"{base_url}redoc/",
         }
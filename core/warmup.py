@@ -0,0 +1,107 @@
+"""
+Start-up work done once in the gunicorn master instead of in every worker's first requests.
+
+With ``preload_app`` (``gunicorn.conf.py``) the master imports the app and
+calls :func:`warm_up` before forking, so workers inherit the URL resolver,
+serializer field maps, JWT backend, ReportLab font metrics, templates and
+the OpenAPI schema already built, as pages shared copy-on-write. Nothing
+here touches the database: connections must not be opened before the fork.
+"""
+
+import gc
+import logging
+import time
+
+from django.contrib.auth.hashers import get_hasher
+from django.template.loader import get_template
+from django.urls import get_resolver, resolve
+from django.utils import timezone, translation
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# One path per view family, so every lazily built piece of the resolver is primed.
+WARM_PATHS = ["/", "/readyz/", "/api/", "/api/requests/", "/api/requests/1/download/", "/api/schema/"]
+
+
+def _api_views(patterns):
+    for pattern in patterns:
+        if hasattr(pattern, "url_patterns"):
+            yield from _api_views(pattern.url_patterns)
+            continue
+        view_class = getattr(pattern.callback, "view_class", None) or getattr(pattern.callback, "cls", None)
+        if view_class is not None and issubclass(view_class, APIView):
+            yield view_class
+
+
+def warm_urls() -> None:
+    resolver = get_resolver()
+    resolver.reverse_dict  # noqa: B018 - builds the reverse lookup tables
+    for path in WARM_PATHS:
+        resolve(path)
+
+
+def warm_serializers() -> None:
+    for view_class in set(_api_views(get_resolver().url_patterns)):
+        serializer_class = getattr(view_class, "serializer_class", None)
+        if serializer_class is not None:
+            # Building fields fills the model _meta caches and DRF's field mappings.
+            serializer_class().fields  # noqa: B018
+
+
+def warm_auth() -> None:
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    token = AccessToken()
+    token["user_id"] = 0
+    AccessToken(str(token))
+    get_hasher()
+
+
+def warm_letters() -> None:
+    from .letters import render_letter
+    from .models import User, VerificationRequest
+
+    citizen = User(full_name="Warm Up")
+    # Approved-looking, so the verification token and QR code are built too.
+    req = VerificationRequest(
+        id=0,
+        citizen=citizen,
+        request_type=VerificationRequest.RequestType.RESIDENCE,
+        metadata={},
+        purpose="warm-up",
+        decided_at=timezone.now(),
+    )
+    render_letter(req)
+
+
+def warm_templates() -> None:
+    get_template("core/home.html")
+    # Loads the translation catalogs used by error messages.
+    translation.gettext("This field is required.")
+
+
+def warm_schema() -> None:
+    from . import schema
+
+    schema.get_schema()
+
+
+WARMERS = [warm_urls, warm_serializers, warm_auth, warm_letters, warm_templates, warm_schema]
+
+
+def warm_up() -> dict:
+    """Run every warmer, log how long each took and return the timings in milliseconds."""
+    timings = {}
+    for warmer in WARMERS:
+        started = time.perf_counter()
+        try:
+            warmer()
+        except Exception:
+            # A failed warmer only costs the first request its time; it must not stop the deploy.
+            logger.exception("Warm-up step %s failed.", warmer.__name__)
+        timings[warmer.__name__] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Warm-up finished: %s", timings)
+    # Keep the garbage collector from touching (and so copying) everything built so far after the fork.
+    gc.freeze()
+    return timings
@@ -0,0 +1,55 @@
+"""
+Gunicorn settings, loaded with ``gunicorn -c gunicorn.conf.py``.
+
+``SERVER_MODE`` picks the application: ``wsgi`` (the default) runs
+``backend.wsgi`` in sync workers, ``asgi`` runs ``backend.asgi`` in uvicorn
+workers, where the hot read endpoints are async and an idle or waiting
+connection costs a coroutine instead of a worker.
+
+Workers, bind address and timeouts keep gunicorn's defaults (``WEB_CONCURRENCY``,
+``PORT``). The app is imported once in the master and warmed up before the
+workers are forked (``core/warmup.py``), so a new or restarted worker serves
+its first request as fast as its hundredth. Set ``GUNICORN_PRELOAD=0`` to
+import the app in each worker instead; it is then warmed up there.
+
+``BACKGROUND_PROCESSES=1`` also runs the notifier and job runner under the
+master (``core/background.py``), for hosts where the web service is the only
+one with the app's disk.
+"""
+
+import os
+
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "backend.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "backend.wsgi:application"
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+background = None
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked.
+    global background
+    if preload_app:
+        from core.warmup import warm_up
+
+        warm_up()
+    if os.getenv("BACKGROUND_PROCESSES", "0") == "1":
+        from core.background import Supervisor
+
+        background = Supervisor()
+        background.start()
+
+
+def on_exit(server):
+    if background is not None:
+        background.stop()
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        from core.warmup import warm_up
+
+        warm_up()